@@ -2,7 +2,8 @@ import os
 import sys
 import logging
 
-from flask import Flask, jsonify, render_template
+import click
+from flask import Flask, Response, jsonify, render_template, request
 
 # Tentative d'import des extensions optionnelles
 try:
@@ -25,12 +26,30 @@ except Exception:
 
 # Chargement de la configuration (avec valeurs par défaut si config.py absent)
 try:
-    from config import SECRET_KEY, SESSION_TYPE, SESSION_FILE_DIR, DB_CONFIG
+    from config import (
+        SECRET_KEY,
+        SESSION_TYPE,
+        SESSION_FILE_DIR,
+        SESSION_SQLITE_CHEMIN,
+        SESSION_BALAYAGE,
+        SESSION_BALAYAGE_LOT,
+        SESSION_BALAYAGE_INTERVALLE,
+        DB_CONFIG,
+        INSTRUMENTATION_SQL,
+        SERVER_TIMING,
+        MINUTAGE_ECHANTILLON,
+        METRIQUES,
+        METRIQUES_JETON,
+    )
 except Exception:
     # Valeurs par défaut pour un démarrage rapide en environnement de dev
     SECRET_KEY = os.environ.get("DJAAAPP_SECRET_KEY", "dev-changez-moi")
     SESSION_TYPE = "filesystem"
     SESSION_FILE_DIR = os.path.join(os.path.dirname(__file__), ".sessions")
+    SESSION_SQLITE_CHEMIN = os.path.join(SESSION_FILE_DIR, "sessions.sqlite3")
+    SESSION_BALAYAGE = os.environ.get("DJAAAPP_SESSION_BALAYAGE", "requetes")
+    SESSION_BALAYAGE_LOT = int(os.environ.get("DJAAAPP_SESSION_BALAYAGE_LOT", "200"))
+    SESSION_BALAYAGE_INTERVALLE = float(os.environ.get("DJAAAPP_SESSION_BALAYAGE_INTERVALLE", "60"))
     DB_CONFIG = {
         "host": os.environ.get("DJAAAPP_DB_HOST", "127.0.0.1"),
         "user": os.environ.get("DJAAAPP_DB_USER", "root"),
@@ -39,6 +58,58 @@ except Exception:
         "port": int(os.environ.get("DJAAAPP_DB_PORT", "3306")),
         "autocommit": True,
     }
+    INSTRUMENTATION_SQL = os.environ.get("DJAAAPP_INSTRUMENTATION_SQL", "0") == "1"
+    SERVER_TIMING = os.environ.get("DJAAAPP_SERVER_TIMING", "0") == "1"
+    MINUTAGE_ECHANTILLON = float(os.environ.get("DJAAAPP_MINUTAGE_ECHANTILLON", "0"))
+    METRIQUES = os.environ.get("DJAAAPP_METRIQUES", "1") == "1"
+    METRIQUES_JETON = os.environ.get("DJAAAPP_METRIQUES_JETON", "")
+
+# Pool de connexions partagé par les contrôleurs (nécessite mysql-connector-python)
+try:
+    from models.bdd import (
+        obtenir_pool,
+        liberer_connexion_requete,
+        parametres_connexion,
+        statistiques_routage,
+    )
+except Exception:
+    obtenir_pool = None
+    parametres_connexion = None
+    liberer_connexion_requete = None
+    statistiques_routage = None
+
+# Sessions MySQL / SQLite (SESSION_TYPE "mysql" ou "sqlite")
+try:
+    from utilitaires.sessions import (
+        StockageSessionsFichiers,
+        activer_balayage_sessions,
+        creer_interface_sessions,
+        statistiques_balayage,
+    )
+except Exception:
+    StockageSessionsFichiers = None
+    activer_balayage_sessions = None
+    creer_interface_sessions = None
+    statistiques_balayage = None
+
+# Instrumentation SQL par requête (optionnelle, voir INSTRUMENTATION_SQL)
+try:
+    from utilitaires.instrumentation import instrumenter_sql
+except Exception:
+    instrumenter_sql = None
+
+# Minutage des phases (BDD, templates, appels externes) pour Server-Timing
+try:
+    from utilitaires.minutage import activer_minutage
+except Exception:
+    activer_minutage = None
+
+# Métriques Prometheus (/metrics)
+try:
+    from utilitaires.metriques import activer_metriques, generer_metriques
+except Exception:
+    activer_metriques = None
+    generer_metriques = None
 
 # Couleurs (peuvent être exposées aux templates plus tard)
 COULEURS = {
@@ -63,7 +134,7 @@ def creer_application():
     # Configuration de base
     app.config["SECRET_KEY"] = SECRET_KEY
 
-    # Sessions côté serveur (filesystem pour simplicité)
+    # Sessions côté serveur (filesystem par défaut, MySQL ou SQLite via SESSION_TYPE)
     try:
         os.makedirs(SESSION_FILE_DIR, exist_ok=True)
     except Exception:
@@ -71,17 +142,48 @@ def creer_application():
     app.config["SESSION_TYPE"] = SESSION_TYPE
     app.config["SESSION_FILE_DIR"] = SESSION_FILE_DIR
 
-    if Session is not None:
+    if SESSION_TYPE in ("mysql", "sqlite") and creer_interface_sessions is not None:
+        app.session_interface = creer_interface_sessions(SESSION_TYPE, SESSION_SQLITE_CHEMIN)
+    elif Session is not None:
         Session(app)
     else:
         app.logger.warning("Flask-Session non disponible (pip install Flask-Session)")
 
+    # Purge incrémentale des sessions expirées (DJAAAPP_SESSION_BALAYAGE)
+    if SESSION_BALAYAGE and activer_balayage_sessions is not None:
+        stockage = getattr(app.session_interface, "stockage", None)
+        if stockage is None and SESSION_TYPE == "filesystem":
+            stockage = StockageSessionsFichiers(
+                SESSION_FILE_DIR, seuil=app.config.get("SESSION_FILE_THRESHOLD", 500)
+            )
+        if stockage is not None:
+            activer_balayage_sessions(
+                app, stockage, mode=SESSION_BALAYAGE,
+                taille_lot=SESSION_BALAYAGE_LOT, intervalle=SESSION_BALAYAGE_INTERVALLE,
+            )
+
     # Compression GZIP
     if Compress is not None:
         Compress(app)
     else:
         app.logger.warning("Flask-Compress non disponible (pip install Flask-Compress)")
 
+    # Rendre au pool la connexion BDD tenue pendant la requête
+    if liberer_connexion_requete is not None:
+        app.teardown_appcontext(liberer_connexion_requete)
+
+    # Mesures SQL par requête: résumé, requêtes lentes, N+1 (DJAAAPP_INSTRUMENTATION_SQL=1)
+    if INSTRUMENTATION_SQL and instrumenter_sql is not None:
+        instrumenter_sql(app)
+
+    # En-tête Server-Timing et journal échantillonné (DJAAAPP_SERVER_TIMING, DJAAAPP_MINUTAGE_ECHANTILLON)
+    if (SERVER_TIMING or MINUTAGE_ECHANTILLON) and activer_minutage is not None:
+        activer_minutage(app, en_tete=SERVER_TIMING, echantillon=MINUTAGE_ECHANTILLON)
+
+    # Compteurs et latences par endpoint exposés par /metrics (DJAAAPP_METRIQUES=0 pour désactiver)
+    if METRIQUES and activer_metriques is not None:
+        activer_metriques(app)
+
     # Exposer couleurs aux templates si besoin
     @app.context_processor
     def injecter_couleurs():
@@ -101,18 +203,18 @@ def connecter_bdd_sans_base():
     """
     Se connecter au serveur MySQL sans sélectionner de base (utile pour créer la base).
     """
-    if mysql is None:
+    if mysql is None or parametres_connexion is None:
         raise RuntimeError("mysql-connector-python n'est pas installé.")
-    cfg = DB_CONFIG.copy()
+    cfg = parametres_connexion()
     cfg.pop("database", None)
     return mysql.connector.connect(**cfg)
 
 
 def connecter_bdd():
     """Se connecter à la base configurée (djaapp_db)."""
-    if mysql is None:
+    if mysql is None or parametres_connexion is None:
         raise RuntimeError("mysql-connector-python n'est pas installé.")
-    return mysql.connector.connect(**DB_CONFIG)
+    return mysql.connector.connect(**parametres_connexion())
 
 
 def executer_sql(connexion, requete, params=None):
@@ -127,6 +229,41 @@ def executer_sql(connexion, requete, params=None):
         curseur.close()
 
 
+def creer_index_si_absent(connexion, table, nom_index, definition):
+    """
+    Ajouter un index à une table existante s'il manque
+    (CREATE TABLE IF NOT EXISTS n'ajoute rien aux tables déjà créées).
+    """
+    curseur = connexion.cursor()
+    try:
+        curseur.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, nom_index),
+        )
+        existe = curseur.fetchone() is not None
+    finally:
+        curseur.close()
+    if not existe:
+        executer_sql(connexion, f"ALTER TABLE {table} ADD {definition}")
+
+
+def creer_colonne_si_absente(connexion, table, nom_colonne, definition):
+    """Ajouter une colonne à une table existante si elle manque."""
+    curseur = connexion.cursor()
+    try:
+        curseur.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+            (table, nom_colonne),
+        )
+        existe = curseur.fetchone() is not None
+    finally:
+        curseur.close()
+    if not existe:
+        executer_sql(connexion, f"ALTER TABLE {table} ADD COLUMN {nom_colonne} {definition}")
+
+
 def initialiser_base_si_absente():
     """
     Créer la base djaapp_db si elle n'existe pas, avec encodage utf8mb4.
@@ -278,22 +415,104 @@ def creer_tables_et_indexes():
             """,
         )
 
-        # Triggers: mise à jour du stock après insertion de ligne commande
-        executer_sql(conn, "DROP TRIGGER IF EXISTS trg_update_stock_apres_ligne;")
+        # Recherche: index FULLTEXT (MATCH ... AGAINST) et index de préfixe pour les saisies courtes
+        creer_index_si_absent(
+            conn, "boutiques", "ft_boutiques_texte",
+            "FULLTEXT INDEX ft_boutiques_texte (nom_boutique, description)",
+        )
+        creer_index_si_absent(
+            conn, "produits", "ft_produits_texte",
+            "FULLTEXT INDEX ft_produits_texte (nom, description, categorie)",
+        )
+        creer_index_si_absent(conn, "boutiques", "idx_boutiques_nom", "INDEX idx_boutiques_nom (nom_boutique)")
+        creer_index_si_absent(conn, "produits", "idx_produits_nom", "INDEX idx_produits_nom (nom)")
+
+        # Import de catalogue: référence du commerçant, unique par boutique (mise à jour par SKU)
+        creer_colonne_si_absente(conn, "produits", "sku", "VARCHAR(64) NULL AFTER id_boutique")
+        creer_index_si_absent(
+            conn, "produits", "uq_produits_boutique_sku",
+            "UNIQUE INDEX uq_produits_boutique_sku (id_boutique, sku)",
+        )
+
+        # Statistiques commerçant: plages de dates par boutique (obtenir_statistiques_commercant)
+        creer_index_si_absent(
+            conn, "commandes", "idx_commandes_boutique_date",
+            "INDEX idx_commandes_boutique_date (id_boutique, date_commande)",
+        )
+        # Historique client paginé par (date_commande, id) (obtenir_commandes_client)
+        creer_index_si_absent(
+            conn, "commandes", "idx_commandes_client_date",
+            "INDEX idx_commandes_client_date (id_client, date_commande)",
+        )
+
+        # Sessions web (SESSION_TYPE = "mysql"), purgées par date d'expiration
         executer_sql(
             conn,
             """
-            CREATE TRIGGER trg_update_stock_apres_ligne
-            AFTER INSERT ON lignes_commandes
-            FOR EACH ROW
-            BEGIN
-                UPDATE produits
-                SET stock = GREATEST(0, stock - NEW.quantite)
-                WHERE id = NEW.id_produit;
-            END;
+            CREATE TABLE IF NOT EXISTS sessions_web (
+                id VARCHAR(64) PRIMARY KEY,
+                donnees MEDIUMBLOB NOT NULL,
+                expiration DATETIME NOT NULL,
+                INDEX idx_sessions_web_expiration (expiration)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
             """,
         )
 
+        # Compteurs par boutique, maintenus à chaque commande (models.bdd.inserer_commande)
+        executer_sql(
+            conn,
+            """
+            CREATE TABLE IF NOT EXISTS compteurs_boutiques (
+                id_boutique INT PRIMARY KEY,
+                nb_commandes INT NOT NULL DEFAULT 0,
+                nb_commandes_payees INT NOT NULL DEFAULT 0,
+                total_ventes DECIMAL(14,2) NOT NULL DEFAULT 0,
+                INDEX idx_compteurs_nb_commandes (nb_commandes),
+                CONSTRAINT fk_compteurs_boutique FOREIGN KEY (id_boutique)
+                    REFERENCES boutiques(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """,
+        )
+        # Initialiser les compteurs des boutiques qui n'en ont pas encore (historique)
+        executer_sql(
+            conn,
+            """
+            INSERT IGNORE INTO compteurs_boutiques
+                (id_boutique, nb_commandes, nb_commandes_payees, total_ventes)
+            SELECT
+                b.id,
+                COUNT(c.id),
+                COALESCE(SUM(c.statut IN ('paye', 'livre')), 0),
+                COALESCE(SUM(c.total), 0)
+            FROM boutiques b
+            LEFT JOIN commandes c ON c.id_boutique = b.id AND c.statut <> 'annulee'
+            GROUP BY b.id;
+            """,
+        )
+
+        # Cumuls journaliers des ventes (graphiques commerçant), maintenus à chaque commande
+        executer_sql(
+            conn,
+            """
+            CREATE TABLE IF NOT EXISTS ventes_journalieres (
+                id_boutique INT NOT NULL,
+                jour DATE NOT NULL,
+                nb_commandes INT NOT NULL DEFAULT 0,
+                chiffre_affaires DECIMAL(14,2) NOT NULL DEFAULT 0,
+                nb_unites INT NOT NULL DEFAULT 0,
+                nb_commandes_payees INT NOT NULL DEFAULT 0,
+                chiffre_affaires_paye DECIMAL(14,2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (id_boutique, jour),
+                CONSTRAINT fk_ventes_journalieres_boutique FOREIGN KEY (id_boutique)
+                    REFERENCES boutiques(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """,
+        )
+
+        # Le stock est réservé par passer_commande avec des UPDATE conditionnels
+        # (models.bdd.reserver_stocks): supprimer l'ancien trigger ligne par ligne
+        executer_sql(conn, "DROP TRIGGER IF EXISTS trg_update_stock_apres_ligne;")
+
     finally:
         conn.close()
 
@@ -304,22 +523,47 @@ def creer_tables_et_indexes():
 
 @app.get("/sante")
 def verifier_sante():
-    """Vérification santé de l'application et de la connexion BDD."""
+    """Vérification santé de l'application, de la connexion BDD et du pool."""
     etat = {"application": "ok", "bdd": "inconnue"}
     if mysql is None:
         etat["bdd"] = "mysql-connector-python non installé"
         return jsonify(etat), 200
     try:
-        conn = connecter_bdd()
-        conn.close()
+        if obtenir_pool is not None:
+            # Emprunt/retour: vérifie la base sans ouvrir de connexion jetable
+            pool = obtenir_pool()
+            pool.rendre(pool.obtenir())
+        else:
+            conn = connecter_bdd()
+            conn.close()
         etat["bdd"] = "connexion_ok"
         code = 200
     except Exception as e:
         etat["bdd"] = f"erreur_connexion: {e}"
         code = 500
+    if obtenir_pool is not None:
+        etat["pool"] = obtenir_pool().statistiques()
+        etat["routage"] = statistiques_routage()
+    sessions = statistiques_balayage() if statistiques_balayage is not None else None
+    if sessions is not None:
+        etat["sessions"] = sessions
     return jsonify(etat), code
 
 
+@app.get("/metrics")
+def exposer_metriques():
+    """Métriques au format texte Prometheus, agrégées sur tous les workers."""
+    if not METRIQUES or generer_metriques is None:
+        return jsonify({"erreur": "Métriques désactivées"}), 404
+    if METRIQUES_JETON:
+        if request.headers.get("Authorization") != f"Bearer {METRIQUES_JETON}":
+            return jsonify({"erreur": "Non autorisé"}), 401
+    elif request.remote_addr not in ("127.0.0.1", "::1") or "X-Forwarded-For" in request.headers:
+        # Sans jeton: collecteur local seulement, jamais une requête relayée par un proxy
+        return jsonify({"erreur": "Non autorisé (définir DJAAAPP_METRIQUES_JETON)"}), 403
+    return Response(generer_metriques(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/init-bdd")
 def initialiser_bdd():
     """
@@ -336,6 +580,60 @@ def initialiser_bdd():
         return jsonify({"erreur": str(e)}), 500
 
 
+@app.cli.command("reconstruire-ventes")
+@click.option("--boutique", "id_boutique", type=int, default=None, help="Une seule boutique (toutes par défaut).")
+def reconstruire_ventes(id_boutique):
+    """
+    Recalculer la table ventes_journalieres depuis l'historique des commandes.
+    Usage: flask --app app reconstruire-ventes [--boutique ID]
+    """
+    from models.bdd import iterer_requete_sql, reconstruire_ventes_journalieres
+
+    if id_boutique is not None:
+        boutiques = [{"id": id_boutique}]
+    else:
+        # Liste parcourue en flux: mémoire constante quel que soit le nombre de boutiques
+        boutiques = iterer_requete_sql("SELECT id FROM boutiques ORDER BY id")
+    for i, boutique in enumerate(boutiques, 1):
+        reconstruire_ventes_journalieres(boutique["id"])
+        click.echo(f"[{i}] boutique {boutique['id']} reconstruite")
+
+
+@app.cli.command("importer-catalogue")
+@click.argument("fichier", type=click.Path(exists=True, dir_okay=False))
+@click.option("--boutique", "id_boutique", type=int, required=True, help="Boutique de destination.")
+@click.option("--taille-lot", type=int, default=None, help="Produits écrits par transaction.")
+def importer_catalogue_cli(fichier, id_boutique, taille_lot):
+    """
+    Importer un catalogue CSV ou JSON dans une boutique (mise à jour par SKU).
+    Usage: flask --app app importer-catalogue --boutique ID produits.csv
+    """
+    from controllers.commercant import importer_catalogue
+    from models.bdd import selectionner_boutique_par_id
+    from utilitaires.import_catalogue import TAILLE_LOT_IMPORT, lire_lignes_fichier
+
+    boutique = selectionner_boutique_par_id(id_boutique)
+    if not boutique:
+        raise click.ClickException(f"Boutique {id_boutique} introuvable")
+    format_fichier = fichier.rsplit(".", 1)[-1].lower()
+    with open(fichier, "rb") as flux:
+        try:
+            rapport = importer_catalogue(
+                boutique["id_commercant"], id_boutique,
+                lire_lignes_fichier(flux, format_fichier),
+                taille_lot=taille_lot or TAILLE_LOT_IMPORT,
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"{rapport['importees']} produit(s) importé(s) sur {rapport['lignes']} ligne(s)")
+    for erreur in rapport["erreurs"]:
+        click.echo(f"ligne {erreur['ligne']}: {erreur['erreur']}", err=True)
+    if rapport["nb_erreurs"] > len(rapport["erreurs"]):
+        click.echo(f"... {rapport['nb_erreurs'] - len(rapport['erreurs'])} autre(s) erreur(s)", err=True)
+    if rapport["erreur_fichier"]:
+        raise click.ClickException(f"Lecture interrompue: {rapport['erreur_fichier']}")
+
+
 # ---------------------------------------------
 # Chargement des routes applicatives (si disponibles)
 # ---------------------------------------------
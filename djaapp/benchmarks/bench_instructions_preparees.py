@@ -0,0 +1,91 @@
+"""
+Banc d'essai: requêtes fréquentes en texte ou en instructions préparées.
+
+Exécute chaque requête chaude (boutique par id, produits d'une boutique, panier,
+client par téléphone, commerçant par email) `--iterations` fois sur la même
+connexion, d'abord en texte puis préparée (cache du pool), vérifie que les
+résultats sont identiques et affiche le temps moyen par exécution.
+Nécessite une base MySQL initialisée contenant au moins une boutique avec produits.
+
+Usage (depuis djaapp/):
+    python -m benchmarks.bench_instructions_preparees --iterations 2000
+"""
+
+import argparse
+import time
+
+from controllers.client import requete_panier
+from models import bdd
+
+
+def _requetes_chaudes():
+    """(nom, requête, paramètres, fetchone) construits depuis des lignes existantes."""
+    boutique = bdd.executer_requete_sql(
+        "SELECT b.id, b.id_commercant FROM boutiques b "
+        "WHERE EXISTS (SELECT 1 FROM produits p WHERE p.id_boutique = b.id) LIMIT 1",
+        fetchone=True,
+    )
+    if not boutique:
+        raise SystemExit("Aucune boutique avec produits: initialiser des données d'abord")
+    commercant = bdd.selectionner_commercant_par_id(boutique["id_commercant"])
+    client = bdd.executer_requete_sql("SELECT telephone FROM clients LIMIT 1", fetchone=True)
+    ids_panier = [
+        p["id"] for p in bdd.executer_requete_sql(
+            "SELECT id FROM produits WHERE id_boutique = %s LIMIT 3", (boutique["id"],), fetchall=True
+        )
+    ]
+    # Texte et paramètres exactement ceux de controllers.client.obtenir_panier
+    requete_du_panier, params_panier = requete_panier(ids_panier)
+
+    requetes = [
+        ("selectionner_boutique_par_id", "SELECT * FROM boutiques WHERE id = %s", (boutique["id"],), True),
+        (
+            "selectionner_produits_par_boutique",
+            "SELECT * FROM produits WHERE id_boutique = %s ORDER BY id DESC", (boutique["id"],), False,
+        ),
+        ("obtenir_panier", requete_du_panier, tuple(params_panier), False),
+        (
+            "selectionner_commercant_par_email",
+            "SELECT * FROM commercants WHERE email = %s LIMIT 1", (commercant["email"],), True,
+        ),
+    ]
+    if client:
+        requetes.append((
+            "selectionner_client_par_telephone",
+            "SELECT * FROM clients WHERE telephone = %s LIMIT 1", (client["telephone"],), True,
+        ))
+    return requetes
+
+
+def _mesurer(requete, params, fetchone, iterations, prepare):
+    options = {"fetchone": True} if fetchone else {"fetchall": True}
+    resultat = bdd.executer_requete_sql(requete, params, prepare=prepare, **options)
+    debut = time.perf_counter()
+    for _ in range(iterations):
+        bdd.executer_requete_sql(requete, params, prepare=prepare, **options)
+    return resultat, (time.perf_counter() - debut) / iterations * 1e6
+
+
+def lancer(iterations):
+    # Une seule connexion pour toutes les mesures, comme une requête HTTP
+    with bdd.transaction():
+        for nom, requete, params, fetchone in _requetes_chaudes():
+            texte, duree_texte = _mesurer(requete, params, fetchone, iterations, prepare=False)
+            preparee, duree_preparee = _mesurer(requete, params, fetchone, iterations, prepare=True)
+            identique = "OK" if texte == preparee else "RESULTATS DIFFERENTS"
+            print(
+                f"{nom:36s} texte={duree_texte:8.1f}µs preparee={duree_preparee:8.1f}µs "
+                f"gain={duree_texte / duree_preparee:5.2f}x {identique}"
+            )
+    stats = bdd.statistiques_pool()
+    print(
+        f"instructions preparees={stats['instructions_preparees']} "
+        f"reutilisees={stats['instructions_reutilisees']} evincees={stats['instructions_evincees']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    lancer(args.iterations)
@@ -0,0 +1,85 @@
+"""
+Banc d'essai: centaines de paiements concurrents sur un seul produit (vente flash).
+
+Crée un produit temporaire dans une boutique existante, lance N clients qui réservent
+chacun `quantite` unités dans leur propre transaction, puis vérifie qu'aucune unité
+n'a été survendue. Nécessite une base MySQL initialisée (POST /init-bdd).
+
+Usage (depuis djaapp/):
+    python -m benchmarks.bench_reservation_stock --boutique 1 --stock 100 --clients 300 --connexions 50
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mysql.connector import Error
+
+from models import bdd
+
+
+def _reserver(id_produit, quantite, depart):
+    """Une commande client: réserver puis valider. Retourne (acceptee, duree, erreur)."""
+    depart.wait()
+    debut = time.perf_counter()
+    try:
+        with bdd.transaction():
+            acceptees, _ = bdd.reserver_stocks({id_produit: quantite})
+        return bool(acceptees), time.perf_counter() - debut, None
+    except Error as e:
+        # 1205 = lock wait timeout, 1213 = deadlock
+        return False, time.perf_counter() - debut, getattr(e, "errno", None) or str(e)
+
+
+def lancer(id_boutique, stock, clients, quantite, connexions):
+    # Comme en production: les clients se partagent un pool borné (max_connections)
+    bdd.DB_CONFIG["pool"] = {"taille": connexions, "debordement": 0, "delai_attente": 60}
+    id_produit = bdd.inserer_produit(id_boutique, "bench-vente-flash", None, 1000, stock)
+    try:
+        depart = threading.Event()
+        with ThreadPoolExecutor(max_workers=clients) as executeur:
+            futurs = [executeur.submit(_reserver, id_produit, quantite, depart) for _ in range(clients)]
+            time.sleep(0.5)  # laisser tous les threads se mettre en attente
+            debut = time.perf_counter()
+            depart.set()
+            resultats = [f.result() for f in futurs]
+            duree_totale = time.perf_counter() - debut
+
+        stock_final = bdd.executer_requete_sql(
+            "SELECT stock FROM produits WHERE id = %s", (id_produit,), fetchone=True
+        )["stock"]
+    finally:
+        bdd.supprimer_produit(id_produit)
+
+    acceptees = sum(1 for ok, _, _ in resultats if ok)
+    erreurs = [err for _, _, err in resultats if err is not None]
+    durees = sorted(d * 1000 for _, d, _ in resultats)
+    attendues = min(clients, stock // quantite)
+
+    print(f"clients={clients} stock_initial={stock} quantite={quantite}")
+    print(f"acceptees={acceptees} (attendu {attendues}) refusees={clients - acceptees - len(erreurs)}")
+    print(f"stock_final={stock_final} (attendu {stock - attendues * quantite})")
+    print(f"erreurs={len(erreurs)} {sorted(set(map(str, erreurs)))}")
+    print(
+        f"duree={duree_totale:.3f}s debit={clients / duree_totale:.0f} commandes/s "
+        f"p50={statistics.median(durees):.1f}ms p99={durees[int(len(durees) * 0.99) - 1]:.1f}ms"
+    )
+    print(f"pool={bdd.statistiques_pool()}")
+
+    survente = stock_final < 0 or acceptees * quantite > stock
+    if survente or erreurs or acceptees != attendues:
+        raise SystemExit("ECHEC: survente, erreurs de verrou ou réservations manquantes")
+    print("OK: aucune survente")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--boutique", type=int, required=True, help="ID d'une boutique existante")
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--quantite", type=int, default=1)
+    parser.add_argument("--connexions", type=int, default=50, help="taille du pool partagé")
+    args = parser.parse_args()
+    lancer(args.boutique, args.stock, args.clients, args.quantite, args.connexions)
@@ -0,0 +1,104 @@
+"""
+Banc d'essai des stockages de session: fichiers (Flask-Session), SQLite WAL, MySQL.
+
+Simule `--requetes` requêtes réparties sur `--sessions` visiteurs, dont une part
+`--modifications` modifie le panier (ajout au panier) et le reste ne fait que lire
+la session (navigation). Reproduit le comportement de chaque stockage:
+- fichiers: Flask-Session (cachelib FileSystemCache) relit et réécrit le fichier
+  à chaque requête (SESSION_REFRESH_EACH_REQUEST);
+- sqlite/mysql: utilitaires.sessions lit la session, n'écrit que si elle a changé.
+
+Usage (depuis djaapp/):
+    python -m benchmarks.bench_sessions --requetes 5000 --sessions 500
+    python -m benchmarks.bench_sessions --mysql   # base initialisée (POST /init-bdd)
+"""
+
+import argparse
+import random
+import secrets
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask.sessions import session_json_serializer
+
+from utilitaires.sessions import StockageSessionsMySQL, StockageSessionsSQLite
+
+
+def _scenario(nb_requetes, nb_sessions, part_modifications):
+    """Liste (sid, modification) reproductible."""
+    aleatoire = random.Random(42)
+    sids = [secrets.token_urlsafe(32) for _ in range(nb_sessions)]
+    return [(aleatoire.choice(sids), aleatoire.random() < part_modifications) for _ in range(nb_requetes)]
+
+
+def _panier(aleatoire):
+    return {"panier": {str(aleatoire.randint(1, 5000)): aleatoire.randint(1, 5) for _ in range(aleatoire.randint(1, 8))}}
+
+
+def bench_fichiers(scenario, dossier):
+    from cachelib import FileSystemCache
+
+    # Réglages de Flask-Session 0.4 (SESSION_FILE_THRESHOLD=500, mode 0600)
+    cache = FileSystemCache(dossier, threshold=500, mode=0o600)
+    aleatoire = random.Random(1)
+    durees = []
+    for sid, modification in scenario:
+        debut = time.perf_counter()
+        donnees = cache.get(sid) or {}
+        if modification:
+            donnees = _panier(aleatoire)
+        cache.set(sid, donnees, timeout=31 * 24 * 3600)
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def bench_stockage(stockage, scenario):
+    aleatoire = random.Random(1)
+    durees = []
+    for sid, modification in scenario:
+        debut = time.perf_counter()
+        trouvee = stockage.lire(sid)
+        if trouvee is not None:
+            session_json_serializer.loads(trouvee[0].decode("utf-8"))
+        if modification or trouvee is None:
+            donnees = session_json_serializer.dumps(_panier(aleatoire)).encode("utf-8")
+            stockage.ecrire(sid, donnees, datetime.now(timezone.utc) + timedelta(days=31))
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def _afficher(nom, durees):
+    durees = sorted(d * 1e6 for d in durees)
+    print(
+        f"{nom:10s} total={sum(durees) / 1e6:7.3f}s moyenne={statistics.mean(durees):8.1f}µs "
+        f"p50={statistics.median(durees):8.1f}µs p99={durees[int(len(durees) * 0.99) - 1]:8.1f}µs"
+    )
+
+
+def lancer(nb_requetes, nb_sessions, part_modifications, avec_mysql):
+    scenario = _scenario(nb_requetes, nb_sessions, part_modifications)
+    print(f"requetes={nb_requetes} sessions={nb_sessions} modifications={part_modifications:.0%}")
+    with tempfile.TemporaryDirectory() as dossier:
+        _afficher("fichiers", bench_fichiers(scenario, f"{dossier}/fichiers"))
+        _afficher("sqlite", bench_stockage(StockageSessionsSQLite(f"{dossier}/sessions.sqlite3"), scenario))
+    if avec_mysql:
+        from models import bdd
+
+        stockage = StockageSessionsMySQL()
+        try:
+            _afficher("mysql", bench_stockage(stockage, scenario))
+        finally:
+            for sid in {sid for sid, _ in scenario}:
+                bdd.supprimer_session_web(sid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requetes", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--modifications", type=float, default=0.2, help="part des requêtes qui modifient la session")
+    parser.add_argument("--mysql", action="store_true", help="mesurer aussi la table sessions_web")
+    args = parser.parse_args()
+    lancer(args.requetes, args.sessions, args.modifications, args.mysql)
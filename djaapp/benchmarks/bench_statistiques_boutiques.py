@@ -0,0 +1,104 @@
+"""
+Vérification de non-régression de obtenir_statistiques_boutiques sur une boutique
+synthétique (milliers de produits et de commandes).
+
+L'ancienne requête joignait produits et commandes à boutiques: produits x commandes
+lignes par boutique et un total_ventes multiplié par le nombre de produits. Ce script
+compare le résultat aux valeurs attendues et mesure les deux requêtes, puis supprime
+les données créées. Nécessite une base MySQL initialisée (POST /init-bdd).
+La même comparaison, sur un petit jeu de données, est vérifiée automatiquement par
+tests/test_statistiques_boutiques.py (ignoré sans base joignable).
+
+Usage (depuis djaapp/):
+    python -m benchmarks.bench_statistiques_boutiques --produits 3000 --commandes 3000
+"""
+
+import argparse
+import time
+import uuid
+
+from models import bdd
+from controllers.commercant import obtenir_statistiques_boutiques
+
+ANCIENNE_REQUETE = """
+    SELECT
+        b.id,
+        COUNT(DISTINCT p.id) AS nb_produits,
+        COUNT(DISTINCT c.id) AS nb_commandes,
+        COALESCE(SUM(c.total), 0) AS total_ventes
+    FROM boutiques b
+    LEFT JOIN produits p ON p.id_boutique = b.id
+    LEFT JOIN commandes c ON c.id_boutique = b.id
+    WHERE b.id_commercant = %s
+    GROUP BY b.id
+"""
+
+
+def _chrono(fonction, *args, **kwargs):
+    debut = time.perf_counter()
+    resultat = fonction(*args, **kwargs)
+    return resultat, (time.perf_counter() - debut) * 1000
+
+
+def creer_boutique_synthetique(nb_produits, nb_commandes):
+    """
+    Créer un commerçant, un client et une boutique de `nb_produits` produits et
+    `nb_commandes` commandes. Retourne (id_commercant, id_client, totaux des commandes);
+    à nettoyer avec supprimer_donnees_synthetiques.
+    """
+    suffixe = uuid.uuid4().hex[:10]
+    id_commercant = bdd.inserer_commercant("Bench", f"bench-{suffixe}@djaapp.test", "x")
+    id_client = bdd.inserer_client("Bench", None, f"+225{int(suffixe, 16) % 10**10:010d}")
+    id_boutique = bdd.inserer_boutique(id_commercant, "Boutique synthétique")
+    with bdd.transaction():
+        bdd.executer_lot_sql(
+            "INSERT INTO produits (id_boutique, nom, prix, stock) VALUES (%s, %s, %s, %s)",
+            [(id_boutique, f"produit {i}", 100 + i % 50, 10) for i in range(nb_produits)],
+        )
+        totaux = [1000 + i % 97 for i in range(nb_commandes)]
+        for total in totaux:
+            bdd.inserer_commande(id_client, id_boutique, total, "carte")
+    return id_commercant, id_client, totaux
+
+
+def supprimer_donnees_synthetiques(id_commercant, id_client):
+    # Boutiques, produits et commandes suivent par ON DELETE CASCADE
+    bdd.executer_requete_sql("DELETE FROM commercants WHERE id = %s", (id_commercant,))
+    bdd.executer_requete_sql("DELETE FROM clients WHERE id = %s", (id_client,))
+
+
+def lancer(nb_produits, nb_commandes, avec_ancienne):
+    id_commercant, id_client, totaux = creer_boutique_synthetique(nb_produits, nb_commandes)
+    try:
+        stats, duree = _chrono(obtenir_statistiques_boutiques, id_commercant)
+        ligne = stats[0]
+        print(f"produits={nb_produits} commandes={nb_commandes}")
+        print(
+            f"nouvelle requête: {duree:.1f}ms nb_produits={ligne['nb_produits']} "
+            f"nb_commandes={ligne['nb_commandes']} total_ventes={ligne['total_ventes']}"
+        )
+        if avec_ancienne:
+            ancienne, duree = _chrono(
+                bdd.executer_requete_sql, ANCIENNE_REQUETE, (id_commercant,), fetchone=True
+            )
+            print(f"ancienne requête: {duree:.1f}ms total_ventes={ancienne['total_ventes']}")
+
+        attendu = (nb_produits, nb_commandes, sum(totaux))
+        obtenu = (int(ligne["nb_produits"]), int(ligne["nb_commandes"]), int(ligne["total_ventes"]))
+        if obtenu != attendu:
+            raise SystemExit(f"ECHEC: attendu {attendu}, obtenu {obtenu}")
+        print("OK: statistiques exactes")
+    finally:
+        supprimer_donnees_synthetiques(id_commercant, id_client)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--produits", type=int, default=3000)
+    parser.add_argument("--commandes", type=int, default=3000)
+    parser.add_argument(
+        "--ancienne", action="store_true",
+        help="mesurer aussi l'ancienne requête (produits x commandes, lente)",
+    )
+    args = parser.parse_args()
+    lancer(args.produits, args.commandes, args.ancienne)
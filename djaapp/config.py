@@ -1,12 +1,31 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Clé secrète Flask (à changer en production). Vous pouvez aussi utiliser la variable d'environnement DJAAAPP_SECRET_KEY.
 SECRET_KEY = os.environ.get("DJAAAPP_SECRET_KEY", "dev-changez-moi")
 
-# Configuration des sessions côté serveur (stockage fichier pour simplicité)
-SESSION_TYPE = "filesystem"
+# Configuration des sessions côté serveur:
+# "filesystem" (Flask-Session, un fichier par session), "mysql" (table sessions_web,
+# partagée entre les nœuds) ou "sqlite" (fichier local en mode WAL), voir utilitaires/sessions.py
+SESSION_TYPE = os.environ.get("DJAAAPP_SESSION_TYPE", "filesystem")
 SESSION_FILE_DIR = str(Path(__file__).resolve().parent / ".sessions")
+SESSION_SQLITE_CHEMIN = os.environ.get("DJAAAPP_SESSION_SQLITE", str(Path(SESSION_FILE_DIR) / "sessions.sqlite3"))
+# Purge des sessions expirées, tous stockages: "requetes" (après une réponse, quand un passage
+# est dû), "minuterie" (thread par processus) ou "" pour désactiver
+SESSION_BALAYAGE = os.environ.get("DJAAAPP_SESSION_BALAYAGE", "requetes")
+# Sessions supprimées au plus par passage, et secondes entre deux passages
+SESSION_BALAYAGE_LOT = int(os.environ.get("DJAAAPP_SESSION_BALAYAGE_LOT", "200"))
+SESSION_BALAYAGE_INTERVALLE = float(os.environ.get("DJAAAPP_SESSION_BALAYAGE_INTERVALLE", "60"))
+
+# Panier des visiteurs anonymes dans un cookie signé plutôt qu'en session serveur
+# (voir utilitaires/panier_cookie.py); il passe en session à la connexion
+PANIER_COOKIE = os.environ.get("DJAAAPP_PANIER_COOKIE", "0") == "1"
+# Compresser (zlib) le contenu du cookie quand c'est plus court
+PANIER_COOKIE_COMPRESSION = os.environ.get("DJAAAPP_PANIER_COOKIE_COMPRESSION", "1") == "1"
+# Taille maximale (caractères) du cookie; au-delà le panier passe en session
+PANIER_COOKIE_TAILLE_MAX = int(os.environ.get("DJAAAPP_PANIER_COOKIE_TAILLE_MAX", "3000"))
+PANIER_COOKIE_DUREE_JOURS = int(os.environ.get("DJAAAPP_PANIER_COOKIE_DUREE_JOURS", "30"))
 
 # Configuration MySQL (modifiable via variables d'environnement)
 DB_CONFIG = {
@@ -17,4 +36,61 @@ DB_CONFIG = {
     "port": int(os.environ.get("DJAAAPP_DB_PORT", "3306")),
     # Autocommit facilite le mode procédural pour des opérations simples
     "autocommit": True,
+    # Pool de connexions partagé par executer_requete_sql (clé retirée avant mysql.connector.connect)
+    "pool": {
+        # Connexions conservées ouvertes en permanence
+        "taille": int(os.environ.get("DJAAAPP_DB_POOL_TAILLE", "5")),
+        # Connexions supplémentaires autorisées en pic, fermées à leur retour
+        "debordement": int(os.environ.get("DJAAAPP_DB_POOL_DEBORDEMENT", "10")),
+        # Secondes d'attente maximale pour obtenir une connexion
+        "delai_attente": float(os.environ.get("DJAAAPP_DB_POOL_DELAI", "10")),
+        # Vérifier la connexion (ping) avant de la prêter
+        "pre_ping": os.environ.get("DJAAAPP_DB_POOL_PRE_PING", "1") == "1",
+        # Secondes après lesquelles une connexion est recréée (-1 pour désactiver)
+        "recyclage": int(os.environ.get("DJAAAPP_DB_POOL_RECYCLAGE", "3600")),
+        # Instructions préparées gardées par connexion (LRU), 0 pour désactiver
+        "cache_instructions": int(os.environ.get("DJAAAPP_DB_POOL_CACHE_INSTRUCTIONS", "32")),
+    },
+    # Réplicas en lecture: paramètres fusionnés avec ceux du primaire (clé retirée avant connect).
+    # DJAAAPP_DB_REPLICAS="hote1:3306,hote2:3306"
+    "replicas": [
+        {"host": hote, "port": int(port or 3306)}
+        for hote, _, port in (
+            adresse.strip().partition(":")
+            for adresse in os.environ.get("DJAAAPP_DB_REPLICAS", "").split(",")
+            if adresse.strip()
+        )
+    ],
 }
+
+# Secondes pendant lesquelles une session lit sur le primaire après une écriture
+# (lire ses propres écritures malgré le retard de réplication)
+DB_FENETRE_PRIMAIRE_APRES_ECRITURE = float(os.environ.get("DJAAAPP_DB_FENETRE_PRIMAIRE", "5"))
+
+# Lignes lues par lot (fetchmany) par models.bdd.iterer_requete_sql (exports, rattrapages)
+DB_TAILLE_LOT_FLUX = int(os.environ.get("DJAAAPP_DB_TAILLE_LOT_FLUX", "1000"))
+
+# Durée de vie (secondes) du cache mémoire des boutiques populaires (accueil, dashboard client)
+CACHE_BOUTIQUES_POPULAIRES_TTL = int(os.environ.get("DJAAAPP_CACHE_POPULAIRES_TTL", "60"))
+
+# Instrumentation SQL par requête (résumé, requêtes lentes, N+1), désactivée par défaut
+INSTRUMENTATION_SQL = os.environ.get("DJAAAPP_INSTRUMENTATION_SQL", "0") == "1"
+# Durée (ms) à partir de laquelle une requête SQL est journalisée comme lente
+SEUIL_REQUETE_LENTE_MS = float(os.environ.get("DJAAAPP_SEUIL_REQUETE_LENTE_MS", "200"))
+# Exécutions d'une même requête dans une requête HTTP à partir desquelles un N+1 est signalé
+SEUIL_N_PLUS_UN = int(os.environ.get("DJAAAPP_SEUIL_N_PLUS_UN", "5"))
+
+# En-tête Server-Timing (temps BDD, templates, appels externes) sur chaque réponse
+SERVER_TIMING = os.environ.get("DJAAAPP_SERVER_TIMING", "0") == "1"
+# Fraction des requêtes dont le minutage est journalisé (0 = aucune, 1 = toutes)
+MINUTAGE_ECHANTILLON = float(os.environ.get("DJAAAPP_MINUTAGE_ECHANTILLON", "0"))
+
+# Métriques Prometheus (/metrics): instantanés par processus dans ce dossier, agrégés à la lecture
+METRIQUES = os.environ.get("DJAAAPP_METRIQUES", "1") == "1"
+# (hors de l'arborescence des sources; sous gunicorn, un dossier de /run propre au service convient)
+METRIQUES_DOSSIER = os.environ.get("DJAAAPP_METRIQUES_DOSSIER", str(Path(tempfile.gettempdir()) / "djaapp-metriques"))
+# Secondes entre deux écritures de l'instantané d'un processus
+METRIQUES_INTERVALLE_ECRITURE = float(os.environ.get("DJAAAPP_METRIQUES_INTERVALLE", "5"))
+# Jeton exigé par /metrics (en-tête Authorization: Bearer ...); vide, /metrics ne répond
+# qu'aux requêtes locales directes (127.0.0.1 / ::1, sans passer par un proxy)
+METRIQUES_JETON = os.environ.get("DJAAAPP_METRIQUES_JETON", "")
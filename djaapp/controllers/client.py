@@ -3,20 +3,37 @@ Contrôleur pour la logique métier des clients.
 Fonctions procédurales en français pour gérer paniers, commandes, paiements.
 """
 
+from flask import g, has_request_context
 from models.bdd import (
     inserer_client,
     selectionner_client_par_telephone,
-    inserer_commande,
-    inserer_ligne_commande,
+    inserer_commandes,
+    annuler_commandes_impayees,
+    reserver_stocks,
     selectionner_boutiques_populaires,
     selectionner_boutique_par_id,
     selectionner_produits_par_boutique,
+    rechercher_boutiques_texte,
+    rechercher_produits_texte,
     executer_requete_sql,
+    transaction,
 )
 from utilitaires.integrations import initier_paiement_mobile_money
+from utilitaires.cache import CacheTTL
+from utilitaires.pagination import (
+    TAILLE_PAGE,
+    decouper_page,
+    encoder_curseur_commande,
+    decoder_curseur_commande,
+)
+from config import CACHE_BOUTIQUES_POPULAIRES_TTL
 import uuid
 
 
+# Classement des boutiques populaires, partagé par les requêtes du processus
+_cache_boutiques_populaires = CacheTTL(CACHE_BOUTIQUES_POPULAIRES_TTL)
+
+
 def inscrire_client(nom, telephone, email=None, adresse=None):
     """
     Inscrit un nouveau client.
@@ -29,19 +46,53 @@ def inscrire_client(nom, telephone, email=None, adresse=None):
     )
 
 
+def obtenir_boutiques_populaires(limite):
+    """
+    Boutiques populaires depuis le cache mémoire (TTL), limite appliquée en SQL.
+    """
+    return _cache_boutiques_populaires.obtenir(
+        limite, lambda: selectionner_boutiques_populaires(limite)
+    )
+
+
+def invalider_boutiques_populaires():
+    """
+    Vider le cache des boutiques populaires (nouvelle boutique, nouvelle commande).
+    Ne concerne que le processus courant: les autres se rafraîchissent via le TTL.
+    """
+    _cache_boutiques_populaires.invalider()
+
+
+def statistiques_cache_boutiques_populaires():
+    """Succès/échecs du cache des boutiques populaires."""
+    return _cache_boutiques_populaires.statistiques()
+
+
 def rechercher_boutiques(query=None):
     """
-    Recherche des boutiques par nom ou populaires si pas de query.
+    Recherche des boutiques par nom/description ou populaires si pas de query.
     """
     if query:
-        requete = """
-            SELECT b.*, COUNT(c.id) AS nb_commandes
-            FROM boutiques b LEFT JOIN commandes c ON c.id_boutique = b.id
-            WHERE b.nom_boutique LIKE %s
-            GROUP BY b.id ORDER BY nb_commandes DESC LIMIT 20
-        """
-        return executer_requete_sql(requete, (f"%{query}%",), fetchall=True)
-    return selectionner_boutiques_populaires(20)
+        return rechercher_boutiques_texte(query, 20)
+    return obtenir_boutiques_populaires(20)
+
+
+def rechercher_catalogue(query, page=1, par_page=20):
+    """
+    Recherche paginée dans les boutiques et les produits, classée par pertinence.
+    Retourne un dict avec boutiques, produits, page et page_suivante.
+    """
+    page = max(1, page)
+    decalage = (page - 1) * par_page
+    # Une ligne de plus que la page pour savoir s'il existe une page suivante
+    boutiques = rechercher_boutiques_texte(query, par_page + 1, decalage)
+    produits = rechercher_produits_texte(query, par_page + 1, decalage)
+    return {
+        "boutiques": boutiques[:par_page],
+        "produits": produits[:par_page],
+        "page": page,
+        "page_suivante": len(boutiques) > par_page or len(produits) > par_page,
+    }
 
 
 def obtenir_boutique(id_boutique):
@@ -57,31 +108,51 @@ def obtenir_boutique(id_boutique):
 
 def ajouter_au_panier(session, id_produit, quantite):
     """
-    Ajoute un produit au panier en session.
+    Ajoute un produit au panier en session (ou dans le PanierCookie d'un visiteur anonyme).
     """
     panier = session.get("panier", {})
     panier[str(id_produit)] = panier.get(str(id_produit), 0) + quantite
     session["panier"] = panier
 
 
+def requete_panier(ids_produits):
+    """
+    (requête, paramètres) des produits du panier. Le nombre de places du IN est
+    arrondi à la puissance de 2 supérieure (places en trop: dernier id répété):
+    quelques textes préparés par connexion au lieu d'un par taille de panier.
+    """
+    ids_produits = list(ids_produits)
+    nb_places = 1 << (len(ids_produits) - 1).bit_length()
+    params = ids_produits + ids_produits[-1:] * (nb_places - len(ids_produits))
+    placeholders = ",".join(["%s"] * nb_places)
+    requete = f"""
+        SELECT p.id, p.nom, CAST(p.prix AS DECIMAL(10,2)) as prix, p.id_boutique, p.stock, b.nom_boutique
+        FROM produits p
+        JOIN boutiques b ON p.id_boutique = b.id
+        WHERE p.id IN ({placeholders})
+    """
+    return requete, params
+
+
 def obtenir_panier(session):
     """
-    Récupère le contenu du panier avec détails produits depuis BDD.
+    Récupère le contenu du panier avec détails produits depuis BDD (prix, boutique, stock).
+    Résolu une seule fois par requête HTTP pour un même contenu (mémorisé sur flask.g):
+    la route de paiement et passer_commande partagent la même lecture.
     """
     panier = session.get("panier", {})
     if not panier:
         return {"items": [], "total": 0.0}
 
+    cle = tuple(sorted(panier.items()))
+    if has_request_context():
+        memorise = g.get("panier_resolu")
+        if memorise is not None and memorise[0] == cle:
+            return memorise[1]
+
     # Récupérer détails produits avec nom de boutique
-    ids_produits = list(panier.keys())
-    placeholders = ",".join(["%s"] * len(ids_produits))
-    requete = f"""
-        SELECT p.id, p.nom, CAST(p.prix AS DECIMAL(10,2)) as prix, b.nom_boutique
-        FROM produits p
-        JOIN boutiques b ON p.id_boutique = b.id
-        WHERE p.id IN ({placeholders})
-    """
-    produits = executer_requete_sql(requete, ids_produits, fetchall=True)
+    requete, params = requete_panier(panier.keys())
+    produits = executer_requete_sql(requete, params, fetchall=True, prepare=True)
 
     # Mapper par ID
     produits_dict = {str(p["id"]): p for p in produits}
@@ -99,48 +170,94 @@ def obtenir_panier(session):
                 "prix": prix_float,
                 "quantite": qty,
                 "sous_total": sous_total,
+                "id_boutique": prod["id_boutique"],
+                "stock": prod["stock"],
                 "nom_boutique": prod["nom_boutique"],
             })
             total = total + sous_total
-    return {"items": items, "total": float(total)}
+    resultat = {"items": items, "total": float(total)}
+    if has_request_context():
+        g.panier_resolu = (cle, resultat)
+    return resultat
 
 
-def passer_commande(session, id_client, id_boutique, methode_paiement):
+def passer_commande(session, id_client, methode_paiement):
     """
-    Crée une commande depuis le panier.
+    Crée les commandes du panier: une par boutique, toutes dans la même transaction.
+    Les lignes sans stock suffisant sont refusées et restent dans le panier.
+    Retourne (commandes, refusees): les commandes créées {"id", "id_boutique",
+    "total", "lignes"}, vide si aucune ligne n'a pu être réservée, et les noms des
+    produits refusés faute de stock.
     """
     panier = obtenir_panier(session)
     if not panier["items"]:
-        return None
+        return [], []
 
-    total = panier["total"]
+    # Réservation, en-têtes et lignes validés ensemble: jamais de commande à moitié écrite
+    with transaction():
+        # Réserver d'abord: accepté ou refusé immédiatement pour chaque ligne
+        acceptees, refusees = reserver_stocks(
+            {item["id"]: item["quantite"] for item in panier["items"]}
+        )
 
-    # Créer la commande
-    id_commande = inserer_commande(
-        id_client=id_client,
-        id_boutique=id_boutique,
-        total=total,
-        methode_paiement=methode_paiement,
-    )
+        # Regrouper les lignes acceptées par boutique, boutiques par id croissant
+        # (ordre de verrouillage commun à tous les paniers, voir inserer_commandes)
+        par_boutique = {}
+        for item in panier["items"]:
+            if item["id"] in acceptees:
+                par_boutique.setdefault(item["id_boutique"], []).append(item)
+        commandes = [
+            {
+                "id_boutique": id_boutique,
+                "total": sum(item["sous_total"] for item in items),
+                "nb_unites": sum(item["quantite"] for item in items),
+                "lignes": [(item["id"], item["quantite"], item["prix"]) for item in items],
+            }
+            for id_boutique, items in sorted(par_boutique.items())
+        ]
+        # En-têtes, puis lignes, compteurs et cumuls de toutes les boutiques en lot
+        ids = inserer_commandes(id_client, commandes, methode_paiement)
 
-    # Ajouter les lignes
-    for item in panier["items"]:
-        inserer_ligne_commande(
-            id_commande=id_commande,
-            id_produit=item["id"],
-            quantite=item["quantite"],
-            prix_unitaire=item["prix"],
-        )
+    if ids:
+        invalider_boutiques_populaires()
+
+    # Vider le panier des lignes commandées, garder les lignes refusées
+    session["panier"] = {
+        id_prod: qty for id_prod, qty in session.get("panier", {}).items() if int(id_prod) in refusees
+    }
 
-    # Vider le panier
-    session["panier"] = {}
+    commandes_creees = [
+        {
+            "id": id_commande,
+            "id_boutique": commande["id_boutique"],
+            "total": commande["total"],
+            "lignes": commande["lignes"],
+        }
+        for id_commande, commande in zip(ids, commandes)
+    ]
+    return commandes_creees, [item["nom"] for item in panier["items"] if item["id"] in refusees]
 
-    return id_commande
+
+def annuler_commandes_panier(session, commandes):
+    """
+    Paiement échoué: annuler les commandes de passer_commande (stock rendu, commandes
+    marquées annulées) et remettre leurs lignes dans le panier.
+    """
+    annulees = set(annuler_commandes_impayees([commande["id"] for commande in commandes]))
+    panier = session.get("panier", {})
+    for commande in commandes:
+        if commande["id"] in annulees:
+            for id_produit, quantite, _ in commande["lignes"]:
+                panier[str(id_produit)] = panier.get(str(id_produit), 0) + quantite
+    session["panier"] = panier
+    if annulees:
+        invalider_boutiques_populaires()
 
 
-def traiter_paiement(id_commande, methode, details_paiement):
+def traiter_paiement(ids_commandes, methode, details_paiement):
     """
-    Traite le paiement selon la méthode choisie.
+    Traite le paiement selon la méthode choisie: un seul paiement pour toutes les
+    commandes d'un panier (une par boutique).
     """
     if methode == "mobile_money":
         numero = details_paiement.get("numero")
@@ -152,18 +269,26 @@ def traiter_paiement(id_commande, methode, details_paiement):
     return False
 
 
-def obtenir_commandes_client(id_client):
+def obtenir_commandes_client(id_client, limite=TAILLE_PAGE, apres=None):
     """
-    Récupère l'historique des commandes du client.
+    Récupère une page de l'historique des commandes du client, par (date_commande, id)
+    décroissants. Retourne (commandes, curseur_suivant).
     """
     requete = """
         SELECT c.*, b.nom_boutique
         FROM commandes c
         JOIN boutiques b ON c.id_boutique = b.id
         WHERE c.id_client = %s
-        ORDER BY c.date_commande DESC
     """
-    return executer_requete_sql(requete, (id_client,), fetchall=True)
+    params = [id_client]
+    position = decoder_curseur_commande(apres)
+    if position is not None:
+        requete += " AND (c.date_commande < %s OR (c.date_commande = %s AND c.id < %s))"
+        params.extend([position[0], position[0], position[1]])
+    requete += " ORDER BY c.date_commande DESC, c.id DESC LIMIT %s"
+    params.append(limite + 1)
+    commandes = executer_requete_sql(requete, tuple(params), fetchall=True)
+    return decouper_page(commandes, limite, encoder_curseur_commande)
 
 
 def obtenir_details_commande(id_commande, id_client):
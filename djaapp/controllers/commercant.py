@@ -8,15 +8,43 @@ from models.bdd import (
     selectionner_boutique_par_id,
     selectionner_produits_par_boutique,
     inserer_produit,
+    inserer_ou_mettre_a_jour_produits,
     mettre_a_jour_stock_produit,
+    selectionner_ids_produits_commercant,
+    mettre_a_jour_produits_en_lot,
+    ajuster_prix_categorie,
     selectionner_commercant_par_email,
     mettre_a_jour_commande_statut,
     inserer_notification,
     executer_requete_sql,
+    iterer_requete_sql,
+    transaction,
+    selectionner_ventes_journalieres,
 )
+from controllers.client import invalider_boutiques_populaires
 from utilitaires.qr import generer_qr_boutique
+from utilitaires.pagination import (
+    TAILLE_PAGE,
+    decouper_page,
+    encoder_curseur_commande,
+    decoder_curseur_commande,
+    encoder_curseur_produit,
+    decoder_curseur_produit,
+)
 from utilitaires.notifications import envoyer_notification
+from utilitaires.import_catalogue import (
+    PRIX_MAX,
+    TAILLE_LOT_IMPORT,
+    ERREURS_MAX_RAPPORT,
+    valider_ligne_produit,
+)
+from mysql.connector import Error
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+import csv
+import io
 import os
+import zlib
 
 
 def creer_boutique(id_commercant, nom_boutique, description=None):
@@ -31,6 +59,9 @@ def creer_boutique(id_commercant, nom_boutique, description=None):
         description=description,
     )
 
+    # La nouvelle boutique peut entrer dans le classement des populaires
+    invalider_boutiques_populaires()
+
     # Générer le QR code pointant vers la page boutique
     url_boutique = f"/boutique/{id_boutique}"
     chemin_qr = generer_qr_boutique(url_boutique, id_boutique)
@@ -56,72 +87,219 @@ def ajouter_produit(id_boutique, nom, description, prix, stock, categorie=None,
     )
 
 
-def obtenir_statistiques_commercant(id_commercant):
-    """
-    Calcule les statistiques pour le tableau de bord commerçant.
-    Retourne un dict avec ventes_jour, ventes_semaine, nb_commandes, nb_produits.
+def importer_catalogue(id_commercant, id_boutique, lignes, taille_lot=TAILLE_LOT_IMPORT):
     """
-    # Ventes du jour
-    requete_ventes_jour = """
-        SELECT COALESCE(SUM(c.total), 0) AS ventes_jour
-        FROM commandes c
-        JOIN boutiques b ON c.id_boutique = b.id
-        WHERE b.id_commercant = %s AND DATE(c.date_commande) = CURDATE()
+    Importe des produits (lignes brutes, voir utilitaires.import_catalogue) dans une
+    boutique du commerçant. Les lignes sont validées puis écrites par lots de
+    `taille_lot`, un INSERT multi-lignes par transaction; un SKU déjà présent dans
+    la boutique met le produit à jour.
+
+    Retourne un rapport: lignes lues, produits importés, erreurs par ligne
+    ({"ligne": n°, "erreur": message}, n° 1 = premier produit du fichier) et
+    erreur_fichier si la lecture s'est arrêtée sur un contenu illisible (les lots
+    précédents restent importés).
     """
-    ventes_jour = executer_requete_sql(requete_ventes_jour, (id_commercant,), fetchone=True)["ventes_jour"]
+    boutique = selectionner_boutique_par_id(id_boutique)
+    if not boutique or boutique["id_commercant"] != id_commercant:
+        raise ValueError("Boutique introuvable.")
 
-    # Ventes de la semaine
-    requete_ventes_semaine = """
-        SELECT COALESCE(SUM(c.total), 0) AS ventes_semaine
-        FROM commandes c
-        JOIN boutiques b ON c.id_boutique = b.id
-        WHERE b.id_commercant = %s AND YEARWEEK(c.date_commande) = YEARWEEK(CURDATE())
+    rapport = {"lignes": 0, "importees": 0, "nb_erreurs": 0, "erreurs": [], "erreur_fichier": None}
+
+    def noter_erreur(numero, message):
+        rapport["nb_erreurs"] += 1
+        if len(rapport["erreurs"]) < ERREURS_MAX_RAPPORT:
+            rapport["erreurs"].append({"ligne": numero, "erreur": message})
+
+    def ecrire(lot):
+        try:
+            with transaction():
+                inserer_ou_mettre_a_jour_produits(id_boutique, [produit for _, produit in lot])
+            rapport["importees"] += len(lot)
+        except Error as e:
+            for numero, _ in lot:
+                noter_erreur(numero, f"lot refusé par la base: {e}")
+
+    lot = []
+    try:
+        for numero, brute in enumerate(lignes, 1):
+            rapport["lignes"] = numero
+            produit, erreur = valider_ligne_produit(brute)
+            if erreur:
+                noter_erreur(numero, erreur)
+                continue
+            lot.append((numero, produit))
+            if len(lot) >= taille_lot:
+                ecrire(lot)
+                lot = []
+    except (ValueError, csv.Error) as e:
+        # UnicodeDecodeError est une ValueError
+        rapport["erreur_fichier"] = str(e)
+    if lot:
+        ecrire(lot)
+    return rapport
+
+
+# Modifications de produits acceptées par appel de mettre_a_jour_inventaire
+TAILLE_MAX_LOT_INVENTAIRE = 1000
+
+
+def _entier(valeur):
+    """Vrai pour un entier JSON (bool exclu: True est un int en Python)."""
+    return isinstance(valeur, int) and not isinstance(valeur, bool)
+
+
+def _decimal(valeur):
+    """Decimal fini depuis un nombre ou un texte JSON, None si invalide."""
+    try:
+        nombre = Decimal(str(valeur))
+    except InvalidOperation:
+        return None
+    return nombre if nombre.is_finite() else None
+
+
+def mettre_a_jour_inventaire(id_commercant, produits=None, categories=None):
     """
-    ventes_semaine = executer_requete_sql(requete_ventes_semaine, (id_commercant,), fetchone=True)["ventes_semaine"]
+    Applique en une transaction des modifications de stock et de prix:
+    - produits: [{"id_produit", "stock"?, "prix"?}], écrits en un seul UPDATE;
+    - categories: [{"categorie", "pourcentage", "id_boutique"?}], variation de prix en %.
+    Tous les produits doivent appartenir au commerçant (vérifié en une requête).
 
-    # Nombre de commandes
-    requete_nb_commandes = """
-        SELECT COUNT(*) AS nb_commandes
-        FROM commandes c
-        JOIN boutiques b ON c.id_boutique = b.id
-        WHERE b.id_commercant = %s
+    Lève ValueError (message, liste d'erreurs) si le lot est invalide: rien n'est écrit.
+    Retourne {"produits_modifies", "prix_ajustes"}.
     """
-    nb_commandes = executer_requete_sql(requete_nb_commandes, (id_commercant,), fetchone=True)["nb_commandes"]
+    produits = produits or []
+    categories = categories or []
+    erreurs = []
+    if not isinstance(produits, list) or not isinstance(categories, list):
+        raise ValueError("produits et categories doivent être des listes.", [])
+    if len(produits) > TAILLE_MAX_LOT_INVENTAIRE:
+        raise ValueError(f"Au plus {TAILLE_MAX_LOT_INVENTAIRE} produits par lot.", [])
 
-    # Nombre de produits
-    requete_nb_produits = """
-        SELECT COUNT(*) AS nb_produits
-        FROM produits p
-        JOIN boutiques b ON p.id_boutique = b.id
+    modifications = {}
+    for i, element in enumerate(produits):
+        if not isinstance(element, dict) or not _entier(element.get("id_produit")):
+            erreurs.append({"index": i, "erreur": "id_produit entier attendu"})
+            continue
+        modification = {}
+        if element.get("stock") is not None:
+            stock = element["stock"]
+            if not _entier(stock) or stock < 0:
+                erreurs.append({"index": i, "erreur": "stock invalide"})
+                continue
+            modification["stock"] = stock
+        if element.get("prix") is not None:
+            prix = _decimal(element["prix"])
+            if prix is None or not 0 <= prix <= PRIX_MAX:
+                erreurs.append({"index": i, "erreur": "prix invalide"})
+                continue
+            modification["prix"] = prix.quantize(Decimal("0.01"))
+        if not modification:
+            erreurs.append({"index": i, "erreur": "stock ou prix attendu"})
+            continue
+        modifications[element["id_produit"]] = modification
+
+    ajustements = []
+    for i, element in enumerate(categories):
+        categorie = element.get("categorie") if isinstance(element, dict) else None
+        if not isinstance(categorie, str) or not categorie.strip():
+            erreurs.append({"categorie_index": i, "erreur": "categorie attendue"})
+            continue
+        pourcentage = _decimal(element.get("pourcentage"))
+        if pourcentage is None or not -100 < pourcentage <= 1000:
+            erreurs.append({"categorie_index": i, "erreur": "pourcentage invalide (entre -100 exclu et 1000)"})
+            continue
+        id_boutique = element.get("id_boutique")
+        if id_boutique is not None and not _entier(id_boutique):
+            erreurs.append({"categorie_index": i, "erreur": "id_boutique entier attendu"})
+            continue
+        ajustements.append((categorie.strip(), pourcentage, id_boutique))
+
+    if not erreurs and modifications:
+        possedes = selectionner_ids_produits_commercant(id_commercant, list(modifications))
+        erreurs.extend(
+            {"id_produit": id_produit, "erreur": "produit introuvable"}
+            for id_produit in modifications if id_produit not in possedes
+        )
+    if erreurs:
+        raise ValueError("Lot invalide, aucune modification appliquée.", erreurs)
+
+    with transaction():
+        produits_modifies = mettre_a_jour_produits_en_lot(modifications) if modifications else 0
+        prix_ajustes = sum(
+            ajuster_prix_categorie(id_commercant, categorie, pourcentage, id_boutique)
+            for categorie, pourcentage, id_boutique in ajustements
+        )
+    return {"produits_modifies": produits_modifies, "prix_ajustes": prix_ajustes}
+
+
+def obtenir_statistiques_commercant(id_commercant):
+    """
+    Calcule les statistiques pour le tableau de bord commerçant en une seule requête.
+    Retourne un dict avec ventes_jour, ventes_semaine, nb_commandes, nb_produits.
+    """
+    # Plages sur date_commande (et non DATE()/YEARWEEK() appliqués à la colonne) pour
+    # parcourir idx_commandes_boutique_date; semaine commençant le dimanche comme YEARWEEK().
+    # nb_commandes vient des compteurs par boutique plutôt que d'un COUNT sur tout l'historique.
+    requete = """
+        SELECT
+            COALESCE(SUM(CASE WHEN c.date_commande >= CURDATE() THEN c.total END), 0) AS ventes_jour,
+            COALESCE(SUM(c.total), 0) AS ventes_semaine,
+            (
+                SELECT COALESCE(SUM(cb.nb_commandes), 0)
+                FROM compteurs_boutiques cb
+                JOIN boutiques bc ON cb.id_boutique = bc.id
+                WHERE bc.id_commercant = %s
+            ) AS nb_commandes,
+            (
+                SELECT COUNT(*)
+                FROM produits p
+                JOIN boutiques bp ON p.id_boutique = bp.id
+                WHERE bp.id_commercant = %s
+            ) AS nb_produits
+        FROM boutiques b
+        LEFT JOIN commandes c ON c.id_boutique = b.id
+            AND c.date_commande >= CURDATE() - INTERVAL (DAYOFWEEK(CURDATE()) - 1) DAY
+            AND c.date_commande < CURDATE() + INTERVAL 1 DAY
         WHERE b.id_commercant = %s
     """
-    nb_produits = executer_requete_sql(requete_nb_produits, (id_commercant,), fetchone=True)["nb_produits"]
+    stats = executer_requete_sql(
+        requete, (id_commercant, id_commercant, id_commercant), fetchone=True
+    )
 
     return {
-        "ventes_jour": float(ventes_jour),
-        "ventes_semaine": float(ventes_semaine),
-        "nb_commandes": nb_commandes,
-        "nb_produits": nb_produits,
+        "ventes_jour": float(stats["ventes_jour"]),
+        "ventes_semaine": float(stats["ventes_semaine"]),
+        "nb_commandes": int(stats["nb_commandes"]),
+        "nb_produits": stats["nb_produits"],
     }
 
 
-def obtenir_produits_commercant(id_commercant):
+def obtenir_produits_commercant(id_commercant, limite=TAILLE_PAGE, apres=None):
     """
-    Récupère tous les produits des boutiques du commerçant.
+    Récupère une page des produits des boutiques du commerçant, du plus récent au plus ancien.
+    `apres` est le curseur de la page précédente. Retourne (produits, curseur_suivant).
     """
     requete = """
         SELECT p.*, b.nom_boutique
         FROM produits p
         JOIN boutiques b ON p.id_boutique = b.id
         WHERE b.id_commercant = %s
-        ORDER BY p.id DESC
     """
-    return executer_requete_sql(requete, (id_commercant,), fetchall=True)
+    params = [id_commercant]
+    id_apres = decoder_curseur_produit(apres)
+    if id_apres is not None:
+        requete += " AND p.id < %s"
+        params.append(id_apres)
+    requete += " ORDER BY p.id DESC LIMIT %s"
+    params.append(limite + 1)
+    produits = executer_requete_sql(requete, tuple(params), fetchall=True)
+    return decouper_page(produits, limite, encoder_curseur_produit)
 
 
-def obtenir_commandes_commercant(id_commercant):
+def obtenir_commandes_commercant(id_commercant, limite=TAILLE_PAGE, apres=None):
     """
-    Récupère toutes les commandes des boutiques du commerçant.
+    Récupère une page des commandes des boutiques du commerçant, par (date_commande, id)
+    décroissants. Retourne (commandes, curseur_suivant).
     """
     requete = """
         SELECT c.*, cl.nom AS nom_client, b.nom_boutique
@@ -129,9 +307,16 @@ def obtenir_commandes_commercant(id_commercant):
         JOIN clients cl ON c.id_client = cl.id
         JOIN boutiques b ON c.id_boutique = b.id
         WHERE b.id_commercant = %s
-        ORDER BY c.date_commande DESC
     """
-    return executer_requete_sql(requete, (id_commercant,), fetchall=True)
+    params = [id_commercant]
+    position = decoder_curseur_commande(apres)
+    if position is not None:
+        requete += " AND (c.date_commande < %s OR (c.date_commande = %s AND c.id < %s))"
+        params.extend([position[0], position[0], position[1]])
+    requete += " ORDER BY c.date_commande DESC, c.id DESC LIMIT %s"
+    params.append(limite + 1)
+    commandes = executer_requete_sql(requete, tuple(params), fetchall=True)
+    return decouper_page(commandes, limite, encoder_curseur_commande)
 
 
 def traiter_commande(id_commande, action):
@@ -145,17 +330,16 @@ def traiter_commande(id_commande, action):
     else:
         return False
 
-    mettre_a_jour_commande_statut(id_commande, statut)
+    # Statut, compteurs et notification en base validés ensemble
+    with transaction():
+        commande = mettre_a_jour_commande_statut(id_commande, statut)
+        if commande:
+            message = f"Votre commande #{id_commande} a été marquée comme {statut}."
+            inserer_notification(commande["id_client"], "commande", message)
 
-    # Récupérer id_client pour notification
-    requete_client = "SELECT id_client FROM commandes WHERE id = %s"
-    commande = executer_requete_sql(requete_client, (id_commande,), fetchone=True)
     if commande:
-        id_client = commande["id_client"]
-        message = f"Votre commande #{id_commande} a été marquée comme {statut}."
-        inserer_notification(id_client, "commande", message)
-        # Envoyer notification réelle si configuré
-        envoyer_notification(id_client, "commande", message)
+        # Envoyer notification réelle si configuré (après validation, hors transaction)
+        envoyer_notification(commande["id_client"], "commande", message)
 
     return True
 
@@ -171,20 +355,155 @@ def obtenir_boutiques_commercant(id_commercant):
 def obtenir_statistiques_boutiques(id_commercant):
     """
     Récupère les statistiques détaillées des boutiques du commerçant.
+    Produits comptés dans une sous-requête agrégée par boutique, commandes et ventes
+    lues dans compteurs_boutiques: aucune jointure produits x commandes, donc un
+    total_ventes exact et un coût linéaire.
     """
     requete = """
         SELECT
             b.id,
             b.nom_boutique,
             b.description,
-            COUNT(DISTINCT p.id) AS nb_produits,
-            COUNT(DISTINCT c.id) AS nb_commandes,
-            COALESCE(SUM(c.total), 0) AS total_ventes
+            COALESCE(p.nb_produits, 0) AS nb_produits,
+            COALESCE(cb.nb_commandes, 0) AS nb_commandes,
+            COALESCE(cb.total_ventes, 0) AS total_ventes
         FROM boutiques b
-        LEFT JOIN produits p ON p.id_boutique = b.id
-        LEFT JOIN commandes c ON c.id_boutique = b.id
+        LEFT JOIN (
+            SELECT pr.id_boutique, COUNT(*) AS nb_produits
+            FROM produits pr
+            JOIN boutiques bp ON pr.id_boutique = bp.id
+            WHERE bp.id_commercant = %s
+            GROUP BY pr.id_boutique
+        ) p ON p.id_boutique = b.id
+        LEFT JOIN compteurs_boutiques cb ON cb.id_boutique = b.id
         WHERE b.id_commercant = %s
-        GROUP BY b.id, b.nom_boutique, b.description
         ORDER BY b.date_creation DESC
     """
-    return executer_requete_sql(requete, (id_commercant,), fetchall=True)
+    return executer_requete_sql(requete, (id_commercant, id_commercant), fetchall=True)
+
+
+def _debut_semaine(jour):
+    """Dimanche de la semaine de `jour` (semaines de YEARWEEK(), mode 0)."""
+    return jour - timedelta(days=(jour.weekday() + 1) % 7)
+
+
+def _debut_mois(jour):
+    """Premier jour du mois de `jour`."""
+    return jour.replace(day=1)
+
+
+def obtenir_ventes_graphique(id_commercant, periode="jour", id_boutique=None):
+    """
+    Séries de ventes pour les graphiques: 30 derniers jours, 12 dernières semaines
+    ou 12 derniers mois. Lues uniquement dans ventes_journalieres, le coût ne dépend
+    pas de l'ancienneté de la boutique. Les périodes sans vente valent 0.
+    """
+    aujourd_hui = date.today()
+    if periode == "semaine":
+        debut = _debut_semaine(aujourd_hui)
+        periodes = [debut - timedelta(weeks=n) for n in range(11, -1, -1)]
+        regrouper = _debut_semaine
+    elif periode == "mois":
+        periodes = []
+        annee, mois = aujourd_hui.year, aujourd_hui.month
+        for _ in range(12):
+            periodes.insert(0, date(annee, mois, 1))
+            annee, mois = (annee, mois - 1) if mois > 1 else (annee - 1, 12)
+        regrouper = _debut_mois
+    else:
+        periode = "jour"
+        periodes = [aujourd_hui - timedelta(days=n) for n in range(29, -1, -1)]
+        regrouper = None
+
+    points = {
+        p: {"periode": p.isoformat(), "nb_commandes": 0, "chiffre_affaires": 0.0, "nb_unites": 0}
+        for p in periodes
+    }
+    for ligne in selectionner_ventes_journalieres(id_commercant, periodes[0], id_boutique):
+        point = points.get(regrouper(ligne["jour"]) if regrouper else ligne["jour"])
+        if point:
+            point["nb_commandes"] += int(ligne["nb_commandes"])
+            point["chiffre_affaires"] += float(ligne["chiffre_affaires"])
+            point["nb_unites"] += int(ligne["nb_unites"])
+
+    return {"periode": periode, "points": list(points.values())}
+
+
+COLONNES_EXPORT_COMMANDES = (
+    "id_commande", "date_commande", "boutique", "statut", "methode_paiement", "total",
+    "client", "telephone_client", "id_produit", "produit", "quantite", "prix_unitaire",
+)
+
+# Lignes CSV accumulées avant chaque envoi au client
+LIGNES_PAR_MORCEAU_EXPORT = 500
+
+
+def exporter_commandes_csv(id_commercant, depuis=None, jusqu_a=None, id_boutique=None, compresser=False):
+    """
+    Générateur de morceaux (bytes) du CSV des commandes du commerçant: une ligne par
+    ligne de commande, commandes sans ligne incluses. Filtres optionnels sur les
+    dates (incluses) et la boutique. Les lignes sont lues en flux
+    (iterer_requete_sql) et envoyées par morceaux: la mémoire reste constante quel
+    que soit l'historique. compresser=True produit du gzip.
+    """
+    requete = """
+        SELECT c.id AS id_commande, c.date_commande, b.nom_boutique, c.statut,
+               c.methode_paiement, c.total, cl.nom AS nom_client, cl.telephone,
+               l.id_produit, p.nom AS nom_produit, l.quantite, l.prix_unitaire
+        FROM commandes c
+        JOIN boutiques b ON c.id_boutique = b.id
+        JOIN clients cl ON c.id_client = cl.id
+        LEFT JOIN lignes_commandes l ON l.id_commande = c.id
+        LEFT JOIN produits p ON l.id_produit = p.id
+        WHERE b.id_commercant = %s
+    """
+    params = [id_commercant]
+    if id_boutique is not None:
+        requete += " AND c.id_boutique = %s"
+        params.append(id_boutique)
+    if depuis is not None:
+        requete += " AND c.date_commande >= %s"
+        params.append(depuis)
+    if jusqu_a is not None:
+        requete += " AND c.date_commande < %s"
+        params.append(jusqu_a + timedelta(days=1))
+    requete += " ORDER BY c.date_commande, c.id, l.id"
+
+    # wbits=31: en-tête et somme de contrôle gzip
+    compresseur = zlib.compressobj(wbits=31) if compresser else None
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon)
+
+    def vider():
+        donnees = tampon.getvalue().encode("utf-8")
+        tampon.seek(0)
+        tampon.truncate()
+        return compresseur.compress(donnees) if compresseur else donnees
+
+    # BOM: accents lisibles à l'ouverture dans un tableur
+    tampon.write("\ufeff")
+    ecrivain.writerow(COLONNES_EXPORT_COMMANDES)
+    for n, ligne in enumerate(iterer_requete_sql(requete, tuple(params)), 1):
+        ecrivain.writerow((
+            ligne["id_commande"],
+            ligne["date_commande"].strftime("%Y-%m-%d %H:%M:%S"),
+            ligne["nom_boutique"],
+            ligne["statut"],
+            ligne["methode_paiement"],
+            ligne["total"],
+            ligne["nom_client"],
+            ligne["telephone"],
+            ligne["id_produit"],
+            ligne["nom_produit"],
+            ligne["quantite"],
+            ligne["prix_unitaire"],
+        ))
+        if n % LIGNES_PAR_MORCEAU_EXPORT == 0:
+            morceau = vider()
+            if morceau:
+                yield morceau
+    morceau = vider()
+    if compresseur:
+        morceau += compresseur.flush()
+    if morceau:
+        yield morceau
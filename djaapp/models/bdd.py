@@ -3,20 +3,612 @@ Module d'accès MySQL procédural pour Djaapp.
 Toutes les fonctions sont nommées en français et utilisent des requêtes paramétrées.
 """
 
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import Error
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from flask import g, has_app_context, has_request_context, session
+
+from config import DB_CONFIG, DB_TAILLE_LOT_FLUX, DB_FENETRE_PRIMAIRE_APRES_ECRITURE
+
+
+# Clés de DB_CONFIG propres à Djaapp, à ne pas transmettre à mysql.connector
+CLES_HORS_CONNECTEUR = ("pool", "replicas")
 
-from config import DB_CONFIG
+
+def parametres_connexion(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Retourner les paramètres de DB_CONFIG acceptés par mysql.connector.connect."""
+    config = DB_CONFIG if config is None else config
+    return {cle: valeur for cle, valeur in config.items() if cle not in CLES_HORS_CONNECTEUR}
+
+
+# ---------------------------------------------
+# Pool de connexions
+# ---------------------------------------------
+
+class PoolConnexions:
+    """
+    Pool de connexions MySQL partagé entre les threads d'un processus.
+
+    - taille: connexions conservées ouvertes au repos
+    - debordement: connexions supplémentaires autorisées en pic, fermées à leur retour
+    - delai_attente: secondes d'attente avant PoolError quand tout est emprunté
+    - pre_ping: vérifier la connexion avant de la prêter
+    - recyclage: âge maximal (secondes) d'une connexion, -1 pour désactiver
+    - cache_instructions: instructions préparées côté serveur gardées par connexion
+      (LRU), 0 pour désactiver. Le total taille x cache_instructions doit rester
+      sous max_prepared_stmt_count du serveur.
+    """
+
+    def __init__(
+        self,
+        parametres: Dict[str, Any],
+        taille: int = 5,
+        debordement: int = 10,
+        delai_attente: float = 10.0,
+        pre_ping: bool = True,
+        recyclage: int = 3600,
+        cache_instructions: int = 32,
+    ):
+        self.parametres = parametres
+        self.taille = max(0, int(taille))
+        self.debordement = max(0, int(debordement))
+        self.delai_attente = float(delai_attente)
+        self.pre_ping = bool(pre_ping)
+        self.recyclage = int(recyclage)
+        self.cache_instructions = max(0, int(cache_instructions))
+
+        self._condition = threading.Condition()
+        self._libres = deque()
+        self._dates_creation: Dict[int, float] = {}
+        # id(connexion) -> OrderedDict(requête -> curseur préparé), utilisé par un seul emprunteur à la fois
+        self._instructions: Dict[int, "OrderedDict[str, Any]"] = {}
+        self._ouvertes = 0
+        self._en_attente = 0
+        self._compteurs = {
+            "emprunts": 0,
+            "creations": 0,
+            "recyclages": 0,
+            "pings_echoues": 0,
+            "attentes": 0,
+            "expirations": 0,
+            "instructions_reutilisees": 0,
+            "instructions_preparees": 0,
+            "instructions_evincees": 0,
+        }
+
+    def obtenir(self, delai: Optional[float] = None):
+        """
+        Emprunter une connexion, à rendre ensuite avec rendre(). delai: secondes
+        d'attente avant PoolError (delai_attente par défaut, 0 pour ne pas attendre).
+        """
+        delai = self.delai_attente if delai is None else max(0.0, float(delai))
+        echeance = time.monotonic() + delai
+        with self._condition:
+            self._compteurs["emprunts"] += 1
+            a_attendu = False
+            while True:
+                if self._libres:
+                    # LIFO: la connexion la plus récemment utilisée est la plus "chaude"
+                    conn = self._libres.pop()
+                    break
+                if self._ouvertes < self.taille + self.debordement:
+                    # Réserver la place puis ouvrir hors du verrou
+                    self._ouvertes += 1
+                    conn = None
+                    break
+                restant = echeance - time.monotonic()
+                if restant <= 0:
+                    self._compteurs["expirations"] += 1
+                    raise PoolError(
+                        f"Aucune connexion disponible après {delai}s "
+                        f"({self._ouvertes} ouvertes)"
+                    )
+                if not a_attendu:
+                    self._compteurs["attentes"] += 1
+                    a_attendu = True
+                self._en_attente += 1
+                try:
+                    self._condition.wait(restant)
+                finally:
+                    self._en_attente -= 1
+
+        if conn is None:
+            return self._creer()
+        return self._verifier(conn)
+
+    def rendre(self, conn, invalide: bool = False) -> None:
+        """Rendre une connexion empruntée. invalide=True la ferme au lieu de la recycler."""
+        if not invalide:
+            try:
+                # Ne jamais prêter une connexion avec une transaction entamée
+                if conn.in_transaction:
+                    conn.rollback()
+            except Error:
+                invalide = True
+
+        with self._condition:
+            garder = not invalide and len(self._libres) < self.taille
+            if garder:
+                self._libres.append(conn)
+            else:
+                self._ouvertes -= 1
+            self._condition.notify()
+
+        if not garder:
+            self._fermer(conn)
+
+    def curseur_prepare(self, conn, requete: str):
+        """
+        Curseur préparé (dictionnaire) de `requete` sur une connexion empruntée.
+        Chaque curseur garde son instruction préparée côté serveur: le même curseur
+        est réutilisé pour la même requête tant qu'il reste dans le cache LRU de
+        la connexion. Le curseur évincé est fermé, ce qui libère l'instruction.
+        """
+        cache = self._instructions.setdefault(id(conn), OrderedDict())
+        curseur = cache.get(requete)
+        if curseur is not None:
+            cache.move_to_end(requete)
+            self._compter("instructions_reutilisees")
+            return curseur
+
+        curseur = conn.cursor(prepared=True, dictionary=True)
+        cache[requete] = curseur
+        self._compter("instructions_preparees")
+        while len(cache) > self.cache_instructions:
+            _, evince = cache.popitem(last=False)
+            self._compter("instructions_evincees")
+            try:
+                evince.close()
+            except Exception:
+                pass
+        return curseur
+
+    def oublier_instruction(self, conn, requete: str) -> None:
+        """Retirer (et fermer) le curseur préparé d'une requête, après une erreur par exemple."""
+        curseur = self._instructions.get(id(conn), {}).pop(requete, None)
+        if curseur is not None:
+            try:
+                curseur.close()
+            except Exception:
+                pass
+
+    def statistiques(self) -> Dict[str, Any]:
+        """Photographie de l'état du pool (exposée par /sante)."""
+        with self._condition:
+            stats = {
+                "taille": self.taille,
+                "debordement": self.debordement,
+                "ouvertes": self._ouvertes,
+                "libres": len(self._libres),
+                "empruntees": self._ouvertes - len(self._libres),
+                "en_attente": self._en_attente,
+            }
+            stats.update(self._compteurs)
+        return stats
+
+    def fermer(self) -> None:
+        """Fermer toutes les connexions au repos."""
+        with self._condition:
+            libres = list(self._libres)
+            self._libres.clear()
+            self._ouvertes -= len(libres)
+            self._condition.notify_all()
+        for conn in libres:
+            self._fermer(conn)
+
+    def _compter(self, compteur: str) -> None:
+        with self._condition:
+            self._compteurs[compteur] += 1
+
+    def _creer(self):
+        """Ouvrir une connexion pour une place déjà réservée dans _ouvertes."""
+        try:
+            conn = mysql.connector.connect(**self.parametres)
+        except Exception:
+            with self._condition:
+                self._ouvertes -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._compteurs["creations"] += 1
+            self._dates_creation[id(conn)] = time.monotonic()
+        return conn
+
+    def _verifier(self, conn):
+        """Recycler une connexion trop ancienne ou morte avant de la prêter."""
+        date_creation = self._dates_creation.get(id(conn), 0.0)
+        if self.recyclage >= 0 and time.monotonic() - date_creation > self.recyclage:
+            with self._condition:
+                self._compteurs["recyclages"] += 1
+            self._fermer(conn)
+            return self._creer()
+
+        if self.pre_ping and not conn.is_connected():
+            with self._condition:
+                self._compteurs["pings_echoues"] += 1
+            self._fermer(conn)
+            return self._creer()
+        return conn
+
+    def _fermer(self, conn) -> None:
+        with self._condition:
+            self._dates_creation.pop(id(conn), None)
+            # Les instructions préparées disparaissent avec la session serveur
+            self._instructions.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool: Optional[PoolConnexions] = None
+_pid_pool: Optional[int] = None
+_verrou_pool = threading.Lock()
+
+
+def obtenir_pool() -> PoolConnexions:
+    """
+    Retourner le pool du processus courant, créé à la demande depuis DB_CONFIG["pool"].
+    Après un fork (workers gunicorn), un nouveau pool est créé: les sockets hérités
+    du parent sont abandonnés sans être fermés pour ne pas couper ses connexions.
+    """
+    global _pool, _pid_pool
+    if _pool is None or _pid_pool != os.getpid():
+        with _verrou_pool:
+            if _pool is None or _pid_pool != os.getpid():
+                _pool = PoolConnexions(parametres_connexion(), **DB_CONFIG.get("pool", {}))
+                _pid_pool = os.getpid()
+    return _pool
+
+
+def statistiques_pool() -> Dict[str, Any]:
+    """Statistiques du pool de connexions du processus courant."""
+    return obtenir_pool().statistiques()
+
+
+# ---------------------------------------------
+# Réplicas en lecture
+# ---------------------------------------------
+
+# Clé de session: horodatage de la dernière écriture de l'utilisateur
+CLE_SESSION_ECRITURE = "_bdd_derniere_ecriture"
+
+# Secondes pendant lesquelles un réplica injoignable n'est plus sollicité
+DELAI_REPLICA_EN_ECHEC = 30.0
+
+# Lectures routables vers un réplica: SELECT sans verrou de lignes
+_RE_LECTURE = re.compile(r"^\s*\(?\s*SELECT\b", re.IGNORECASE)
+_RE_VERROU = re.compile(r"\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b", re.IGNORECASE)
+
+_pools_replicas: List[PoolConnexions] = []
+_pid_replicas: Optional[int] = None
+_prochain_replica = 0
+_replicas_en_echec: Dict[int, float] = {}
+_verrou_routage = threading.Lock()
+_compteurs_routage = {
+    "lectures_replica": 0,
+    "lectures_primaire": 0,
+    "lectures_apres_ecriture": 0,
+    "replicas_indisponibles": 0,
+    "replicas_satures": 0,
+    "ecritures": 0,
+}
+
+
+def obtenir_pools_replicas() -> List[PoolConnexions]:
+    """Pools des réplicas de DB_CONFIG["replicas"] pour le processus courant (liste vide sans réplica)."""
+    global _pools_replicas, _pid_replicas
+    if _pid_replicas != os.getpid():
+        with _verrou_routage:
+            if _pid_replicas != os.getpid():
+                base = parametres_connexion()
+                _pools_replicas = [
+                    PoolConnexions({**base, **replica}, **DB_CONFIG.get("pool", {}))
+                    for replica in DB_CONFIG.get("replicas") or []
+                ]
+                _replicas_en_echec.clear()
+                _pid_replicas = os.getpid()
+    return _pools_replicas
+
+
+def _compter_routage(compteur: str) -> None:
+    with _verrou_routage:
+        _compteurs_routage[compteur] += 1
+
+
+def statistiques_routage() -> Dict[str, Any]:
+    """Compteurs de routage primaire/réplicas du processus et état des pools de réplicas (/sante)."""
+    with _verrou_routage:
+        stats = dict(_compteurs_routage)
+    stats["replicas"] = [pool.statistiques() for pool in obtenir_pools_replicas()]
+    return stats
+
+
+def _noter_ecriture() -> None:
+    """
+    Après une écriture, les lectures restent sur le primaire jusqu'à la fin de la
+    requête et, pour la session, pendant DB_FENETRE_PRIMAIRE_APRES_ECRITURE secondes.
+    La marque n'est posée que dans une session existante: un visiteur anonyme sans
+    session n'en crée pas une pour autant.
+    """
+    _compter_routage("ecritures")
+    if not DB_CONFIG.get("replicas"):
+        return
+    if has_app_context():
+        g.bdd_ecriture = True
+    if has_request_context() and session:
+        session[CLE_SESSION_ECRITURE] = time.time()
+
+
+def _lecture_sur_replica(requete: str) -> bool:
+    """
+    Indiquer si une lecture peut partir sur un réplica: réplicas configurés, requête
+    Flask (les scripts restent sur le primaire), SELECT sans verrou, hors transaction
+    et sans écriture récente de la requête ou de la session.
+    """
+    if not DB_CONFIG.get("replicas") or not has_app_context():
+        return False
+    if _profondeur_transaction() or _RE_VERROU.search(requete):
+        _compter_routage("lectures_primaire")
+        return False
+    derniere_ecriture = session.get(CLE_SESSION_ECRITURE) if has_request_context() else None
+    if getattr(g, "bdd_ecriture", False) or (
+        derniere_ecriture and time.time() - derniere_ecriture < DB_FENETRE_PRIMAIRE_APRES_ECRITURE
+    ):
+        _compter_routage("lectures_primaire")
+        _compter_routage("lectures_apres_ecriture")
+        return False
+    return True
+
+
+def _emprunter_replica():
+    """
+    Emprunter une connexion à un réplica (tourniquet, réplicas en échec écartés
+    quelques secondes). Retourne (connexion, pool) ou (None, None) si aucun ne répond.
+
+    Un pool de réplica saturé n'est pas attendu: la lecture part aussitôt sur le
+    primaire. Une requête Flask qui s'est rabattue sur le primaire y reste jusqu'à
+    sa fin, sans solliciter de nouveau les réplicas.
+    """
+    global _prochain_replica
+    if has_app_context() and getattr(g, "bdd_replicas_ecartes", False):
+        return None, None
+    pools = obtenir_pools_replicas()
+    with _verrou_routage:
+        debut = _prochain_replica
+        _prochain_replica = (_prochain_replica + 1) % len(pools)
+    maintenant = time.monotonic()
+    for decalage in range(len(pools)):
+        index = (debut + decalage) % len(pools)
+        if _replicas_en_echec.get(index, 0.0) > maintenant:
+            continue
+        try:
+            return pools[index].obtenir(delai=0), pools[index]
+        except PoolError:
+            # Pool du réplica saturé: pas une panne, essayer le suivant sans l'écarter
+            _compter_routage("replicas_satures")
+        except (InterfaceError, OperationalError):
+            # Réplica injoignable: écarté quelques secondes
+            _replicas_en_echec[index] = maintenant + DELAI_REPLICA_EN_ECHEC
+            _compter_routage("replicas_indisponibles")
+    if has_app_context():
+        g.bdd_replicas_ecartes = True
+    return None, None
+
+
+# ---------------------------------------------
+# Unité de travail: une connexion par requête
+# ---------------------------------------------
+
+# Hors contexte Flask (scripts, CLI), la connexion d'une transaction est portée par le thread
+_portee_locale = threading.local()
+
+
+def _portee():
+    """Objet portant la connexion de l'unité de travail: flask.g en requête, sinon le thread."""
+    return g if has_app_context() else _portee_locale
+
+
+def _profondeur_transaction() -> int:
+    return getattr(_portee(), "bdd_profondeur_transaction", 0)
+
+
+def connexion_requete():
+    """
+    Connexion unique de l'unité de travail courante, empruntée au pool au premier appel.
+    En requête Flask, elle est rendue par liberer_connexion_requete (teardown_appcontext).
+    """
+    portee = _portee()
+    conn = getattr(portee, "bdd_connexion", None)
+    if conn is None:
+        conn = obtenir_pool().obtenir()
+        portee.bdd_connexion = conn
+        portee.bdd_connexion_invalide = False
+        portee.bdd_profondeur_transaction = 0
+    return conn
+
+
+def _connexion_replica():
+    """Connexion réplica de la requête Flask, empruntée à la première lecture: (connexion, pool) ou (None, None)."""
+    conn = getattr(g, "bdd_connexion_replica", None)
+    if conn is None:
+        conn, pool = _emprunter_replica()
+        g.bdd_connexion_replica = conn
+        g.bdd_pool_replica = pool
+    return conn, g.bdd_pool_replica
+
+
+def _liberer_connexion_replica(invalide: bool = False) -> None:
+    conn = getattr(g, "bdd_connexion_replica", None)
+    if conn is not None:
+        g.bdd_connexion_replica = None
+        g.bdd_pool_replica.rendre(conn, invalide=invalide)
+
+
+def liberer_connexion_requete(exception=None) -> None:
+    """Rendre au pool la connexion de l'unité de travail (transaction inachevée annulée)."""
+    portee = _portee()
+    if has_app_context():
+        _liberer_connexion_replica()
+    conn = getattr(portee, "bdd_connexion", None)
+    if conn is None:
+        return
+    invalide = getattr(portee, "bdd_connexion_invalide", False)
+    portee.bdd_connexion = None
+    portee.bdd_connexion_invalide = False
+    portee.bdd_profondeur_transaction = 0
+    obtenir_pool().rendre(conn, invalide=invalide)
+
+
+@contextmanager
+def transaction():
+    """
+    Regrouper plusieurs requêtes sur la connexion de l'unité de travail.
+    Valide à la sortie du bloc, annule sur exception. Un bloc imbriqué rejoint
+    la transaction englobante.
+
+        with transaction():
+            acceptees, refusees = reserver_stocks(...)
+            ids = inserer_commandes(...)
+    """
+    portee = _portee()
+    conn = connexion_requete()
+    if portee.bdd_profondeur_transaction:
+        portee.bdd_profondeur_transaction += 1
+        try:
+            yield conn
+        finally:
+            portee.bdd_profondeur_transaction -= 1
+        return
+
+    hors_requete = not has_app_context()
+    _noter_ecriture()
+    try:
+        conn.start_transaction()
+        portee.bdd_profondeur_transaction = 1
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Error:
+                portee.bdd_connexion_invalide = True
+            raise
+    finally:
+        portee.bdd_profondeur_transaction = 0
+        if hors_requete:
+            liberer_connexion_requete()
+
+
+def _connexion_courante():
+    """
+    Retourner (connexion, ponctuelle). Une connexion ponctuelle est empruntée pour
+    une seule requête (hors contexte Flask et hors transaction) et doit être rendue.
+    """
+    if has_app_context() or getattr(_portee_locale, "bdd_connexion", None) is not None:
+        return connexion_requete(), False
+    return obtenir_pool().obtenir(), True
 
 
 # ---------------------------------------------
 # Connexion et exécution SQL
 # ---------------------------------------------
 
+# Fonctions appelées après chaque requête, réussie ou non:
+# ecouteur(requete, params, duree_secondes, erreur)
+_ecouteurs_sql: List[Callable[[str, Any, float, bool], None]] = []
+
+
+def ajouter_ecouteur_sql(ecouteur: Callable[[str, Any, float, bool], None]) -> None:
+    """Abonner une fonction aux requêtes exécutées (instrumentation, métriques)."""
+    if ecouteur not in _ecouteurs_sql:
+        _ecouteurs_sql.append(ecouteur)
+
+
+def retirer_ecouteur_sql(ecouteur: Callable[[str, Any, float, bool], None]) -> None:
+    if ecouteur in _ecouteurs_sql:
+        _ecouteurs_sql.remove(ecouteur)
+
+
+def _notifier_ecouteurs(requete: str, params: Any, debut: float, erreur: bool = False) -> None:
+    duree = time.perf_counter() - debut
+    for ecouteur in list(_ecouteurs_sql):
+        try:
+            ecouteur(requete, params, duree, erreur)
+        except Exception:
+            # L'instrumentation ne doit jamais faire échouer une requête
+            pass
+
+
 def connecter_bdd():
-    """Établir une connexion MySQL en utilisant la configuration DB_CONFIG."""
-    return mysql.connector.connect(**DB_CONFIG)
+    """Établir une connexion MySQL dédiée (hors pool) en utilisant DB_CONFIG."""
+    return mysql.connector.connect(**parametres_connexion())
+
+
+@contextmanager
+def _curseur(preparee: Optional[str] = None, replica: bool = False, **options):
+    """
+    Fournir (connexion, curseur) sur la connexion courante, valider hors transaction
+    et écarter la connexion si elle est coupée. Avec `preparee` (texte de la requête),
+    le curseur préparé de la connexion est pris dans le cache du pool et reste ouvert.
+    replica=True: connexion réplica de la requête, le primaire si aucun ne répond.
+    """
+    conn = None
+    if replica:
+        conn, pool = _connexion_replica()
+        _compter_routage("lectures_replica" if conn is not None else "lectures_primaire")
+    sur_replica = conn is not None
+    if not sur_replica:
+        conn, ponctuelle = _connexion_courante()
+        pool = obtenir_pool()
+    else:
+        ponctuelle = False
+    curseur = None
+    invalide = False
+    try:
+        if preparee is not None:
+            curseur = pool.curseur_prepare(conn, preparee)
+        else:
+            curseur = conn.cursor(**options)
+        yield conn, curseur
+        # En autocommit, in_transaction est faux: pas d'aller-retour COMMIT inutile
+        if conn.in_transaction and not _profondeur_transaction():
+            conn.commit()
+    except (OperationalError, InterfaceError):
+        # Connexion probablement coupée: ne pas la remettre dans le pool
+        invalide = True
+        raise
+    except Exception:
+        if preparee is not None:
+            # État du curseur incertain (résultat non lu, instruction invalide): le recréer
+            pool.oublier_instruction(conn, preparee)
+            curseur = None
+        raise
+    finally:
+        if curseur is not None and preparee is None:
+            try:
+                curseur.close()
+            except Exception:
+                pass
+        if ponctuelle:
+            pool.rendre(conn, invalide=invalide)
+        elif sur_replica:
+            if invalide:
+                _liberer_connexion_replica(invalide=True)
+        elif invalide:
+            _portee().bdd_connexion_invalide = True
+            if not _profondeur_transaction():
+                # Rendre tout de suite: la requête suivante empruntera une connexion saine
+                liberer_connexion_requete()
 
 
 def executer_requete_sql(
@@ -25,38 +617,158 @@ def executer_requete_sql(
     fetchone: bool = False,
     fetchall: bool = False,
     retourner_lastrowid: bool = False,
+    retourner_nb_lignes: bool = False,
+    prepare: bool = False,
 ):
     """
-    Exécuter une requête SQL paramétrée.
+    Exécuter une requête SQL paramétrée sur la connexion de l'unité de travail.
 
     - fetchone True: retourne une seule ligne (dict) ou None
     - fetchall True: retourne une liste de lignes (list[dict])
     - retourner_lastrowid True: retourne l'ID auto-incrémenté après INSERT
+    - retourner_nb_lignes True: retourne le nombre de lignes affectées (UPDATE/DELETE)
+    - prepare True: instruction préparée côté serveur, gardée en cache sur la
+      connexion (requêtes fréquentes à texte fixe, paramètres en tuple/liste)
+
+    Par défaut, ne retourne rien. Dans un bloc transaction(), rien n'est validé
+    avant la sortie du bloc.
+    """
+    if prepare and obtenir_pool().cache_instructions:
+        options = {"preparee": requete}
+    else:
+        # Curseur bufferisé: aucun résultat non lu ne reste sur la connexion
+        options = {"dictionary": True, "buffered": True}
+    if _RE_LECTURE.match(requete):
+        options["replica"] = (fetchone or fetchall) and _lecture_sur_replica(requete)
+    else:
+        _noter_ecriture()
+    debut = time.perf_counter() if _ecouteurs_sql else None
+    erreur = True
+    try:
+        with _curseur(**options) as (conn, curseur):
+            curseur.execute(requete, params or ())
+
+            resultat = None
+            if fetchone or fetchall:
+                # Tout lire: le curseur préparé n'est pas bufferisé et sera réutilisé
+                lignes = curseur.fetchall()
+                resultat = lignes if fetchall else (lignes[0] if lignes else None)
+            elif retourner_lastrowid:
+                # mysql-connector: lastrowid sur le curseur
+                resultat = curseur.lastrowid
+            elif retourner_nb_lignes:
+                resultat = curseur.rowcount
+        erreur = False
+    finally:
+        # Requêtes en échec comprises: verrous, deadlocks et délais dépassés sont les plus lentes
+        if debut is not None:
+            _notifier_ecouteurs(requete, params, debut, erreur)
+    return resultat
 
-    Par défaut, ne retourne rien.
+
+def iterer_requete_sql(
+    requete: str,
+    params: Optional[Union[Tuple[Any, ...], Dict[str, Any]]] = None,
+    taille_lot: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parcourir le résultat d'un SELECT ligne par ligne (dict), lu par lots de
+    `taille_lot` (DB_TAILLE_LOT_FLUX par défaut) sur un curseur non bufferisé:
+    la mémoire reste bornée quelle que soit la taille du résultat.
+
+    Le parcours utilise sa propre connexion du pool, indépendante de celle de la
+    requête (un réplica si la lecture peut y être routée). Elle est rendue en fin
+    de parcours. Si le générateur est abandonné avant la fin (client déconnecté),
+    la requête est d'abord arrêtée côté serveur (_interrompre_requete), puis la
+    connexion est fermée: sans cela, la fermeture lirait toutes les lignes restantes.
     """
-    conn = connecter_bdd()
+    taille_lot = taille_lot or DB_TAILLE_LOT_FLUX
+    conn = None
+    if _lecture_sur_replica(requete):
+        conn, pool = _emprunter_replica()
+        _compter_routage("lectures_replica" if conn is not None else "lectures_primaire")
+    if conn is None:
+        pool = obtenir_pool()
+        conn = pool.obtenir()
+    termine = en_cours = erreur = False
+    debut = time.perf_counter() if _ecouteurs_sql else None
     try:
         curseur = conn.cursor(dictionary=True)
         curseur.execute(requete, params or ())
-
-        resultat = None
-        if fetchone:
-            resultat = curseur.fetchone()
-        elif fetchall:
-            resultat = curseur.fetchall()
-        elif retourner_lastrowid:
-            # mysql-connector: lastrowid sur le curseur
-            resultat = curseur.lastrowid
-
-        conn.commit()
-        return resultat
+        en_cours = True
+        while True:
+            lignes = curseur.fetchmany(taille_lot)
+            if not lignes:
+                break
+            yield from lignes
+        curseur.close()
+        termine = True
+    except Exception:
+        erreur = True
+        raise
     finally:
+        if en_cours and not termine:
+            _interrompre_requete(pool, conn)
+        pool.rendre(conn, invalide=not termine)
+        if debut is not None:
+            # Durée du parcours complet, lecture par le consommateur comprise
+            _notifier_ecouteurs(requete, params, debut, erreur)
+
+
+def _interrompre_requete(pool: PoolConnexions, conn) -> None:
+    """
+    Arrêter la requête en cours sur `conn` par un KILL QUERY envoyé depuis une autre
+    connexion au même serveur (celle du pool, ou une connexion dédiée s'il est saturé).
+    """
+    try:
+        id_connexion = int(conn.connection_id)
         try:
-            curseur.close()
-        except Exception:
-            pass
-        conn.close()
+            autre, ponctuelle = pool.obtenir(delai=0), False
+        except PoolError:
+            autre, ponctuelle = mysql.connector.connect(**pool.parametres), True
+    except (Error, TypeError):
+        return
+    invalide = False
+    try:
+        curseur = autre.cursor()
+        curseur.execute(f"KILL QUERY {id_connexion}")
+        curseur.close()
+    except Error:
+        invalide = True
+    finally:
+        if ponctuelle:
+            try:
+                autre.close()
+            except Error:
+                pass
+        else:
+            pool.rendre(autre, invalide=invalide)
+
+
+def executer_lot_sql(
+    requete: str,
+    lignes_params: Iterable[Union[Tuple[Any, ...], Dict[str, Any]]],
+) -> int:
+    """
+    Exécuter une requête pour chaque jeu de paramètres (executemany).
+    Pour un INSERT ... VALUES, mysql-connector envoie un seul INSERT multi-lignes.
+    Retourne le nombre de lignes affectées.
+    """
+    lignes_params = list(lignes_params)
+    if not lignes_params:
+        return 0
+    _noter_ecriture()
+    debut = time.perf_counter() if _ecouteurs_sql else None
+    erreur = True
+    try:
+        with _curseur() as (conn, curseur):
+            curseur.executemany(requete, lignes_params)
+            nb_lignes = curseur.rowcount
+        erreur = False
+    finally:
+        if debut is not None:
+            _notifier_ecouteurs(requete, lignes_params, debut, erreur)
+    return nb_lignes
 
 
 # ---------------------------------------------
@@ -85,7 +797,7 @@ def inserer_commercant(
 def selectionner_commercant_par_email(email: str) -> Optional[Dict[str, Any]]:
     """Récupérer un commerçant par son email."""
     requete = "SELECT * FROM commercants WHERE email = %s LIMIT 1"
-    return executer_requete_sql(requete, (email,), fetchone=True)
+    return executer_requete_sql(requete, (email,), fetchone=True, prepare=True)
 
 
 # ---------------------------------------------
@@ -98,29 +810,37 @@ def inserer_boutique(
     description: Optional[str] = None,
     qr_code: Optional[str] = None,
 ) -> int:
-    """Insérer une boutique et retourner son ID."""
+    """Insérer une boutique (avec sa ligne de compteurs) et retourner son ID."""
     requete = (
         "INSERT INTO boutiques (id_commercant, nom_boutique, description, qr_code) "
         "VALUES (%s, %s, %s, %s)"
     )
-    return executer_requete_sql(
-        requete,
-        (id_commercant, nom_boutique, description, qr_code),
-        retourner_lastrowid=True,
-    )
+    with transaction():
+        id_boutique = executer_requete_sql(
+            requete,
+            (id_commercant, nom_boutique, description, qr_code),
+            retourner_lastrowid=True,
+        )
+        executer_requete_sql(
+            "INSERT INTO compteurs_boutiques (id_boutique) VALUES (%s)", (id_boutique,)
+        )
+    return id_boutique
 
 
 def selectionner_boutique_par_id(id_boutique: int) -> Optional[Dict[str, Any]]:
     requete = "SELECT * FROM boutiques WHERE id = %s"
-    return executer_requete_sql(requete, (id_boutique,), fetchone=True)
+    return executer_requete_sql(requete, (id_boutique,), fetchone=True, prepare=True)
 
 
 def selectionner_boutiques_populaires(limit: int = 10) -> List[Dict[str, Any]]:
-    """Sélection simple (placeholder) des boutiques populaires."""
+    """
+    Boutiques les plus commandées, lues depuis compteurs_boutiques: parcours de
+    l'index idx_compteurs_nb_commandes limité à `limit` lignes, sans agréger commandes.
+    """
     requete = (
-        "SELECT b.*, COUNT(c.id) AS nb_commandes "
-        "FROM boutiques b LEFT JOIN commandes c ON c.id_boutique = b.id "
-        "GROUP BY b.id ORDER BY nb_commandes DESC LIMIT %s"
+        "SELECT b.*, cb.nb_commandes "
+        "FROM compteurs_boutiques cb JOIN boutiques b ON b.id = cb.id_boutique "
+        "ORDER BY cb.nb_commandes DESC LIMIT %s"
     )
     return executer_requete_sql(requete, (limit,), fetchall=True)
 
@@ -149,9 +869,34 @@ def inserer_produit(
     )
 
 
+def inserer_ou_mettre_a_jour_produits(id_boutique: int, produits: List[Dict[str, Any]]) -> int:
+    """
+    Importer un lot de produits en un seul INSERT multi-lignes, identifiés par leur
+    SKU dans la boutique (UNIQUE id_boutique, sku): les SKU déjà présents sont mis à
+    jour. Retourne le nombre de lignes affectées (1 par ajout, 2 par mise à jour).
+    """
+    requete = (
+        "INSERT INTO produits (id_boutique, sku, nom, description, prix, stock, categorie, image) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE "
+        "nom = VALUES(nom), description = VALUES(description), prix = VALUES(prix), "
+        "stock = VALUES(stock), categorie = VALUES(categorie), image = COALESCE(VALUES(image), image)"
+    )
+    return executer_lot_sql(
+        requete,
+        [
+            (
+                id_boutique, p["sku"], p["nom"], p.get("description"), p["prix"],
+                p["stock"], p.get("categorie"), p.get("image"),
+            )
+            for p in produits
+        ],
+    )
+
+
 def selectionner_produits_par_boutique(id_boutique: int) -> List[Dict[str, Any]]:
     requete = "SELECT * FROM produits WHERE id_boutique = %s ORDER BY id DESC"
-    return executer_requete_sql(requete, (id_boutique,), fetchall=True)
+    return executer_requete_sql(requete, (id_boutique,), fetchall=True, prepare=True)
 
 
 def mettre_a_jour_stock_produit(id_produit: int, stock: int) -> None:
@@ -199,12 +944,149 @@ def mettre_a_jour_produit(
     executer_requete_sql(requete, tuple(valeurs))
 
 
+def selectionner_ids_produits_commercant(id_commercant: int, ids_produits: List[int]) -> set:
+    """Parmi `ids_produits`, ceux qui appartiennent à une boutique du commerçant (une requête)."""
+    if not ids_produits:
+        return set()
+    placeholders = ", ".join(["%s"] * len(ids_produits))
+    requete = (
+        "SELECT p.id FROM produits p JOIN boutiques b ON p.id_boutique = b.id "
+        f"WHERE b.id_commercant = %s AND p.id IN ({placeholders})"
+    )
+    lignes = executer_requete_sql(requete, (id_commercant, *ids_produits), fetchall=True)
+    return {ligne["id"] for ligne in lignes}
+
+
+def mettre_a_jour_produits_en_lot(modifications: Dict[int, Dict[str, Any]]) -> int:
+    """
+    Appliquer stock et/ou prix à plusieurs produits en un seul UPDATE
+    (CASE id ... END par colonne). `modifications`: {id_produit: {"stock": .., "prix": ..}},
+    une clé absente laisse la colonne inchangée. Retourne le nombre de lignes modifiées.
+    """
+    affectations = []
+    params: List[Any] = []
+    for colonne in ("stock", "prix"):
+        cas = [(i, m[colonne]) for i, m in modifications.items() if m.get(colonne) is not None]
+        if not cas:
+            continue
+        affectations.append(f"{colonne} = CASE id {' '.join(['WHEN %s THEN %s'] * len(cas))} ELSE {colonne} END")
+        params.extend(valeur for paire in cas for valeur in paire)
+    if not affectations:
+        return 0
+    ids = list(modifications)
+    placeholders = ", ".join(["%s"] * len(ids))
+    requete = f"UPDATE produits SET {', '.join(affectations)} WHERE id IN ({placeholders})"
+    return executer_requete_sql(requete, tuple(params + ids), retourner_nb_lignes=True)
+
+
+def ajuster_prix_categorie(
+    id_commercant: int,
+    categorie: str,
+    pourcentage: float,
+    id_boutique: Optional[int] = None,
+) -> int:
+    """
+    Augmenter (ou baisser si négatif) de `pourcentage` % le prix des produits d'une
+    catégorie dans les boutiques du commerçant, éventuellement d'une seule boutique.
+    Retourne le nombre de produits modifiés.
+    """
+    requete = (
+        "UPDATE produits p JOIN boutiques b ON p.id_boutique = b.id "
+        "SET p.prix = ROUND(p.prix * (100 + %s) / 100, 2) "
+        "WHERE b.id_commercant = %s AND p.categorie = %s"
+    )
+    params: List[Any] = [pourcentage, id_commercant, categorie]
+    if id_boutique is not None:
+        requete += " AND p.id_boutique = %s"
+        params.append(id_boutique)
+    return executer_requete_sql(requete, tuple(params), retourner_nb_lignes=True)
+
+
 def supprimer_produit(id_produit: int) -> None:
     """Supprimer un produit."""
     requete = "DELETE FROM produits WHERE id = %s"
     executer_requete_sql(requete, (id_produit,))
 
 
+# ---------------------------------------------
+# Recherche plein texte
+# ---------------------------------------------
+
+# Mots plus courts que innodb_ft_min_token_size (3 par défaut) ne sont pas indexés
+TAILLE_MIN_MOT_RECHERCHE = 3
+
+
+def _requete_plein_texte(texte: str) -> str:
+    """
+    Convertir une saisie libre en requête MATCH ... AGAINST en BOOLEAN MODE:
+    chaque mot indexable est obligatoire et cherché en préfixe ("tom" trouve "tomates").
+    Retourne "" si aucun mot n'est assez long.
+    """
+    mots = re.findall(r"\w+", texte or "")
+    return " ".join(f"+{mot}*" for mot in mots if len(mot) >= TAILLE_MIN_MOT_RECHERCHE)
+
+
+def _motif_prefixe(texte: str) -> str:
+    """Motif LIKE 'texte%' (servi par un index B-tree), caractères spéciaux échappés."""
+    texte = (texte or "").strip()
+    for special in ("\\", "%", "_"):
+        texte = texte.replace(special, "\\" + special)
+    return texte + "%"
+
+
+def rechercher_boutiques_texte(texte: str, limite: int = 20, decalage: int = 0) -> List[Dict[str, Any]]:
+    """
+    Boutiques dont le nom ou la description correspondent à `texte`, par pertinence
+    puis popularité. Saisie trop courte pour l'index FULLTEXT: préfixe du nom.
+    """
+    requete_ft = _requete_plein_texte(texte)
+    if requete_ft:
+        requete = (
+            "SELECT b.*, COALESCE(cb.nb_commandes, 0) AS nb_commandes, "
+            "MATCH(b.nom_boutique, b.description) AGAINST (%s IN BOOLEAN MODE) AS pertinence "
+            "FROM boutiques b LEFT JOIN compteurs_boutiques cb ON cb.id_boutique = b.id "
+            "WHERE MATCH(b.nom_boutique, b.description) AGAINST (%s IN BOOLEAN MODE) "
+            "ORDER BY pertinence DESC, nb_commandes DESC LIMIT %s OFFSET %s"
+        )
+        params = (requete_ft, requete_ft, limite, decalage)
+    else:
+        requete = (
+            "SELECT b.*, COALESCE(cb.nb_commandes, 0) AS nb_commandes "
+            "FROM boutiques b LEFT JOIN compteurs_boutiques cb ON cb.id_boutique = b.id "
+            "WHERE b.nom_boutique LIKE %s "
+            "ORDER BY nb_commandes DESC LIMIT %s OFFSET %s"
+        )
+        params = (_motif_prefixe(texte), limite, decalage)
+    return executer_requete_sql(requete, params, fetchall=True)
+
+
+def rechercher_produits_texte(texte: str, limite: int = 20, decalage: int = 0) -> List[Dict[str, Any]]:
+    """
+    Produits dont le nom, la description ou la catégorie correspondent à `texte`,
+    par pertinence. Saisie trop courte pour l'index FULLTEXT: préfixe du nom.
+    """
+    colonnes = (
+        "SELECT p.id, p.id_boutique, p.nom, p.description, p.prix, p.stock, p.image, "
+        "p.categorie, b.nom_boutique"
+    )
+    requete_ft = _requete_plein_texte(texte)
+    if requete_ft:
+        requete = (
+            f"{colonnes}, MATCH(p.nom, p.description, p.categorie) AGAINST (%s IN BOOLEAN MODE) AS pertinence "
+            "FROM produits p JOIN boutiques b ON b.id = p.id_boutique "
+            "WHERE MATCH(p.nom, p.description, p.categorie) AGAINST (%s IN BOOLEAN MODE) "
+            "ORDER BY pertinence DESC, p.id DESC LIMIT %s OFFSET %s"
+        )
+        params = (requete_ft, requete_ft, limite, decalage)
+    else:
+        requete = (
+            f"{colonnes} FROM produits p JOIN boutiques b ON b.id = p.id_boutique "
+            "WHERE p.nom LIKE %s ORDER BY p.nom LIMIT %s OFFSET %s"
+        )
+        params = (_motif_prefixe(texte), limite, decalage)
+    return executer_requete_sql(requete, params, fetchall=True)
+
+
 # ---------------------------------------------
 # Clients
 # ---------------------------------------------
@@ -227,7 +1109,7 @@ def inserer_client(
 
 def selectionner_client_par_telephone(telephone: str) -> Optional[Dict[str, Any]]:
     requete = "SELECT * FROM clients WHERE telephone = %s LIMIT 1"
-    return executer_requete_sql(requete, (telephone,), fetchone=True)
+    return executer_requete_sql(requete, (telephone,), fetchone=True, prepare=True)
 
 
 def selectionner_client_par_email(email: str) -> Optional[Dict[str, Any]]:
@@ -239,44 +1121,352 @@ def selectionner_client_par_email(email: str) -> Optional[Dict[str, Any]]:
 # Commandes
 # ---------------------------------------------
 
+# Statuts comptés comme payés dans compteurs_boutiques
+STATUTS_PAYES = ("paye", "livre")
+
+# Commande dont le paiement a échoué: conservée, mais hors compteurs et cumuls
+STATUT_ANNULE = "annulee"
+
+
+def incrementer_compteurs_boutique(
+    id_boutique: int,
+    nb_commandes: int = 0,
+    nb_commandes_payees: int = 0,
+    total_ventes: float = 0,
+) -> None:
+    """Appliquer des deltas aux compteurs d'une boutique (ligne créée si absente)."""
+    requete = (
+        "INSERT INTO compteurs_boutiques (id_boutique, nb_commandes, nb_commandes_payees, total_ventes) "
+        "VALUES (%s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE "
+        "nb_commandes = nb_commandes + VALUES(nb_commandes), "
+        "nb_commandes_payees = nb_commandes_payees + VALUES(nb_commandes_payees), "
+        "total_ventes = total_ventes + VALUES(total_ventes)"
+    )
+    executer_requete_sql(requete, (id_boutique, nb_commandes, nb_commandes_payees, total_ventes))
+
+
 def inserer_commande(
     id_client: int,
     id_boutique: int,
     total: float,
     methode_paiement: str,
     statut: str = "en_attente",
+    nb_unites: int = 0,
 ) -> int:
+    """
+    Insérer une commande et mettre à jour les compteurs de sa boutique
+    et le cumul du jour (nb_unites: total des quantités de ses lignes).
+    """
+    commande = {"id_boutique": id_boutique, "total": total, "nb_unites": nb_unites, "lignes": []}
+    return inserer_commandes(id_client, [commande], methode_paiement, statut)[0]
+
+
+def inserer_commandes(
+    id_client: int,
+    commandes: List[Dict[str, Any]],
+    methode_paiement: str,
+    statut: str = "en_attente",
+) -> List[int]:
+    """
+    Insérer plusieurs commandes d'un client (une par boutique) avec leurs lignes, en une
+    transaction: {"id_boutique", "total", "nb_unites", "lignes": [(id_produit, quantite,
+    prix_unitaire)]}. Une requête par en-tête (ids fiables), puis toutes les lignes, tous
+    les compteurs et tous les cumuls du jour en une requête chacun. Retourne les ids des
+    commandes dans l'ordre reçu. Le stock n'est pas modifié: voir reserver_stocks.
+
+    Les lignes de compteurs et de cumuls sont verrouillées par id_boutique croissant:
+    deux paniers {A, B} et {B, A} simultanés ne peuvent pas s'interbloquer.
+    """
+    if not commandes:
+        return []
     requete = (
         "INSERT INTO commandes (id_client, id_boutique, total, methode_paiement, statut) "
         "VALUES (%s, %s, %s, %s, %s)"
     )
-    return executer_requete_sql(
-        requete,
-        (id_client, id_boutique, total, methode_paiement, statut),
-        retourner_lastrowid=True,
-    )
+    payee = int(statut in STATUTS_PAYES)
+    ordre = sorted(range(len(commandes)), key=lambda i: commandes[i]["id_boutique"])
+    with transaction():
+        ids = [None] * len(commandes)
+        for i in ordre:
+            commande = commandes[i]
+            ids[i] = executer_requete_sql(
+                requete,
+                (id_client, commande["id_boutique"], commande["total"], methode_paiement, statut),
+                retourner_lastrowid=True,
+            )
+
+        lignes = [
+            (id_commande, id_produit, quantite, prix_unitaire)
+            for id_commande, commande in zip(ids, commandes)
+            for id_produit, quantite, prix_unitaire in commande["lignes"]
+        ]
+        if lignes:
+            executer_lot_sql(
+                "INSERT INTO lignes_commandes (id_commande, id_produit, quantite, prix_unitaire) "
+                "VALUES (%s, %s, %s, %s)",
+                lignes,
+            )
+
+        # Deltas des compteurs regroupés par boutique (id croissant): une seule requête multi-lignes
+        deltas = {}
+        for i in ordre:
+            nb, total = deltas.get(commandes[i]["id_boutique"], (0, 0))
+            deltas[commandes[i]["id_boutique"]] = (nb + 1, total + commandes[i]["total"])
+        valeurs = ", ".join(["(%s, %s, %s, %s)"] * len(deltas))
+        executer_requete_sql(
+            "INSERT INTO compteurs_boutiques (id_boutique, nb_commandes, nb_commandes_payees, total_ventes) "
+            f"VALUES {valeurs} "
+            "ON DUPLICATE KEY UPDATE "
+            "nb_commandes = nb_commandes + VALUES(nb_commandes), "
+            "nb_commandes_payees = nb_commandes_payees + VALUES(nb_commandes_payees), "
+            "total_ventes = total_ventes + VALUES(total_ventes)",
+            tuple(
+                valeur
+                for id_boutique, (nb, total) in deltas.items()
+                for valeur in (id_boutique, nb, nb * payee, total)
+            ),
+        )
+
+        # Jour lu sur les commandes insérées: exact même à minuit
+        cas = " ".join(["WHEN %s THEN %s"] * len(ids))
+        placeholders = ",".join(["%s"] * len(ids))
+        executer_requete_sql(
+            "INSERT INTO ventes_journalieres "
+            "(id_boutique, jour, nb_commandes, chiffre_affaires, nb_unites, "
+            "nb_commandes_payees, chiffre_affaires_paye) "
+            f"SELECT id_boutique, DATE(date_commande), 1, total, CASE id {cas} END, %s, total * %s "
+            f"FROM commandes WHERE id IN ({placeholders}) ORDER BY id_boutique "
+            "ON DUPLICATE KEY UPDATE "
+            "nb_commandes = nb_commandes + 1, "
+            "chiffre_affaires = chiffre_affaires + VALUES(chiffre_affaires), "
+            "nb_unites = nb_unites + VALUES(nb_unites), "
+            "nb_commandes_payees = nb_commandes_payees + VALUES(nb_commandes_payees), "
+            "chiffre_affaires_paye = chiffre_affaires_paye + VALUES(chiffre_affaires_paye)",
+            tuple(
+                [valeur for id_commande, commande in zip(ids, commandes) for valeur in (id_commande, commande["nb_unites"])]
+                + [payee, payee]
+                + ids
+            ),
+        )
+    return ids
+
+
+def reserver_stocks(quantites: Dict[int, int]) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """
+    Réserver le stock de plusieurs produits {id_produit: quantite}, tout ou rien par ligne.
+    Retourne (acceptees, refusees). Jamais de stock négatif: chaque décrément est
+    conditionnel (stock >= quantite) et les lignes produits sont verrouillées par id
+    croissant pour qu'aucune paire de commandes concurrentes ne s'interbloque.
+    La réservation tient jusqu'à la fin de la transaction englobante.
+    """
+    quantites = {int(id_produit): int(qte) for id_produit, qte in quantites.items() if int(qte) > 0}
+    if not quantites:
+        return {}, {}
+
+    with transaction():
+        if len(quantites) == 1:
+            # Cas le plus fréquent (produit vedette): un seul UPDATE conditionnel suffit
+            (id_produit, quantite), = quantites.items()
+            requete = "UPDATE produits SET stock = stock - %s WHERE id = %s AND stock >= %s"
+            nb = executer_requete_sql(requete, (quantite, id_produit, quantite), retourner_nb_lignes=True)
+            return (quantites, {}) if nb == 1 else ({}, quantites)
+
+        ids = sorted(quantites)
+        placeholders = ",".join(["%s"] * len(ids))
+        requete_verrou = (
+            f"SELECT id, stock FROM produits WHERE id IN ({placeholders}) ORDER BY id FOR UPDATE"
+        )
+        stocks = {
+            ligne["id"]: ligne["stock"]
+            for ligne in executer_requete_sql(requete_verrou, tuple(ids), fetchall=True)
+        }
+        acceptees = {i: quantites[i] for i in ids if stocks.get(i, 0) >= quantites[i]}
+        refusees = {i: quantites[i] for i in ids if i not in acceptees}
+        if not acceptees:
+            return acceptees, refusees
+
+        ids_acceptes = sorted(acceptees)
+        cas = " ".join(["WHEN %s THEN %s"] * len(ids_acceptes))
+        placeholders = ",".join(["%s"] * len(ids_acceptes))
+        requete = (
+            f"UPDATE produits SET stock = stock - CASE id {cas} END "
+            f"WHERE id IN ({placeholders}) AND stock >= CASE id {cas} END"
+        )
+        paires = [valeur for i in ids_acceptes for valeur in (i, acceptees[i])]
+        nb = executer_requete_sql(
+            requete, tuple(paires + ids_acceptes + paires), retourner_nb_lignes=True
+        )
+        if nb != len(ids_acceptes):
+            # Impossible tant que les lignes sont verrouillées: annuler plutôt que survendre
+            raise Error("Réservation de stock incohérente, commande annulée.")
+        return acceptees, refusees
+
+
+def annuler_commandes_impayees(ids_commandes: List[int]) -> List[int]:
+    """
+    Annuler des commandes dont le paiement a échoué: stock rendu, compteurs et cumuls du
+    jour décomptés, statut passé à STATUT_ANNULE (commandes et lignes conservées), en
+    une transaction. Seules les commandes encore en_attente sont annulées; retourne leurs ids.
+    Verrous: commandes, puis produits par id croissant, puis compteurs des boutiques
+    par id croissant.
+    """
+    if not ids_commandes:
+        return []
+    placeholders = ",".join(["%s"] * len(ids_commandes))
+    with transaction():
+        commandes = executer_requete_sql(
+            "SELECT id, id_boutique, total, date_commande FROM commandes "
+            f"WHERE id IN ({placeholders}) AND statut = 'en_attente' ORDER BY id FOR UPDATE",
+            tuple(ids_commandes),
+            fetchall=True,
+        )
+        if not commandes:
+            return []
+        ids = [commande["id"] for commande in commandes]
+        placeholders = ",".join(["%s"] * len(ids))
+        lignes = executer_requete_sql(
+            "SELECT id_commande, id_produit, SUM(quantite) AS quantite FROM lignes_commandes "
+            f"WHERE id_commande IN ({placeholders}) GROUP BY id_commande, id_produit",
+            tuple(ids),
+            fetchall=True,
+        )
+        quantites, unites = {}, {}
+        for ligne in lignes:
+            quantite = int(ligne["quantite"])
+            quantites[ligne["id_produit"]] = quantites.get(ligne["id_produit"], 0) + quantite
+            unites[ligne["id_commande"]] = unites.get(ligne["id_commande"], 0) + quantite
+
+        if quantites:
+            ids_produits = sorted(quantites)
+            cas = " ".join(["WHEN %s THEN %s"] * len(ids_produits))
+            executer_requete_sql(
+                f"UPDATE produits SET stock = stock + CASE id {cas} END "
+                f"WHERE id IN ({','.join(['%s'] * len(ids_produits))})",
+                tuple([valeur for i in ids_produits for valeur in (i, quantites[i])] + ids_produits),
+            )
+
+        # Commandes en_attente: jamais comptées comme payées
+        for commande in sorted(commandes, key=lambda c: (c["id_boutique"], c["id"])):
+            incrementer_compteurs_boutique(
+                commande["id_boutique"], nb_commandes=-1, total_ventes=-commande["total"]
+            )
+            executer_requete_sql(
+                "UPDATE ventes_journalieres SET "
+                "nb_commandes = nb_commandes - 1, "
+                "chiffre_affaires = chiffre_affaires - %s, "
+                "nb_unites = nb_unites - %s "
+                "WHERE id_boutique = %s AND jour = %s",
+                (
+                    commande["total"],
+                    unites.get(commande["id"], 0),
+                    commande["id_boutique"],
+                    commande["date_commande"].date(),
+                ),
+            )
+        executer_requete_sql(
+            f"UPDATE commandes SET statut = %s WHERE id IN ({placeholders})",
+            (STATUT_ANNULE, *ids),
+        )
+    return ids
+
+
+def mettre_a_jour_commande_statut(id_commande: int, statut: str) -> Optional[Dict[str, Any]]:
+    """
+    Changer le statut d'une commande et ajuster les compteurs de sa boutique.
+    Retourne la commande telle qu'avant la mise à jour, ou None si elle n'existe pas
+    ou a été annulée (STATUT_ANNULE est définitif).
+    """
+    with transaction():
+        commande = executer_requete_sql(
+            "SELECT id, id_client, id_boutique, statut, total, date_commande "
+            "FROM commandes WHERE id = %s AND statut <> %s FOR UPDATE",
+            (id_commande, STATUT_ANNULE),
+            fetchone=True,
+        )
+        if not commande:
+            return None
+        executer_requete_sql("UPDATE commandes SET statut = %s WHERE id = %s", (statut, id_commande))
+
+        delta_payees = int(statut in STATUTS_PAYES) - int(commande["statut"] in STATUTS_PAYES)
+        if delta_payees:
+            incrementer_compteurs_boutique(commande["id_boutique"], nb_commandes_payees=delta_payees)
+            executer_requete_sql(
+                "UPDATE ventes_journalieres SET "
+                "nb_commandes_payees = nb_commandes_payees + %s, "
+                "chiffre_affaires_paye = chiffre_affaires_paye + %s "
+                "WHERE id_boutique = %s AND jour = %s",
+                (
+                    delta_payees,
+                    delta_payees * commande["total"],
+                    commande["id_boutique"],
+                    commande["date_commande"].date(),
+                ),
+            )
+    return commande
 
 
-def inserer_ligne_commande(
-    id_commande: int,
-    id_produit: int,
-    quantite: int,
-    prix_unitaire: float,
-) -> int:
+# ---------------------------------------------
+# Cumuls journaliers des ventes
+# ---------------------------------------------
+
+def reconstruire_ventes_journalieres(id_boutique: int) -> None:
+    """
+    Recalculer depuis commandes/lignes_commandes les cumuls journaliers d'une boutique
+    (rattrapage de l'historique ou réparation), commandes annulées exclues. Une
+    transaction par boutique.
+    """
+    statuts = ",".join(["%s"] * len(STATUTS_PAYES))
+    with transaction():
+        executer_requete_sql("DELETE FROM ventes_journalieres WHERE id_boutique = %s", (id_boutique,))
+        executer_requete_sql(
+            f"""
+            INSERT INTO ventes_journalieres
+                (id_boutique, jour, nb_commandes, chiffre_affaires, nb_unites,
+                 nb_commandes_payees, chiffre_affaires_paye)
+            SELECT
+                c.id_boutique,
+                DATE(c.date_commande),
+                COUNT(*),
+                SUM(c.total),
+                COALESCE(SUM(u.nb_unites), 0),
+                SUM(c.statut IN ({statuts})),
+                SUM(CASE WHEN c.statut IN ({statuts}) THEN c.total ELSE 0 END)
+            FROM commandes c
+            LEFT JOIN (
+                SELECT lc.id_commande, SUM(lc.quantite) AS nb_unites
+                FROM lignes_commandes lc
+                JOIN commandes cl ON lc.id_commande = cl.id
+                WHERE cl.id_boutique = %s
+                GROUP BY lc.id_commande
+            ) u ON u.id_commande = c.id
+            WHERE c.id_boutique = %s AND c.statut <> %s
+            GROUP BY c.id_boutique, DATE(c.date_commande)
+            """,
+            STATUTS_PAYES + STATUTS_PAYES + (id_boutique, id_boutique, STATUT_ANNULE),
+        )
+
+
+def selectionner_ventes_journalieres(
+    id_commercant: int,
+    depuis,
+    id_boutique: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Cumuls par jour depuis la date `depuis` pour les boutiques du commerçant."""
     requete = (
-        "INSERT INTO lignes_commandes (id_commande, id_produit, quantite, prix_unitaire) "
-        "VALUES (%s, %s, %s, %s)"
+        "SELECT v.jour, SUM(v.nb_commandes) AS nb_commandes, "
+        "SUM(v.chiffre_affaires) AS chiffre_affaires, SUM(v.nb_unites) AS nb_unites, "
+        "SUM(v.nb_commandes_payees) AS nb_commandes_payees, "
+        "SUM(v.chiffre_affaires_paye) AS chiffre_affaires_paye "
+        "FROM ventes_journalieres v JOIN boutiques b ON v.id_boutique = b.id "
+        "WHERE b.id_commercant = %s AND v.jour >= %s"
     )
-    return executer_requete_sql(
-        requete,
-        (id_commande, id_produit, quantite, prix_unitaire),
-        retourner_lastrowid=True,
-    )
-
-
-def mettre_a_jour_commande_statut(id_commande: int, statut: str) -> None:
-    requete = "UPDATE commandes SET statut = %s WHERE id = %s"
-    executer_requete_sql(requete, (statut, id_commande))
+    params = [id_commercant, depuis]
+    if id_boutique is not None:
+        requete += " AND v.id_boutique = %s"
+        params.append(id_boutique)
+    requete += " GROUP BY v.jour ORDER BY v.jour"
+    return executer_requete_sql(requete, tuple(params), fetchall=True)
 
 
 # ---------------------------------------------
@@ -366,3 +1556,57 @@ def selectionner_commercant_par_id(id_commercant: int) -> Optional[Dict[str, Any
     """Récupérer un commerçant par son ID."""
     requete = "SELECT * FROM commercants WHERE id = %s LIMIT 1"
     return executer_requete_sql(requete, (id_commercant,), fetchone=True)
+
+
+# ---------------------------------------------
+# Sessions web (utilitaires.sessions)
+# ---------------------------------------------
+# Toujours sur le primaire (la session vient peut-être d'être écrite) et hors
+# routage: l'enregistrement d'une session n'est pas une écriture de l'utilisateur.
+
+def _executer_session(requete: str, params: Tuple[Any, ...], fetchone: bool = False):
+    with _curseur(dictionary=True, buffered=True) as (conn, curseur):
+        curseur.execute(requete, params)
+        return curseur.fetchone() if fetchone else curseur.rowcount
+
+
+def lire_session_web(id_session: str) -> Optional[Dict[str, Any]]:
+    """Données et expiration (UTC) d'une session non expirée, None sinon."""
+    return _executer_session(
+        "SELECT donnees, expiration FROM sessions_web WHERE id = %s AND expiration > UTC_TIMESTAMP()",
+        (id_session,),
+        fetchone=True,
+    )
+
+
+def ecrire_session_web(id_session: str, donnees: bytes, expiration) -> None:
+    _executer_session(
+        "INSERT INTO sessions_web (id, donnees, expiration) VALUES (%s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE donnees = VALUES(donnees), expiration = VALUES(expiration)",
+        (id_session, donnees, expiration),
+    )
+
+
+def prolonger_session_web(id_session: str, expiration) -> None:
+    _executer_session("UPDATE sessions_web SET expiration = %s WHERE id = %s", (expiration, id_session))
+
+
+def supprimer_session_web(id_session: str) -> None:
+    _executer_session("DELETE FROM sessions_web WHERE id = %s", (id_session,))
+
+
+def purger_sessions_web(limite: int) -> int:
+    """Supprimer au plus `limite` sessions expirées (les plus anciennes d'abord, par l'index d'expiration)."""
+    return _executer_session(
+        "DELETE FROM sessions_web WHERE expiration < UTC_TIMESTAMP() ORDER BY expiration LIMIT %s",
+        (limite,),
+    )
+
+
+def compter_sessions_web() -> Dict[str, Any]:
+    """Nombre de sessions et taille totale de leurs données (octets)."""
+    return _executer_session(
+        "SELECT COUNT(*) AS nb, COALESCE(SUM(LENGTH(donnees)), 0) AS octets FROM sessions_web",
+        (),
+        fetchone=True,
+    )
@@ -2,8 +2,20 @@
 Routes principales de Djaapp - Architecture simple avec séparation Commerçant/Client
 """
 
-from flask import request, jsonify, render_template, redirect, url_for, flash, session
+from flask import (
+    request,
+    jsonify,
+    render_template,
+    redirect,
+    url_for,
+    flash,
+    session,
+    Response,
+    stream_with_context,
+)
+from datetime import date
 import requests
+from mysql.connector import Error
 from controllers.auth import (
     inscrire_commercant,
     connecter_commercant,
@@ -22,21 +34,29 @@ from controllers.commercant import (
     traiter_commande,
     obtenir_boutiques_commercant,
     obtenir_statistiques_boutiques,
+    obtenir_ventes_graphique,
+    exporter_commandes_csv,
+    importer_catalogue,
+    mettre_a_jour_inventaire,
 )
 from controllers.client import (
     rechercher_boutiques,
+    rechercher_catalogue,
+    obtenir_boutiques_populaires,
     obtenir_boutique,
     ajouter_au_panier,
     obtenir_panier,
     passer_commande,
+    annuler_commandes_panier,
     traiter_paiement,
     obtenir_commandes_client,
     obtenir_details_commande,
 )
 from utilitaires.qr import generer_qr_boutique
 from utilitaires.integrations import partager_boutique_whatsapp
+from utilitaires.import_catalogue import lire_lignes_fichier
+from utilitaires.panier_cookie import support_panier, panier_en_cookie, fusionner_panier_cookie
 from models.bdd import (
-    executer_requete_sql,
     selectionner_commercant_par_id,
 )
 
@@ -57,7 +77,7 @@ def enregistrer_routes(app):
         elif session.get('role') == 'client':
             return redirect(url_for('dashboard_client'))
 
-        boutiques = rechercher_boutiques()[:6]  # 6 populaires
+        boutiques = obtenir_boutiques_populaires(6)
         return render_template("index.html", boutiques=boutiques)
 
     # ==========================================
@@ -105,7 +125,7 @@ def enregistrer_routes(app):
             return guard
         id_commercant = session["id_commercant"]
         stats = obtenir_statistiques_commercant(id_commercant)
-        produits = obtenir_produits_commercant(id_commercant)[:10]  # 10 derniers
+        produits, _ = obtenir_produits_commercant(id_commercant, limite=10)  # 10 derniers
         return render_template("commercant/dashboard.html", stats=stats, produits=produits)
 
     @app.get("/commercant/boutique/creer")
@@ -154,9 +174,16 @@ def enregistrer_routes(app):
         if guard:
             return guard
         id_commercant = session["id_commercant"]
-        produits = obtenir_produits_commercant(id_commercant)
+        apres = request.args.get("apres")
+        produits, curseur_suivant = obtenir_produits_commercant(id_commercant, apres=apres)
         boutiques = obtenir_boutiques_commercant(id_commercant)
-        return render_template("commercant/produits.html", produits=produits, boutiques=boutiques)
+        return render_template(
+            "commercant/produits.html",
+            produits=produits,
+            boutiques=boutiques,
+            apres=apres,
+            curseur_suivant=curseur_suivant,
+        )
 
     @app.post("/commercant/produit/ajouter")
     def ajouter_produit_route():
@@ -197,6 +224,69 @@ def enregistrer_routes(app):
             flash(f"Erreur: {str(e)}", "error")
         return redirect(url_for("gerer_produits"))
 
+    @app.post("/commercant/produits/import")
+    def importer_produits_route():
+        """Import en masse de produits depuis un fichier CSV ou JSON (mise à jour par SKU)."""
+        guard = guard_commercant()
+        if guard:
+            return guard
+        veut_json = request.accept_mimetypes.best == "application/json"
+
+        fichier = request.files.get("fichier")
+        id_boutique = request.form.get("id_boutique", type=int)
+        format_fichier = (fichier.filename.rsplit(".", 1)[-1].lower() if fichier and fichier.filename else "")
+        if not fichier or id_boutique is None or format_fichier not in ("csv", "json"):
+            message = "Choisissez une boutique et un fichier .csv ou .json."
+            if veut_json:
+                return jsonify({"erreur": message}), 400
+            flash(message, "error")
+            return redirect(url_for("gerer_produits"))
+
+        try:
+            rapport = importer_catalogue(
+                session["id_commercant"], id_boutique, lire_lignes_fichier(fichier.stream, format_fichier)
+            )
+        except ValueError as e:
+            if veut_json:
+                return jsonify({"erreur": str(e)}), 404
+            flash(str(e), "error")
+            return redirect(url_for("gerer_produits"))
+
+        if veut_json:
+            return jsonify(rapport)
+        flash(
+            f"Import: {rapport['importees']} produit(s) importé(s) sur {rapport['lignes']} ligne(s).",
+            "success" if rapport["importees"] else "warning",
+        )
+        if rapport["erreur_fichier"]:
+            flash(f"Lecture interrompue: {rapport['erreur_fichier']}", "error")
+        if rapport["nb_erreurs"]:
+            details = "; ".join(f"ligne {e['ligne']}: {e['erreur']}" for e in rapport["erreurs"][:10])
+            suite = " ..." if rapport["nb_erreurs"] > 10 else ""
+            flash(f"{rapport['nb_erreurs']} ligne(s) rejetée(s) - {details}{suite}", "error")
+        return redirect(url_for("gerer_produits"))
+
+    @app.post("/commercant/produits/lot")
+    def modifier_produits_lot_route():
+        """
+        Modification en lot (JSON) des stocks et prix:
+        {"produits": [{"id_produit", "stock", "prix"}], "categories": [{"categorie", "pourcentage", "id_boutique"}]}
+        """
+        guard = guard_commercant()
+        if guard:
+            return guard
+        donnees = request.get_json(silent=True)
+        if not isinstance(donnees, dict):
+            return jsonify({"erreur": "Corps JSON attendu."}), 400
+        try:
+            resultat = mettre_a_jour_inventaire(
+                session["id_commercant"], donnees.get("produits"), donnees.get("categories")
+            )
+        except ValueError as e:
+            message, erreurs = e.args
+            return jsonify({"erreur": message, "erreurs": erreurs}), 400
+        return jsonify(resultat)
+
     @app.post("/commercant/produit/<int:id_produit>/modifier")
     def modifier_produit_route(id_produit):
         """Modifier un produit."""
@@ -258,8 +348,40 @@ def enregistrer_routes(app):
         if guard:
             return guard
         id_commercant = session["id_commercant"]
-        commandes = obtenir_commandes_commercant(id_commercant)
-        return render_template("commercant/commandes.html", commandes=commandes)
+        apres = request.args.get("apres")
+        commandes, curseur_suivant = obtenir_commandes_commercant(id_commercant, apres=apres)
+        return render_template(
+            "commercant/commandes.html",
+            commandes=commandes,
+            apres=apres,
+            curseur_suivant=curseur_suivant,
+            boutiques=obtenir_boutiques_commercant(id_commercant),
+        )
+
+    @app.get("/commercant/commandes/export")
+    def exporter_commandes():
+        """Export CSV (ou CSV gzip) des commandes et de leurs lignes, envoyé en flux."""
+        guard = guard_commercant()
+        if guard:
+            return guard
+        try:
+            depuis = date.fromisoformat(request.args["depuis"]) if request.args.get("depuis") else None
+            jusqu_a = date.fromisoformat(request.args["jusqu_a"]) if request.args.get("jusqu_a") else None
+        except ValueError:
+            flash("Dates invalides (format AAAA-MM-JJ).", "error")
+            return redirect(url_for("gerer_commandes"))
+        id_boutique = request.args.get("id_boutique", type=int)
+        compresser = request.args.get("gzip") == "1"
+
+        morceaux = exporter_commandes_csv(
+            session["id_commercant"], depuis, jusqu_a, id_boutique, compresser=compresser
+        )
+        nom_fichier = f"commandes-{date.today().isoformat()}.csv" + (".gz" if compresser else "")
+        return Response(
+            stream_with_context(morceaux),
+            mimetype="application/gzip" if compresser else "text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{nom_fichier}"'},
+        )
 
     @app.post("/commercant/commande/<int:id_commande>/traiter")
     def traiter_commande_route(id_commande):
@@ -274,6 +396,16 @@ def enregistrer_routes(app):
             flash("Erreur traitement.", "error")
         return redirect(url_for("gerer_commandes"))
 
+    @app.get("/commercant/ventes/graphique")
+    def ventes_graphique():
+        """Données des graphiques de ventes (jour, semaine, mois) en JSON."""
+        guard = guard_commercant()
+        if guard:
+            return guard
+        periode = request.args.get("periode", "jour")
+        id_boutique = request.args.get("id_boutique", type=int)
+        return jsonify(obtenir_ventes_graphique(session["id_commercant"], periode, id_boutique))
+
     @app.get("/commercant/partage/<int:id_boutique>")
     def partager_boutique(id_boutique):
         """Partager boutique via WhatsApp."""
@@ -304,6 +436,7 @@ def enregistrer_routes(app):
         mot_de_passe = donnees.get("mot_de_passe") or None
 
         if inscrire_client(nom, telephone, email, adresse, mot_de_passe):
+            fusionner_panier_cookie()
             return redirect(url_for("dashboard_client"))
         return redirect(url_for("inscription_client"))
 
@@ -318,6 +451,7 @@ def enregistrer_routes(app):
         telephone = request.form.get("telephone", "").strip()
         mot_de_passe = request.form.get("mot_de_passe")
         if connecter_client(telephone, mot_de_passe):
+            fusionner_panier_cookie()
             return redirect(url_for("dashboard_client"))
         return redirect(url_for("connexion_client"))
 
@@ -327,7 +461,7 @@ def enregistrer_routes(app):
         guard = guard_client()
         if guard:
             return guard
-        boutiques = rechercher_boutiques()[:12]  # 12 populaires
+        boutiques = obtenir_boutiques_populaires(12)
         return render_template("client/dashboard.html", boutiques=boutiques)
 
     @app.get("/client/profil")
@@ -344,15 +478,19 @@ def enregistrer_routes(app):
         guard = guard_client()
         if guard:
             return guard
+        fusionner_panier_cookie()
         panier = obtenir_panier(session)
         return render_template("client/panier.html", panier=panier)
 
+    # Panier: session, ou cookie signé pour les visiteurs anonymes (PANIER_COOKIE)
     @app.post("/client/panier/ajouter/<int:id_produit>")
     def ajouter_panier(id_produit):
         """Ajouter au panier."""
         quantite = int(request.form.get("quantite", 1))
-        ajouter_au_panier(session, id_produit, quantite)
-        flash("Ajouté au panier.", "success")
+        ajouter_au_panier(support_panier(), id_produit, quantite)
+        # Visiteur en mode cookie: pas de flash, il créerait une session serveur
+        if not panier_en_cookie():
+            flash("Ajouté au panier.", "success")
         return redirect(request.referrer or url_for("dashboard_client"))
 
     @app.post("/client/panier/modifier")
@@ -360,30 +498,32 @@ def enregistrer_routes(app):
         """Modifier quantité dans le panier."""
         id_produit = int(request.form.get("id_produit"))
         quantite = int(request.form.get("quantite", 1))
+        support = support_panier()
         if quantite <= 0:
             # Supprimer du panier
-            panier = session.get("panier", {})
+            panier = support.get("panier", {})
             if str(id_produit) in panier:
                 del panier[str(id_produit)]
-                session["panier"] = panier
+                support["panier"] = panier
         else:
-            ajouter_au_panier(session, id_produit, quantite - session.get("panier", {}).get(str(id_produit), 0))
+            ajouter_au_panier(support, id_produit, quantite - support.get("panier", {}).get(str(id_produit), 0))
         return "", 200
 
     @app.post("/client/panier/supprimer")
     def supprimer_panier():
         """Supprimer produit du panier."""
         id_produit = int(request.form.get("id_produit"))
-        panier = session.get("panier", {})
+        support = support_panier()
+        panier = support.get("panier", {})
         if str(id_produit) in panier:
             del panier[str(id_produit)]
-            session["panier"] = panier
+            support["panier"] = panier
         return "", 200
 
     @app.post("/client/panier/vider")
     def vider_panier():
         """Vider complètement le panier."""
-        session["panier"] = {}
+        support_panier()["panier"] = {}
         return "", 200
 
     @app.get("/client/commandes")
@@ -393,8 +533,11 @@ def enregistrer_routes(app):
         if guard:
             return guard
         id_client = session["id_client"]
-        commandes = obtenir_commandes_client(id_client)
-        return render_template("client/commandes.html", commandes=commandes)
+        apres = request.args.get("apres")
+        commandes, curseur_suivant = obtenir_commandes_client(id_client, apres=apres)
+        return render_template(
+            "client/commandes.html", commandes=commandes, apres=apres, curseur_suivant=curseur_suivant
+        )
 
     @app.get("/client/commande/<int:id_commande>")
     def details_commande(id_commande):
@@ -421,10 +564,13 @@ def enregistrer_routes(app):
 
     @app.get("/boutiques/recherche")
     def rechercher_boutiques_route():
-        """Recherche boutiques."""
+        """Recherche boutiques et produits (paginée)."""
         query = request.args.get("q", "").strip()
-        boutiques = rechercher_boutiques(query)
-        return render_template("client/dashboard.html", boutiques=boutiques, query=query)
+        if not query:
+            return render_template("client/dashboard.html", boutiques=rechercher_boutiques(), query=query)
+        page = request.args.get("page", 1, type=int)
+        resultats = rechercher_catalogue(query, page)
+        return render_template("client/dashboard.html", query=query, **resultats)
 
     # ==========================================
     # ROUTES PAIEMENT
@@ -436,6 +582,7 @@ def enregistrer_routes(app):
         guard = guard_client()
         if guard:
             return guard
+        fusionner_panier_cookie()
         panier = obtenir_panier(session)
         if not panier["items"]:
             flash("Panier vide.", "error")
@@ -451,6 +598,49 @@ def enregistrer_routes(app):
             return guard
         return redirect(url_for("page_paiement", etape=2))
 
+    def payer_panier(methode, details, succes, echec_commande, echec_paiement):
+        """
+        Commande du panier puis paiement, commun aux routes de paiement.
+        Le panier est résolu une fois pour la requête (obtenir_panier mémorisé).
+        """
+        fusionner_panier_cookie()
+        panier = obtenir_panier(session)
+        if not panier["items"]:
+            flash("Panier vide.", "error")
+            return redirect(url_for("panier_client"))
+
+        # Une commande par boutique du panier, créées ensemble
+        try:
+            commandes, refusees = passer_commande(session, session["id_client"], methode)
+        except Error:
+            # Interblocage, attente de verrou expirée...: transaction annulée, rien n'est commandé
+            flash("Commande impossible pour le moment, veuillez réessayer.", "error")
+            return redirect(echec_commande)
+        if refusees:
+            flash(f"Stock insuffisant pour : {', '.join(refusees)}.", "error")
+        if not commandes:
+            if not refusees:
+                flash("Erreur commande.", "error")
+            return redirect(echec_commande)
+
+        if methode == "mobile_money":
+            # Montant toujours celui des commandes créées, jamais celui du formulaire
+            details = {**details, "montant": sum(commande["total"] for commande in commandes)}
+        if traiter_paiement([commande["id"] for commande in commandes], methode, details):
+            if len(commandes) > 1:
+                flash(f"Paiement réussi : {len(commandes)} commandes, une par boutique.", "success")
+            else:
+                flash("Paiement réussi.", "success")
+            return redirect(succes)
+        else:
+            # Paiement refusé: ne pas garder de commandes en attente qui bloqueraient le stock
+            try:
+                annuler_commandes_panier(session, commandes)
+            except Error:
+                app.logger.exception("Annulation des commandes impayées %s en échec", [c["id"] for c in commandes])
+            flash("Erreur paiement.", "error")
+            return redirect(echec_paiement)
+
     @app.post("/client/paiement/mobile-money")
     def traiter_paiement_mobile_money():
         """Traiter paiement Mobile Money."""
@@ -462,29 +652,14 @@ def enregistrer_routes(app):
         operateur = donnees.get("operateur")
         telephone = donnees.get("telephone")
 
-        panier = obtenir_panier(session)
-        if not panier["items"]:
-            flash("Panier vide.", "error")
-            return redirect(url_for("panier_client"))
-
-        id_client = session["id_client"]
-        # Déterminer boutique depuis premier produit du panier
-        premier_produit = panier["items"][0]
-        requete_boutique = "SELECT id_boutique FROM produits WHERE id = %s"
-        boutique = executer_requete_sql(requete_boutique, (premier_produit["id"],), fetchone=True)
-        id_boutique = boutique["id_boutique"] if boutique else 1
-
-        id_commande = passer_commande(session, id_client, id_boutique, "mobile_money")
-        if not id_commande:
-            flash("Erreur commande.", "error")
-            return redirect(url_for("page_paiement", etape=2))
-
-        if traiter_paiement(id_commande, "mobile_money", {"numero": telephone, "montant": panier["total"]}):
-            flash("Paiement réussi.", "success")
-            return redirect(url_for("page_paiement", etape=3))
-        else:
-            flash("Erreur paiement.", "error")
-            return redirect(url_for("page_paiement", etape=2))
+        etape_2 = url_for("page_paiement", etape=2)
+        return payer_panier(
+            "mobile_money",
+            {"numero": telephone},
+            succes=url_for("page_paiement", etape=3),
+            echec_commande=etape_2,
+            echec_paiement=etape_2,
+        )
 
     @app.post("/client/paiement/carte")
     def traiter_paiement_carte():
@@ -494,34 +669,21 @@ def enregistrer_routes(app):
             return guard
 
         donnees = request.form
-        nom_carte = donnees.get("nom_carte")
-        numero_carte = donnees.get("numero_carte")
-        expiration = donnees.get("expiration")
-        cvc = donnees.get("cvc")
-
-        panier = obtenir_panier(session)
-        if not panier["items"]:
-            flash("Panier vide.", "error")
-            return redirect(url_for("panier_client"))
-
-        id_client = session["id_client"]
-        # Déterminer boutique depuis premier produit du panier
-        premier_produit = panier["items"][0]
-        requete_boutique = "SELECT id_boutique FROM produits WHERE id = %s"
-        boutique = executer_requete_sql(requete_boutique, (premier_produit["id"],), fetchone=True)
-        id_boutique = boutique["id_boutique"] if boutique else 1
-
-        id_commande = passer_commande(session, id_client, id_boutique, "carte")
-        if not id_commande:
-            flash("Erreur commande.", "error")
-            return redirect(url_for("page_paiement", etape=2))
-
-        if traiter_paiement(id_commande, "carte", {"nom_carte": nom_carte, "numero_carte": numero_carte, "expiration": expiration, "cvc": cvc}):
-            flash("Paiement réussi.", "success")
-            return redirect(url_for("page_paiement", etape=3))
-        else:
-            flash("Erreur paiement.", "error")
-            return redirect(url_for("page_paiement", etape=2))
+        details = {
+            "nom_carte": donnees.get("nom_carte"),
+            "numero_carte": donnees.get("numero_carte"),
+            "expiration": donnees.get("expiration"),
+            "cvc": donnees.get("cvc"),
+        }
+
+        etape_2 = url_for("page_paiement", etape=2)
+        return payer_panier(
+            "carte",
+            details,
+            succes=url_for("page_paiement", etape=3),
+            echec_commande=etape_2,
+            echec_paiement=etape_2,
+        )
 
     @app.post("/paiement/traiter")
     def traiter_paiement_route():
@@ -530,33 +692,13 @@ def enregistrer_routes(app):
         if guard:
             return guard
 
-        methode = request.form.get("methode")
-        details = request.form
-
-        # Simuler commande depuis panier (premier item pour boutique)
-        panier = obtenir_panier(session)
-        if not panier["items"]:
-            flash("Panier vide.", "error")
-            return redirect(url_for("panier_client"))
-
-        id_client = session["id_client"]
-        # Déterminer boutique depuis premier produit du panier
-        premier_produit = panier["items"][0]
-        requete_boutique = "SELECT id_boutique FROM produits WHERE id = %s"
-        boutique = executer_requete_sql(requete_boutique, (premier_produit["id"],), fetchone=True)
-        id_boutique = boutique["id_boutique"] if boutique else 1
-
-        id_commande = passer_commande(session, id_client, id_boutique, methode)
-        if not id_commande:
-            flash("Erreur commande.", "error")
-            return redirect(url_for("panier_client"))
-
-        if traiter_paiement(id_commande, methode, details):
-            flash("Paiement réussi.", "success")
-            return redirect(url_for("commandes_client"))
-        else:
-            flash("Erreur paiement.", "error")
-            return redirect(url_for("page_paiement"))
+        return payer_panier(
+            request.form.get("methode"),
+            request.form,
+            succes=url_for("commandes_client"),
+            echec_commande=url_for("panier_client"),
+            echec_paiement=url_for("page_paiement"),
+        )
 
     # ==========================================
     # ROUTES GÉNÉRALES
@@ -0,0 +1,28 @@
+"""
+Configuration pytest: les modules de l'application (models, controllers, config...)
+s'importent depuis djaapp/, comme dans app.py.
+
+Les tests qui ont besoin de MySQL utilisent la fixture `bdd_disponible`: ils sont
+ignorés si mysql-connector n'est pas installé ou si la base de DB_CONFIG n'est pas
+joignable et initialisée (POST /init-bdd).
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def bdd_disponible():
+    pytest.importorskip("mysql.connector")
+    from mysql.connector import Error
+    from models import bdd
+
+    try:
+        bdd.executer_requete_sql("SELECT 1 FROM compteurs_boutiques LIMIT 1", fetchone=True)
+    except Error as e:
+        pytest.skip(f"Base MySQL indisponible: {e}")
+    return bdd
@@ -0,0 +1,38 @@
+"""
+Non-régression de obtenir_statistiques_boutiques: mêmes nombres de produits et de
+commandes que l'ancienne requête (jointure produits x commandes), et un total_ventes
+exact là où l'ancienne le multipliait par le nombre de produits.
+"""
+
+import pytest
+
+NB_PRODUITS = 40
+NB_COMMANDES = 25
+
+
+@pytest.fixture
+def boutique_synthetique(bdd_disponible):
+    from benchmarks.bench_statistiques_boutiques import (
+        creer_boutique_synthetique,
+        supprimer_donnees_synthetiques,
+    )
+
+    id_commercant, id_client, totaux = creer_boutique_synthetique(NB_PRODUITS, NB_COMMANDES)
+    yield id_commercant, totaux
+    supprimer_donnees_synthetiques(id_commercant, id_client)
+
+
+def test_statistiques_equivalentes_a_l_ancienne_requete(bdd_disponible, boutique_synthetique):
+    from benchmarks.bench_statistiques_boutiques import ANCIENNE_REQUETE
+    from controllers.commercant import obtenir_statistiques_boutiques
+
+    id_commercant, totaux = boutique_synthetique
+    nouvelle, = obtenir_statistiques_boutiques(id_commercant)
+    ancienne = bdd_disponible.executer_requete_sql(ANCIENNE_REQUETE, (id_commercant,), fetchone=True)
+
+    assert nouvelle["id"] == ancienne["id"]
+    assert int(nouvelle["nb_produits"]) == int(ancienne["nb_produits"]) == NB_PRODUITS
+    assert int(nouvelle["nb_commandes"]) == int(ancienne["nb_commandes"]) == NB_COMMANDES
+    assert int(nouvelle["total_ventes"]) == sum(totaux)
+    # L'ancienne requête comptait chaque commande une fois par produit de la boutique
+    assert int(ancienne["total_ventes"]) == sum(totaux) * NB_PRODUITS
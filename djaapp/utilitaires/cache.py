@@ -0,0 +1,71 @@
+"""
+Utilitaires de cache en mémoire (par processus) avec durée de vie.
+"""
+
+import threading
+import time
+
+
+class CacheTTL:
+    """
+    Cache clé -> valeur dont les entrées expirent après `duree_vie` secondes.
+    Un seul calcul à la fois: les requêtes simultanées sur une entrée expirée
+    attendent le résultat au lieu de toutes interroger la base.
+    """
+
+    def __init__(self, duree_vie):
+        self.duree_vie = float(duree_vie)
+        self._entrees = {}
+        self._verrou = threading.Lock()
+        self._verrou_calcul = threading.Lock()
+        self._generation = 0
+        self.succes = 0
+        self.echecs = 0
+
+    def obtenir(self, cle, calculer):
+        """Retourner la valeur en cache pour `cle`, sinon appeler calculer() et la mémoriser."""
+        valeur = self._lire(cle)
+        if valeur is not None:
+            return valeur
+
+        with self._verrou_calcul:
+            # Un autre thread a peut-être recalculé pendant l'attente
+            valeur = self._lire(cle)
+            if valeur is not None:
+                return valeur
+            with self._verrou:
+                self.echecs += 1
+                generation = self._generation
+            valeur = calculer()
+            with self._verrou:
+                # Invalidé pendant le calcul: ne pas mémoriser une valeur peut-être périmée
+                if generation == self._generation:
+                    self._entrees[cle] = (time.monotonic() + self.duree_vie, valeur)
+            return valeur
+
+    def invalider(self, cle=None):
+        """Oublier une entrée, ou tout le cache si `cle` est None."""
+        with self._verrou:
+            if cle is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(cle, None)
+            self._generation += 1
+
+    def statistiques(self):
+        with self._verrou:
+            total = self.succes + self.echecs
+            return {
+                "entrees": len(self._entrees),
+                "succes": self.succes,
+                "echecs": self.echecs,
+                "taux_succes": (self.succes / total) if total else 0.0,
+            }
+
+    def _lire(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None or entree[0] <= time.monotonic():
+                return None
+            self.succes += 1
+            return entree[1]
@@ -0,0 +1,127 @@
+"""
+Utilitaires d'import de catalogue: lecture en flux de fichiers CSV ou JSON et
+validation des lignes produit avant écriture par lots.
+"""
+
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+# Lignes validées puis écrites par transaction
+TAILLE_LOT_IMPORT = 500
+
+# Caractères lus à chaque appel sur le flux JSON
+TAILLE_MORCEAU_JSON = 64 * 1024
+
+# Taille maximale (caractères) d'un élément JSON: au-delà, le fichier est rejeté
+# sans lire la suite (un objet mal formé ferait sinon grossir le tampon jusqu'à la fin)
+TAILLE_MAX_OBJET_JSON = 1024 * 1024
+
+# Prix maximal accepté par la colonne DECIMAL(10,2)
+PRIX_MAX = Decimal("99999999.99")
+
+# Erreurs détaillées conservées dans le rapport (les suivantes sont seulement comptées)
+ERREURS_MAX_RAPPORT = 1000
+
+# Longueurs maximales des colonnes de la table produits
+LONGUEURS_MAX = {"sku": 64, "nom": 100, "categorie": 50, "image": 255}
+
+
+def lire_lignes_csv(flux):
+    """Générateur de dicts depuis un flux texte CSV (première ligne = en-têtes)."""
+    for ligne in csv.DictReader(flux):
+        yield {(cle or "").strip().lower(): valeur for cle, valeur in ligne.items()}
+
+
+def lire_objets_json(flux, taille_morceau=TAILLE_MORCEAU_JSON, taille_max_objet=TAILLE_MAX_OBJET_JSON):
+    """
+    Générateur des éléments d'un tableau JSON (ou d'objets séparés par des retours
+    à la ligne), décodés au fil de la lecture sans charger tout le fichier.
+    Lève ValueError, avec la position en octets de l'élément fautif, si le contenu
+    n'est pas du JSON valide ou si un élément dépasse `taille_max_objet` caractères.
+    """
+    decodeur = json.JSONDecoder()
+    tampon = ""
+    # Octets (UTF-8) déjà retirés du tampon: position des erreurs dans le fichier
+    octets_lus = 0
+    while True:
+        morceau = flux.read(taille_morceau)
+        tampon += morceau
+        position = 0
+        while True:
+            # Séparateurs entre éléments: blancs, virgules, crochets du tableau englobant
+            while position < len(tampon) and tampon[position] in " \t\r\n,[]":
+                position += 1
+            if position >= len(tampon):
+                break
+            try:
+                objet, position_fin = decodeur.raw_decode(tampon, position)
+            except json.JSONDecodeError as e:
+                if not morceau:
+                    octet = octets_lus + len(tampon[:e.pos].encode("utf-8"))
+                    raise ValueError(f"JSON invalide à l'octet {octet}: {e.msg}")
+                if len(tampon) - position > taille_max_objet:
+                    octet = octets_lus + len(tampon[:position].encode("utf-8"))
+                    raise ValueError(
+                        f"JSON invalide à l'octet {octet}: élément mal formé ou de plus "
+                        f"de {taille_max_objet} caractères"
+                    )
+                # Élément coupé en fin de morceau: lire la suite
+                break
+            yield objet
+            position = position_fin
+        octets_lus += len(tampon[:position].encode("utf-8"))
+        tampon = tampon[position:]
+        if not morceau:
+            return
+
+
+def lire_lignes_fichier(flux_binaire, format_fichier):
+    """Lignes brutes d'un fichier importé ('csv' ou 'json'), lu en flux (UTF-8, BOM toléré)."""
+    flux = io.TextIOWrapper(flux_binaire, encoding="utf-8-sig", newline="")
+    if format_fichier == "json":
+        return lire_objets_json(flux)
+    if format_fichier == "csv":
+        return lire_lignes_csv(flux)
+    raise ValueError(f"Format non supporté: {format_fichier}")
+
+
+def valider_ligne_produit(brute):
+    """
+    Valider et normaliser une ligne produit.
+    Retourne (produit, None) si la ligne est valide, sinon (None, message d'erreur).
+    """
+    if not isinstance(brute, dict):
+        return None, "objet attendu"
+
+    def texte(cle):
+        valeur = brute.get(cle)
+        valeur = str(valeur).strip() if valeur is not None else ""
+        return valeur or None
+
+    produit = {cle: texte(cle) for cle in ("sku", "nom", "description", "categorie", "image")}
+    if not produit["sku"]:
+        return None, "sku manquant"
+    if not produit["nom"]:
+        return None, "nom manquant"
+    for cle, longueur in LONGUEURS_MAX.items():
+        if produit[cle] and len(produit[cle]) > longueur:
+            return None, f"{cle} trop long ({longueur} caractères max)"
+
+    try:
+        produit["prix"] = Decimal(str(brute.get("prix")).strip().replace(",", "."))
+    except InvalidOperation:
+        return None, "prix invalide"
+    if not produit["prix"].is_finite() or not 0 <= produit["prix"] <= PRIX_MAX:
+        return None, "prix invalide"
+    produit["prix"] = produit["prix"].quantize(Decimal("0.01"))
+
+    stock = texte("stock")
+    try:
+        produit["stock"] = int(stock) if stock is not None else 0
+    except ValueError:
+        return None, "stock invalide"
+    if produit["stock"] < 0:
+        return None, "stock négatif"
+    return produit, None
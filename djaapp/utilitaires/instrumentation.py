@@ -0,0 +1,93 @@
+"""
+Instrumentation SQL par requête HTTP: nombre de requêtes, durées totale et maximale,
+journal des requêtes lentes (paramètres masqués) et signalement des N+1 (même
+requête exécutée de nombreuses fois dans une seule requête HTTP).
+"""
+
+import logging
+from collections import Counter
+
+from flask import g, has_app_context, request
+
+from config import SEUIL_REQUETE_LENTE_MS, SEUIL_N_PLUS_UN
+from models.bdd import ajouter_ecouteur_sql
+
+journal = logging.getLogger("djaapp.sql")
+
+
+def masquer_params(params):
+    """Remplacer les valeurs par leur type: ni téléphone ni mot de passe dans les journaux."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {cle: f"<{type(valeur).__name__}>" for cle, valeur in params.items()}
+    params = list(params)
+    if params and isinstance(params[0], (tuple, list, dict)):
+        # executemany: une série de jeux de paramètres
+        return f"<{len(params)} lignes>"
+    return tuple(f"<{type(valeur).__name__}>" for valeur in params)
+
+
+def _texte(requete):
+    """Requête sur une ligne, pour les journaux."""
+    return " ".join(requete.split())
+
+
+def enregistrer_requete_sql(requete, params, duree, erreur=False):
+    """
+    Écouteur models.bdd: cumuler les mesures de la requête HTTP et journaliser les
+    requêtes lentes, y compris celles en échec (verrou, deadlock, délai dépassé).
+    """
+    duree_ms = duree * 1000
+    if duree_ms >= SEUIL_REQUETE_LENTE_MS:
+        journal.warning(
+            "Requête SQL lente%s (%.1f ms): %s params=%s",
+            " en échec" if erreur else "", duree_ms, _texte(requete), masquer_params(params),
+        )
+    mesures = g.get("mesures_sql") if has_app_context() else None
+    if mesures is None:
+        return
+    mesures["nb"] += 1
+    mesures["erreurs"] += erreur
+    mesures["total_ms"] += duree_ms
+    mesures["max_ms"] = max(mesures["max_ms"], duree_ms)
+    # Même texte (paramètres %s non substitués) = même requête
+    mesures["requetes"][requete] += 1
+
+
+def suspects_n_plus_un(mesures):
+    """[(nb_executions, requête)] des requêtes répétées au moins SEUIL_N_PLUS_UN fois."""
+    return [
+        (nb, _texte(requete))
+        for requete, nb in mesures["requetes"].most_common()
+        if nb >= SEUIL_N_PLUS_UN
+    ]
+
+
+def _debut_requete():
+    g.mesures_sql = {"nb": 0, "erreurs": 0, "total_ms": 0.0, "max_ms": 0.0, "requetes": Counter()}
+
+
+def _fin_requete(exception=None):
+    """Résumé compact par requête HTTP, plus un avertissement par N+1 suspect."""
+    mesures = g.pop("mesures_sql", None)
+    if mesures is None:
+        return
+    journal.info(
+        "%s %s: %d requêtes SQL (%d distinctes, %d en échec), total %.1f ms, max %.1f ms",
+        request.method, request.path, mesures["nb"], len(mesures["requetes"]), mesures["erreurs"],
+        mesures["total_ms"], mesures["max_ms"],
+    )
+    for nb, requete in suspects_n_plus_un(mesures):
+        journal.warning("N+1 suspect sur %s %s: %d x %s", request.method, request.path, nb, requete[:200])
+
+
+def instrumenter_sql(app):
+    """Activer l'instrumentation SQL sur l'application (voir INSTRUMENTATION_SQL dans config.py)."""
+    ajouter_ecouteur_sql(enregistrer_requete_sql)
+    app.before_request(_debut_requete)
+    app.teardown_request(_fin_requete)
+    if journal.level == logging.NOTSET:
+        journal.setLevel(logging.INFO)
+    if not journal.handlers and not logging.getLogger().handlers:
+        journal.addHandler(logging.StreamHandler())
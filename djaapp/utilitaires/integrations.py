@@ -5,6 +5,8 @@ Utilitaires pour intégrations externes (WhatsApp, Mobile Money, etc.).
 import os
 import requests
 
+from utilitaires.minutage import mesurer_appel_externe
+
 
 def partager_boutique_whatsapp(url_boutique):
     """
@@ -14,6 +16,7 @@ def partager_boutique_whatsapp(url_boutique):
     return f"https://wa.me/?text={requests.utils.quote(message)}"
 
 
+@mesurer_appel_externe
 def initier_paiement_mobile_money(numero, montant):
     """
     Initie un paiement Mobile Money (simulé pour l'instant).
@@ -0,0 +1,329 @@
+"""
+Métriques au format texte Prometheus: requêtes HTTP par endpoint (nombre, statut,
+histogramme de latence), pool de connexions, caches et routage BDD.
+
+Chemin critique sans verrou: chaque thread cumule dans ses propres dictionnaires,
+fusionnés à la lecture et repliés dans un total du processus quand le thread se
+termine. Plusieurs workers (gunicorn): chaque processus écrit régulièrement un
+instantané <pid>.json dans METRIQUES_DOSSIER (thread dédié, même sans trafic);
+/metrics, servi par n'importe quel worker, additionne les fichiers des processus
+vivants, supprime ceux des processus disparus et ajoute un label pid aux jauges.
+Un worker qui s'arrête retire son fichier: ses compteurs repartent de zéro
+(remise à zéro que rate() de Prometheus sait gérer).
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import g, request
+
+from config import METRIQUES_DOSSIER, METRIQUES_INTERVALLE_ECRITURE
+
+# Bornes (secondes) des seaux de l'histogramme de latence
+SEAUX_LATENCE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_locale = threading.local()
+_mesures_threads = []
+# Mesures des threads terminés, repliées par _replier_mesures
+_mesures_terminees = {"requetes": {}, "durees": {}}
+_verrou_enregistrement = threading.Lock()
+_verrou_ecriture = threading.Lock()
+_prochaine_ecriture = 0.0
+
+
+class _JetonThread:
+    """Objet gardé dans le stockage local du thread: libéré quand le thread se termine."""
+
+
+def _histogramme_vide():
+    # Un compteur par seau (non cumulés), +Inf, puis la somme des durées
+    return [0] * (len(SEAUX_LATENCE) + 1) + [0.0]
+
+
+def _cumuler(requetes, durees, mesures):
+    # Copies atomiques (GIL): le thread propriétaire peut continuer à écrire
+    for cle, nb in mesures["requetes"].copy().items():
+        requetes[cle] = requetes.get(cle, 0) + nb
+    for cle, histogramme in mesures["durees"].copy().items():
+        cumul = durees.setdefault(cle, _histogramme_vide())
+        for i, valeur in enumerate(list(histogramme)):
+            cumul[i] += valeur
+
+
+def _replier_mesures(mesures):
+    """Fin d'un thread: ses mesures passent dans le total du processus, la liste ne grandit pas."""
+    with _verrou_enregistrement:
+        _cumuler(_mesures_terminees["requetes"], _mesures_terminees["durees"], mesures)
+        _mesures_threads[:] = [m for m in _mesures_threads if m is not mesures]
+
+
+def _mesures_thread():
+    """Dictionnaires du thread courant, enregistrés une seule fois pour la fusion."""
+    mesures = getattr(_locale, "mesures", None)
+    if mesures is None:
+        mesures = {"requetes": {}, "durees": {}}
+        jeton = _JetonThread()
+        with _verrou_enregistrement:
+            _mesures_threads.append(mesures)
+        weakref.finalize(jeton, _replier_mesures, mesures)
+        _locale.mesures = mesures
+        _locale.jeton = jeton
+    return mesures
+
+
+def observer_requete(endpoint, methode, statut, duree):
+    """Compter une requête HTTP et sa durée (secondes)."""
+    mesures = _mesures_thread()
+    cle = (endpoint, methode, str(statut))
+    mesures["requetes"][cle] = mesures["requetes"].get(cle, 0) + 1
+    histogramme = mesures["durees"].get((endpoint, methode))
+    if histogramme is None:
+        histogramme = mesures["durees"][(endpoint, methode)] = _histogramme_vide()
+    histogramme[bisect.bisect_left(SEAUX_LATENCE, duree)] += 1
+    histogramme[-1] += duree
+
+
+def _jauges_processus():
+    """Pool, réplicas, routage, caches et purge des sessions du processus courant."""
+    jauges = {}
+    try:
+        from models.bdd import obtenir_pool, statistiques_routage
+        jauges["pool"] = obtenir_pool().statistiques()
+        jauges["routage"] = statistiques_routage()
+    except Exception:
+        pass
+    try:
+        from controllers.client import statistiques_cache_boutiques_populaires
+        jauges["caches"] = {"boutiques_populaires": statistiques_cache_boutiques_populaires()}
+    except Exception:
+        pass
+    try:
+        from utilitaires.sessions import statistiques_balayage
+        jauges["sessions"] = statistiques_balayage()
+    except Exception:
+        pass
+    return jauges
+
+
+def instantane_processus():
+    """Mesures fusionnées des threads du processus, sérialisables en JSON."""
+    requetes, durees = {}, {}
+    with _verrou_enregistrement:
+        _cumuler(requetes, durees, _mesures_terminees)
+        threads = list(_mesures_threads)
+    for mesures in threads:
+        _cumuler(requetes, durees, mesures)
+    return {
+        "pid": os.getpid(),
+        "requetes": [[*cle, nb] for cle, nb in requetes.items()],
+        "durees": [[*cle, histogramme] for cle, histogramme in durees.items()],
+        "jauges": _jauges_processus(),
+    }
+
+
+def ecrire_instantane(dossier=METRIQUES_DOSSIER):
+    """Écrire l'instantané du processus (remplacement atomique de <pid>.json)."""
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f"{os.getpid()}.json")
+    temporaire = chemin + ".tmp"
+    with open(temporaire, "w", encoding="utf-8") as fichier:
+        json.dump(instantane_processus(), fichier)
+    os.replace(temporaire, chemin)
+
+
+def ecrire_instantane_si_du(dossier=METRIQUES_DOSSIER):
+    """Écrire l'instantané au plus une fois par METRIQUES_INTERVALLE_ECRITURE, sans faire attendre."""
+    global _prochaine_ecriture
+    maintenant = time.monotonic()
+    if maintenant < _prochaine_ecriture or not _verrou_ecriture.acquire(blocking=False):
+        return
+    try:
+        _prochaine_ecriture = maintenant + METRIQUES_INTERVALLE_ECRITURE
+        ecrire_instantane(dossier)
+    except OSError:
+        pass
+    finally:
+        _verrou_ecriture.release()
+
+
+def _ecrire_periodiquement(dossier):
+    """Boucle du thread d'écriture: un worker sans trafic publie quand même ses mesures."""
+    while True:
+        time.sleep(METRIQUES_INTERVALLE_ECRITURE)
+        ecrire_instantane_si_du(dossier)
+
+
+def _retirer_instantane(dossier=METRIQUES_DOSSIER, pid=None):
+    """Supprimer l'instantané d'un processus (le courant par défaut)."""
+    try:
+        os.remove(os.path.join(dossier, f"{pid or os.getpid()}.json"))
+    except OSError:
+        pass
+
+
+def _processus_vivant(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _lire_instantanes(dossier):
+    """Instantanés des processus vivants; ceux des processus disparus sont supprimés."""
+    instantanes = []
+    for chemin in glob.glob(os.path.join(dossier, "*.json")):
+        try:
+            pid = int(os.path.basename(chemin)[:-len(".json")])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _processus_vivant(pid):
+            _retirer_instantane(dossier, pid)
+            continue
+        try:
+            with open(chemin, encoding="utf-8") as fichier:
+                instantanes.append(json.load(fichier))
+        except (OSError, ValueError):
+            continue
+    return instantanes
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{cle}="{_echapper(valeur)}"' for cle, valeur in labels.items()) + "}"
+
+
+def _format(nombre):
+    return repr(float(nombre)) if isinstance(nombre, float) else str(nombre)
+
+
+def generer_metriques(dossier=METRIQUES_DOSSIER):
+    """Texte d'exposition Prometheus (version 0.0.4) agrégé sur tous les processus."""
+    try:
+        ecrire_instantane(dossier)
+        instantanes = _lire_instantanes(dossier)
+    except OSError:
+        instantanes = [instantane_processus()]
+
+    requetes, durees = {}, {}
+    for instantane in instantanes:
+        for endpoint, methode, statut, nb in instantane["requetes"]:
+            cle = (endpoint, methode, statut)
+            requetes[cle] = requetes.get(cle, 0) + nb
+        for endpoint, methode, histogramme in instantane["durees"]:
+            cumul = durees.setdefault((endpoint, methode), _histogramme_vide())
+            for i, valeur in enumerate(histogramme):
+                cumul[i] += valeur
+
+    lignes = [
+        "# HELP djaapp_requetes_http_total Requetes HTTP traitees par endpoint, methode et statut.",
+        "# TYPE djaapp_requetes_http_total counter",
+    ]
+    for (endpoint, methode, statut), nb in sorted(requetes.items()):
+        lignes.append(f"djaapp_requetes_http_total{_labels(endpoint=endpoint, methode=methode, statut=statut)} {nb}")
+
+    lignes += [
+        "# HELP djaapp_duree_requete_http_secondes Duree de traitement des requetes HTTP.",
+        "# TYPE djaapp_duree_requete_http_secondes histogram",
+    ]
+    for (endpoint, methode), histogramme in sorted(durees.items()):
+        cumul = 0
+        for borne, nb in zip([*map(str, SEAUX_LATENCE), "+Inf"], histogramme[:-1]):
+            cumul += nb
+            labels = _labels(endpoint=endpoint, methode=methode, le=borne)
+            lignes.append(f"djaapp_duree_requete_http_secondes_bucket{labels} {cumul}")
+        labels = _labels(endpoint=endpoint, methode=methode)
+        lignes.append(f"djaapp_duree_requete_http_secondes_sum{labels} {_format(histogramme[-1])}")
+        lignes.append(f"djaapp_duree_requete_http_secondes_count{labels} {cumul}")
+
+    # Jauges et compteurs propres à chaque processus (label pid)
+    familles = {}
+
+    def ajouter(nom, type_metrique, aide, labels, valeur):
+        familles.setdefault(nom, (type_metrique, aide, []))[2].append((labels, valeur))
+
+    for instantane in instantanes:
+        pid = instantane["pid"]
+        jauges = instantane.get("jauges", {})
+        pool = jauges.get("pool")
+        if pool:
+            for etat in ("ouvertes", "libres", "empruntees"):
+                ajouter("djaapp_pool_connexions", "gauge", "Connexions du pool par etat.",
+                        _labels(pid=pid, etat=etat), pool[etat])
+            ajouter("djaapp_pool_en_attente", "gauge", "Threads en attente d'une connexion (file d'attente).",
+                    _labels(pid=pid), pool["en_attente"])
+            ajouter("djaapp_pool_expirations_total", "counter", "Attentes de connexion expirees (PoolError).",
+                    _labels(pid=pid), pool["expirations"])
+            ajouter("djaapp_pool_emprunts_total", "counter", "Connexions empruntees au pool.",
+                    _labels(pid=pid), pool["emprunts"])
+        routage = jauges.get("routage")
+        if routage:
+            for cible in ("replica", "primaire"):
+                ajouter("djaapp_bdd_lectures_total", "counter", "Lectures SQL par destination.",
+                        _labels(pid=pid, cible=cible), routage[f"lectures_{cible}"])
+            for i, replica in enumerate(routage.get("replicas", [])):
+                ajouter("djaapp_replica_connexions_empruntees", "gauge", "Connexions empruntees par replica.",
+                        _labels(pid=pid, replica=i), replica["empruntees"])
+        for nom_cache, stats in jauges.get("caches", {}).items():
+            ajouter("djaapp_cache_succes_total", "counter", "Lectures servies par le cache.",
+                    _labels(pid=pid, cache=nom_cache), stats["succes"])
+            ajouter("djaapp_cache_echecs_total", "counter", "Lectures recalculees (absentes ou expirees).",
+                    _labels(pid=pid, cache=nom_cache), stats["echecs"])
+        sessions = jauges.get("sessions")
+        if sessions:
+            # Comptes du stockage (partagé pour MySQL): relevés au dernier passage de ce processus
+            if sessions["sessions"] is not None:
+                ajouter("djaapp_sessions", "gauge", "Sessions stockees.",
+                        _labels(pid=pid), sessions["sessions"])
+                ajouter("djaapp_sessions_octets", "gauge", "Taille des donnees de session stockees.",
+                        _labels(pid=pid), sessions["octets"])
+            ajouter("djaapp_sessions_supprimees_total", "counter", "Sessions expirees supprimees par la purge.",
+                    _labels(pid=pid), sessions["sessions_supprimees"])
+            ajouter("djaapp_balayage_sessions_total", "counter", "Passages de purge des sessions.",
+                    _labels(pid=pid), sessions["balayages"])
+            ajouter("djaapp_balayage_sessions_secondes_total", "counter", "Duree cumulee des passages de purge.",
+                    _labels(pid=pid), sessions["duree_totale_balayages"])
+            ajouter("djaapp_balayage_sessions_dernier_secondes", "gauge", "Duree du dernier passage de purge.",
+                    _labels(pid=pid), sessions["duree_dernier_balayage"])
+
+    for nom, (type_metrique, aide, echantillons) in familles.items():
+        lignes.append(f"# HELP {nom} {aide}")
+        lignes.append(f"# TYPE {nom} {type_metrique}")
+        lignes.extend(f"{nom}{labels} {_format(valeur)}" for labels, valeur in echantillons)
+    return "\n".join(lignes) + "\n"
+
+
+def activer_metriques(app):
+    """Mesurer chaque requête de `app` (durée jusqu'à la réponse, endpoint, statut)."""
+    etat = {"pid": None}
+
+    @app.before_request
+    def _debut_metriques():
+        if etat["pid"] != os.getpid():
+            # Premier passage du processus (après le fork des workers)
+            etat["pid"] = os.getpid()
+            threading.Thread(
+                target=_ecrire_periodiquement, args=(METRIQUES_DOSSIER,), name="metriques", daemon=True
+            ).start()
+            atexit.register(_retirer_instantane)
+        g.debut_metriques = time.perf_counter()
+
+    @app.after_request
+    def _fin_metriques(reponse):
+        debut = g.pop("debut_metriques", None)
+        if debut is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "inconnu"
+            observer_requete(endpoint, request.method, reponse.status_code, time.perf_counter() - debut)
+            ecrire_instantane_si_du()
+        return reponse
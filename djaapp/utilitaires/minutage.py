@@ -0,0 +1,108 @@
+"""
+Minutage des phases d'une requête HTTP: base de données (db), rendu des templates
+Jinja (tpl) et appels externes (ext: SMS, email, Mobile Money). Restitué dans
+l'en-tête Server-Timing et/ou journalisé pour un échantillon des requêtes.
+
+Désactivé, rien n'est enregistré sur l'application: il ne reste que le test
+fait par les fonctions décorées avec @mesurer_appel_externe.
+"""
+
+import functools
+import logging
+import random
+import time
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+
+from models.bdd import ajouter_ecouteur_sql
+
+journal = logging.getLogger("djaapp.minutage")
+
+# (clé, description) des métriques Server-Timing, dans l'ordre d'émission
+METRIQUES = (("db", "MySQL"), ("tpl", "Templates"), ("ext", "Appels externes"))
+
+
+def _ajouter(phase, duree):
+    """Cumuler une durée (secondes) dans le minutage de la requête en cours, s'il existe."""
+    minutage = g.get("minutage") if has_app_context() else None
+    if minutage is not None:
+        minutage[phase] += duree
+        minutage["nb_" + phase] += 1
+
+
+def mesurer_appel_externe(fonction):
+    """Décorateur: compter la durée de `fonction` dans la phase ext de la requête."""
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        if not has_app_context() or g.get("minutage") is None:
+            return fonction(*args, **kwargs)
+        debut = time.perf_counter()
+        try:
+            return fonction(*args, **kwargs)
+        finally:
+            _ajouter("ext", time.perf_counter() - debut)
+    return enveloppe
+
+
+def _requete_sql(requete, params, duree, erreur=False):
+    _ajouter("db", duree)
+
+
+def _avant_template(app, template, context, **extra):
+    minutage = g.get("minutage")
+    if minutage is not None:
+        minutage["debuts_tpl"].append(time.perf_counter())
+
+
+def _apres_template(app, template, context, **extra):
+    minutage = g.get("minutage")
+    if minutage is not None and minutage["debuts_tpl"]:
+        _ajouter("tpl", time.perf_counter() - minutage["debuts_tpl"].pop())
+
+
+def formater_server_timing(minutage, total):
+    """Valeur de l'en-tête Server-Timing (durées en millisecondes)."""
+    parties = [
+        f'{cle};dur={minutage[cle] * 1000:.1f};desc="{description} ({minutage["nb_" + cle]})"'
+        for cle, description in METRIQUES
+    ]
+    parties.append(f'total;dur={total * 1000:.1f};desc="Total"')
+    return ", ".join(parties)
+
+
+def activer_minutage(app, en_tete=True, echantillon=0.0):
+    """
+    Mesurer chaque requête de `app`. en_tete: ajouter Server-Timing aux réponses;
+    echantillon: fraction des requêtes journalisées sur le logger djaapp.minutage.
+    """
+    ajouter_ecouteur_sql(_requete_sql)
+    before_render_template.connect(_avant_template, app)
+    template_rendered.connect(_apres_template, app)
+
+    @app.before_request
+    def _debut_minutage():
+        g.minutage = {
+            "debut": time.perf_counter(),
+            "debuts_tpl": [],
+            **{cle: 0.0 for cle, _ in METRIQUES},
+            **{"nb_" + cle: 0 for cle, _ in METRIQUES},
+        }
+
+    @app.after_request
+    def _fin_minutage(reponse):
+        minutage = g.pop("minutage", None)
+        if minutage is None:
+            return reponse
+        total = time.perf_counter() - minutage["debut"]
+        valeur = formater_server_timing(minutage, total)
+        if en_tete:
+            reponse.headers["Server-Timing"] = valeur
+        if echantillon and random.random() < echantillon:
+            journal.info("%s %s %s: %s", request.method, request.path, reponse.status_code, valeur)
+        return reponse
+
+    if echantillon:
+        if journal.level == logging.NOTSET:
+            journal.setLevel(logging.INFO)
+        if not journal.handlers and not logging.getLogger().handlers:
+            journal.addHandler(logging.StreamHandler())
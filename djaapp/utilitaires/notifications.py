@@ -7,6 +7,8 @@ from twilio.rest import Client
 import smtplib
 from email.mime.text import MIMEText
 
+from utilitaires.minutage import mesurer_appel_externe
+
 
 # Configuration (à mettre dans config.py plus tard)
 TWILIO_SID = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -19,6 +21,7 @@ SMTP_EMAIL = os.environ.get("SMTP_EMAIL")
 SMTP_MDP = os.environ.get("SMTP_PASSWORD")
 
 
+@mesurer_appel_externe
 def envoyer_sms(telephone, message):
     """
     Envoie un SMS via Twilio.
@@ -40,6 +43,7 @@ def envoyer_sms(telephone, message):
         return False
 
 
+@mesurer_appel_externe
 def envoyer_email(destinataire, sujet, message):
     """
     Envoie un email via SMTP.
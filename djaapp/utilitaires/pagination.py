@@ -0,0 +1,48 @@
+"""
+Utilitaires de pagination par curseur (keyset) pour les listes de commandes et produits.
+Le curseur désigne la dernière ligne affichée; la page suivante est lue avec
+WHERE (date_commande, id) < curseur plutôt qu'avec OFFSET.
+"""
+
+from datetime import datetime
+
+# Nombre de lignes par page par défaut
+TAILLE_PAGE = 20
+
+
+def encoder_curseur_commande(commande):
+    """Curseur texte '<date_commande ISO>_<id>' d'une commande."""
+    return f"{commande['date_commande'].isoformat()}_{commande['id']}"
+
+
+def decoder_curseur_commande(curseur):
+    """Retourner (date_commande, id) depuis un curseur de commande, None si invalide."""
+    try:
+        date_texte, id_texte = (curseur or "").rsplit("_", 1)
+        return datetime.fromisoformat(date_texte), int(id_texte)
+    except ValueError:
+        return None
+
+
+def encoder_curseur_produit(produit):
+    """Curseur texte '<id>' d'un produit."""
+    return str(produit["id"])
+
+
+def decoder_curseur_produit(curseur):
+    """Retourner l'id d'un curseur de produit, None si invalide."""
+    try:
+        return int(curseur)
+    except (TypeError, ValueError):
+        return None
+
+
+def decouper_page(lignes, limite, encoder):
+    """
+    Les requêtes lisent limite + 1 lignes: s'il y en a une de trop, il existe une page
+    suivante. Retourne (lignes de la page, curseur de la page suivante ou None).
+    """
+    if len(lignes) <= limite:
+        return lignes, None
+    page = lignes[:limite]
+    return page, encoder(page[-1])
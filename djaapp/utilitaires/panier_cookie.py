@@ -0,0 +1,176 @@
+"""
+Panier des visiteurs anonymes dans un cookie signé (PANIER_COOKIE), sans session serveur.
+
+Format: un octet de version (1 brut, 2 zlib) puis, par produit trié par id, deux
+varints (écart avec l'id précédent, quantité); base64 URL signé par itsdangerous.
+Le panier passe dans la session à la connexion (fusionner_panier_cookie), ou dès
+que le cookie dépasserait PANIER_COOKIE_TAILLE_MAX ou LIGNES_MAX produits.
+"""
+
+import base64
+import zlib
+
+from flask import after_this_request, current_app, g, request, session
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from config import (
+    PANIER_COOKIE,
+    PANIER_COOKIE_COMPRESSION,
+    PANIER_COOKIE_DUREE_JOURS,
+    PANIER_COOKIE_TAILLE_MAX,
+)
+
+NOM_COOKIE_PANIER = "djaapp_panier"
+
+VERSION_BRUT = 1
+VERSION_ZLIB = 2
+
+# Produits au plus dans le cookie; au décodage, garde-fou contre un contenu
+# démesuré malgré la signature (clé compromise)
+LIGNES_MAX = 500
+OCTETS_DECOMPRESSES_MAX = 8192
+
+
+def _signataire():
+    return Signer(current_app.config["SECRET_KEY"], salt="djaapp.panier")
+
+
+def _ecrire_varint(sortie, nombre):
+    while nombre >= 0x80:
+        sortie.append((nombre & 0x7F) | 0x80)
+        nombre >>= 7
+    sortie.append(nombre)
+
+
+def _lire_varint(donnees, position):
+    nombre = decalage = 0
+    while True:
+        octet = donnees[position]
+        position += 1
+        nombre |= (octet & 0x7F) << decalage
+        if octet < 0x80:
+            return nombre, position
+        decalage += 7
+        if decalage > 63:
+            raise ValueError("varint trop long")
+
+
+def encoder_panier(panier, compresser=PANIER_COOKIE_COMPRESSION):
+    """Valeur signée du cookie pour {str(id_produit): quantite} (lignes à quantité <= 0 ignorées)."""
+    corps = bytearray()
+    precedent = 0
+    for id_produit, quantite in sorted((int(i), int(q)) for i, q in panier.items() if int(q) > 0):
+        _ecrire_varint(corps, id_produit - precedent)
+        _ecrire_varint(corps, quantite)
+        precedent = id_produit
+    donnees = bytes([VERSION_BRUT]) + corps
+    if compresser:
+        compresse = zlib.compress(bytes(corps), 9)
+        # Quelques lignes ne se compressent pas: garder la plus courte
+        if len(compresse) < len(corps):
+            donnees = bytes([VERSION_ZLIB]) + compresse
+    texte = base64.urlsafe_b64encode(donnees).rstrip(b"=")
+    return _signataire().sign(texte).decode("ascii")
+
+
+def decoder_panier(valeur):
+    """Panier {str(id_produit): quantite} d'une valeur de cookie; {} si absente, altérée ou illisible."""
+    if not valeur:
+        return {}
+    try:
+        texte = _signataire().unsign(valeur.encode("ascii"))
+        donnees = base64.urlsafe_b64decode(texte + b"=" * (-len(texte) % 4))
+        version, corps = donnees[0], donnees[1:]
+        if version == VERSION_ZLIB:
+            decompresseur = zlib.decompressobj()
+            corps = decompresseur.decompress(corps, OCTETS_DECOMPRESSES_MAX)
+            if decompresseur.unconsumed_tail:
+                return {}
+        elif version != VERSION_BRUT:
+            return {}
+        panier = {}
+        position = id_produit = 0
+        while position < len(corps):
+            if len(panier) >= LIGNES_MAX:
+                return {}
+            ecart, position = _lire_varint(corps, position)
+            quantite, position = _lire_varint(corps, position)
+            id_produit += ecart
+            if quantite > 0:
+                panier[str(id_produit)] = quantite
+        return panier
+    except (BadSignature, ValueError, IndexError, UnicodeError, zlib.error):
+        return {}
+
+
+class PanierCookie(CallbackDict):
+    """
+    Remplaçant de la session pour la clé "panier" (mêmes get / [] que la session):
+    toute écriture programme l'envoi du cookie avec la réponse.
+    """
+
+    def __init__(self, panier):
+        self._cookie_programme = False
+        super().__init__({"panier": panier}, on_update=lambda _: self._programmer_cookie())
+
+    def _programmer_cookie(self):
+        if self._cookie_programme:
+            return
+        self._cookie_programme = True
+
+        @after_this_request
+        def _poser_cookie(reponse):
+            panier = self.get("panier") or {}
+            valeur = encoder_panier(panier) if panier else None
+            if valeur is not None and (len(valeur) > PANIER_COOKIE_TAILLE_MAX or len(panier) > LIGNES_MAX):
+                # Trop gros pour un cookie: le panier passe en session
+                session["panier"] = panier
+                valeur = None
+            if valeur is None:
+                reponse.delete_cookie(NOM_COOKIE_PANIER)
+            else:
+                reponse.set_cookie(
+                    NOM_COOKIE_PANIER,
+                    valeur,
+                    max_age=PANIER_COOKIE_DUREE_JOURS * 86400,
+                    httponly=True,
+                    secure=request.is_secure,
+                    samesite="Lax",
+                )
+            return reponse
+
+
+def support_panier():
+    """
+    Où lire et écrire ["panier"]: la session, ou le cookie signé pour un visiteur
+    anonyme en mode PANIER_COOKIE (un panier déjà passé en session y reste).
+    """
+    if not PANIER_COOKIE or session.get("id_client") or "panier" in session:
+        return session
+    if "panier_cookie" not in g:
+        g.panier_cookie = PanierCookie(decoder_panier(request.cookies.get(NOM_COOKIE_PANIER)))
+    return g.panier_cookie
+
+
+def panier_en_cookie():
+    """Vrai si la requête utilise le panier en cookie (pas de flash: il écrirait la session)."""
+    return support_panier() is not session
+
+
+def fusionner_panier_cookie():
+    """Ajouter le panier du cookie à celui de la session (connexion, paiement) et effacer le cookie."""
+    valeur = request.cookies.get(NOM_COOKIE_PANIER)
+    if not valeur:
+        return
+    panier_cookie = decoder_panier(valeur)
+    if panier_cookie:
+        panier = session.get("panier", {})
+        for id_produit, quantite in panier_cookie.items():
+            panier[id_produit] = panier.get(id_produit, 0) + quantite
+        session["panier"] = panier
+
+    @after_this_request
+    def _effacer_cookie(reponse):
+        reponse.delete_cookie(NOM_COOKIE_PANIER)
+        return reponse
@@ -0,0 +1,428 @@
+"""
+Sessions côté serveur à faible latence: stockage MySQL (table sessions_web, partagée
+entre les nœuds) ou SQLite local en mode WAL, choisi par SESSION_TYPE.
+
+La session n'est écrite que si elle a changé. Une session seulement lue n'est
+réécrite que pour prolonger son expiration quand la moitié de sa durée de vie
+est écoulée.
+
+Les sessions expirées sont purgées par petits lots (BalayeurSessions), quel que
+soit le stockage, fichiers de Flask-Session compris.
+"""
+
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+journal = logging.getLogger("djaapp.sessions")
+
+
+class SessionServeur(CallbackDict, SessionMixin):
+    """Session identifiée par `sid`; `modified` passe à True à chaque changement."""
+
+    def __init__(self, donnees=None, sid=None, nouvelle=False, expiration=None):
+        def marquer_modifiee(_):
+            self.modified = True
+
+        super().__init__(donnees or {}, marquer_modifiee)
+        self.sid = sid
+        self.new = nouvelle
+        # Expiration (datetime UTC avec fuseau) enregistrée dans le stockage
+        self.expiration = expiration
+        self.modified = False
+
+
+# ---------------------------------------------
+# Stockages
+# ---------------------------------------------
+
+class StockageSessionsMySQL:
+    """
+    Table sessions_web (créée par /init-bdd), via la connexion de la requête.
+    La colonne DATETIME stocke l'heure UTC sans fuseau (comparée à UTC_TIMESTAMP()).
+    """
+
+    def lire(self, sid):
+        from models.bdd import lire_session_web
+        ligne = lire_session_web(sid)
+        if ligne is None:
+            return None
+        return bytes(ligne["donnees"]), ligne["expiration"].replace(tzinfo=timezone.utc)
+
+    def ecrire(self, sid, donnees, expiration):
+        from models.bdd import ecrire_session_web
+        ecrire_session_web(sid, donnees, _utc_sans_fuseau(expiration))
+
+    def prolonger(self, sid, expiration):
+        from models.bdd import prolonger_session_web
+        prolonger_session_web(sid, _utc_sans_fuseau(expiration))
+
+    def supprimer(self, sid):
+        from models.bdd import supprimer_session_web
+        supprimer_session_web(sid)
+
+    def purger(self, limite):
+        from models.bdd import purger_sessions_web
+        return purger_sessions_web(limite)
+
+    def statistiques(self):
+        from models.bdd import compter_sessions_web
+        ligne = compter_sessions_web()
+        return {"nb": int(ligne["nb"]), "octets": int(ligne["octets"])}
+
+
+class StockageSessionsSQLite:
+    """
+    Fichier SQLite local en mode WAL (lectures concurrentes, une écriture = un
+    ajout au journal). Une connexion par thread et par processus.
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._locale = threading.local()
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        conn = self._connexion()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions_web ("
+            "id TEXT PRIMARY KEY, donnees BLOB NOT NULL, expiration REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiration ON sessions_web (expiration)")
+
+    def _connexion(self):
+        conn = getattr(self._locale, "conn", None)
+        if conn is None or self._locale.pid != os.getpid():
+            # isolation_level=None: autocommit, chaque instruction est sa propre transaction
+            conn = sqlite3.connect(self.chemin, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # NORMAL en WAL: pas de fsync à chaque écriture, base toujours cohérente
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._locale.conn = conn
+            self._locale.pid = os.getpid()
+        return conn
+
+    def lire(self, sid):
+        ligne = self._connexion().execute(
+            "SELECT donnees, expiration FROM sessions_web WHERE id = ? AND expiration > ?",
+            (sid, time.time()),
+        ).fetchone()
+        if ligne is None:
+            return None
+        return ligne[0], datetime.fromtimestamp(ligne[1], timezone.utc)
+
+    def ecrire(self, sid, donnees, expiration):
+        self._connexion().execute(
+            "INSERT INTO sessions_web (id, donnees, expiration) VALUES (?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET donnees = excluded.donnees, expiration = excluded.expiration",
+            (sid, donnees, _horodatage(expiration)),
+        )
+
+    def prolonger(self, sid, expiration):
+        self._connexion().execute(
+            "UPDATE sessions_web SET expiration = ? WHERE id = ?", (_horodatage(expiration), sid)
+        )
+
+    def supprimer(self, sid):
+        self._connexion().execute("DELETE FROM sessions_web WHERE id = ?", (sid,))
+
+    def purger(self, limite):
+        curseur = self._connexion().execute(
+            "DELETE FROM sessions_web WHERE id IN "
+            "(SELECT id FROM sessions_web WHERE expiration < ? ORDER BY expiration LIMIT ?)",
+            (time.time(), limite),
+        )
+        return curseur.rowcount
+
+    def statistiques(self):
+        nb, octets = self._connexion().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(donnees)), 0) FROM sessions_web"
+        ).fetchone()
+        return {"nb": nb, "octets": octets}
+
+
+class StockageSessionsFichiers:
+    """
+    Fichiers de Flask-Session (cachelib FileSystemCache: 4 octets d'expiration
+    puis les données). Flask-Session garde la lecture et l'écriture; cette classe
+    ne fait que purger et compter, en reprenant le parcours du dossier là où le
+    lot précédent s'est arrêté.
+    """
+
+    # Fichiers de gestion de cachelib (version épinglée dans requirements.txt):
+    # compteur, nommé par le hachage sha256 de sa clé, et écritures en cours
+    CLE_COMPTEUR = "__wz_cache_count"
+    FICHIER_COMPTEUR = hashlib.sha256(CLE_COMPTEUR.encode()).hexdigest()
+    SUFFIXE_TRANSACTION = ".__wz_cache"
+
+    def __init__(self, dossier, seuil=500):
+        self.dossier = dossier
+        self._parcours = None
+        self._nb = 0
+        self._octets = 0
+        self._derniers = {"nb": None, "octets": None}
+        try:
+            from cachelib.file import FileSystemCache
+            self._cache = FileSystemCache(dossier, threshold=seuil)
+        except Exception:
+            self._cache = None
+
+    def _est_fichier_gestion(self, nom):
+        return nom == self.FICHIER_COMPTEUR or nom.endswith(self.SUFFIXE_TRANSACTION)
+
+    def purger(self, limite):
+        """Examiner au plus `limite` fichiers, supprimer ceux dont l'expiration est passée."""
+        if self._parcours is None:
+            self._parcours = os.scandir(self.dossier)
+            self._nb = self._octets = 0
+        maintenant = time.time()
+        supprimes = 0
+        for _ in range(limite):
+            entree = next(self._parcours, None)
+            if entree is None:
+                # Parcours complet: comptes exacts, compteur de cachelib recalé
+                self._parcours.close()
+                self._parcours = None
+                self._derniers = {"nb": self._nb, "octets": self._octets}
+                self._recaler_compteur_cachelib(self._nb)
+                break
+            if self._est_fichier_gestion(entree.name):
+                continue
+            try:
+                with open(entree.path, "rb") as fichier:
+                    expiration = struct.unpack("I", fichier.read(4))[0]
+                taille = entree.stat().st_size
+            except (OSError, struct.error):
+                continue
+            if expiration != 0 and expiration < maintenant:
+                try:
+                    os.remove(entree.path)
+                    supprimes += 1
+                except OSError:
+                    pass
+            else:
+                self._nb += 1
+                self._octets += taille
+        return supprimes
+
+    def statistiques(self):
+        """Comptes du dernier parcours complet (None avant le premier)."""
+        return dict(self._derniers)
+
+    def _recaler_compteur_cachelib(self, nb):
+        # Sans recalage, le compteur de cachelib ne voit pas nos suppressions, reste
+        # au-dessus du seuil et déclenche un parcours complet du dossier à chaque écriture
+        if self._cache is not None:
+            # set() public de cachelib: mgmt_element écrit sans expiration ni élagage
+            self._cache.set(self.CLE_COMPTEUR, nb, mgmt_element=True)
+
+
+def _horodatage(expiration):
+    return expiration.timestamp()
+
+
+def _utc_sans_fuseau(expiration):
+    return expiration.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------------------------------------
+# Interface Flask
+# ---------------------------------------------
+
+class InterfaceSessionsStockees(SessionInterface):
+    """SessionInterface Flask au-dessus d'un stockage (lire, ecrire, prolonger, supprimer)."""
+
+    serializer = session_json_serializer
+
+    def __init__(self, stockage):
+        self.stockage = stockage
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            trouvee = self.stockage.lire(sid)
+            if trouvee is not None:
+                donnees, expiration = trouvee
+                try:
+                    return SessionServeur(self.serializer.loads(donnees.decode("utf-8")), sid, expiration=expiration)
+                except ValueError:
+                    pass
+        return SessionServeur(sid=secrets.token_urlsafe(32), nouvelle=True)
+
+    def save_session(self, app, session, response):
+        nom = self.get_cookie_name(app)
+        domaine = self.get_cookie_domain(app)
+        chemin = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                # Session vidée (déconnexion): supprimer la ligne et le cookie
+                self.stockage.supprimer(session.sid)
+                response.delete_cookie(nom, domain=domaine, path=chemin)
+            return
+
+        duree_vie = app.permanent_session_lifetime
+        maintenant = datetime.now(timezone.utc)
+        expiration = maintenant + duree_vie
+        if session.modified or session.new:
+            donnees = self.serializer.dumps(dict(session)).encode("utf-8")
+            self.stockage.ecrire(session.sid, donnees, expiration)
+        elif session.expiration is not None and session.expiration - maintenant < duree_vie / 2:
+            # Session seulement lue: prolonger rarement plutôt qu'à chaque requête
+            self.stockage.prolonger(session.sid, expiration)
+        else:
+            return
+
+        response.set_cookie(
+            nom,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domaine,
+            path=chemin,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def creer_interface_sessions(type_session, chemin_sqlite=None):
+    """Interface de session pour SESSION_TYPE 'mysql' ou 'sqlite'."""
+    if type_session == "mysql":
+        return InterfaceSessionsStockees(StockageSessionsMySQL())
+    if type_session == "sqlite":
+        return InterfaceSessionsStockees(StockageSessionsSQLite(chemin_sqlite))
+    raise ValueError(f"SESSION_TYPE non géré par utilitaires.sessions: {type_session}")
+
+
+# ---------------------------------------------
+# Purge des sessions expirées
+# ---------------------------------------------
+
+class BalayeurSessions:
+    """
+    Purge incrémentale: chaque passage supprime au plus `taille_lot` sessions
+    expirées. Passages espacés de `intervalle` secondes, rapprochés tant qu'un
+    lot plein indique un arriéré.
+
+    Le nombre et la taille des sessions (parcours complet de la table en MySQL /
+    SQLite) ne sont calculés qu'à la demande (/sante, /metrics), au plus une fois
+    par `intervalle_statistiques` secondes.
+    """
+
+    def __init__(self, stockage, taille_lot=200, intervalle=60.0, intervalle_statistiques=300.0):
+        self.stockage = stockage
+        self.taille_lot = int(taille_lot)
+        self.intervalle = float(intervalle)
+        self.intervalle_statistiques = float(intervalle_statistiques)
+        self._verrou = threading.Lock()
+        self._verrou_statistiques = threading.Lock()
+        self._prochain = 0.0
+        self._prochaines_statistiques = 0.0
+        self._stockage_stats = {"nb": None, "octets": None}
+        self.compteurs = {
+            "balayages": 0,
+            "sessions_supprimees": 0,
+            "duree_dernier_balayage": 0.0,
+            "duree_totale_balayages": 0.0,
+        }
+
+    def balayer(self):
+        """Un passage; retourne le nombre de sessions supprimées (0 si un passage est déjà en cours)."""
+        if not self._verrou.acquire(blocking=False):
+            return 0
+        try:
+            # Prochain passage fixé d'avance: un stockage en erreur n'est pas réessayé à chaque requête
+            self._prochain = time.monotonic() + self.intervalle
+            debut = time.perf_counter()
+            supprimees = self.stockage.purger(self.taille_lot)
+            duree = time.perf_counter() - debut
+            self.compteurs["balayages"] += 1
+            self.compteurs["sessions_supprimees"] += supprimees
+            self.compteurs["duree_dernier_balayage"] = duree
+            self.compteurs["duree_totale_balayages"] += duree
+            if supprimees >= self.taille_lot:
+                # Lot plein: il en reste probablement, repasser bientôt
+                self._prochain = time.monotonic() + 1.0
+            return supprimees
+        finally:
+            self._verrou.release()
+
+    def est_du(self):
+        return time.monotonic() >= self._prochain
+
+    def boucler(self):
+        """Boucle du thread de la minuterie."""
+        while True:
+            try:
+                self.balayer()
+            except Exception:
+                journal.exception("Purge des sessions expirées en échec")
+            time.sleep(max(0.0, self._prochain - time.monotonic()))
+
+    def statistiques(self):
+        self._rafraichir_statistiques_stockage()
+        return {**self.compteurs, "sessions": self._stockage_stats["nb"], "octets": self._stockage_stats["octets"]}
+
+    def _rafraichir_statistiques_stockage(self):
+        # Sans attendre: pendant un calcul en cours, les valeurs précédentes suffisent
+        if time.monotonic() < self._prochaines_statistiques or not self._verrou_statistiques.acquire(blocking=False):
+            return
+        try:
+            self._prochaines_statistiques = time.monotonic() + self.intervalle_statistiques
+            self._stockage_stats = self.stockage.statistiques()
+        except Exception:
+            journal.exception("Statistiques des sessions indisponibles")
+        finally:
+            self._verrou_statistiques.release()
+
+
+_balayeur = None
+
+
+def statistiques_balayage():
+    """Statistiques du balayeur du processus (None si la purge n'est pas active)."""
+    return _balayeur.statistiques() if _balayeur is not None else None
+
+
+def activer_balayage_sessions(app, stockage, mode="requetes", taille_lot=200, intervalle=60.0):
+    """
+    Purger les sessions expirées de `stockage`:
+    - mode "requetes": un lot après l'envoi d'une réponse, quand un passage est dû;
+    - mode "minuterie": thread dédié, démarré à la première requête du processus
+      (après le fork des workers).
+    """
+    global _balayeur
+    balayeur = _balayeur = BalayeurSessions(stockage, taille_lot, intervalle)
+
+    if mode == "minuterie":
+        etat = {"pid": None}
+
+        @app.before_request
+        def _demarrer_minuterie():
+            if etat["pid"] != os.getpid():
+                etat["pid"] = os.getpid()
+                threading.Thread(target=balayeur.boucler, name="balayeur-sessions", daemon=True).start()
+        return balayeur
+
+    @app.after_request
+    def _balayer_apres_reponse(reponse):
+        if balayeur.est_du():
+            # Après l'envoi de la réponse: le visiteur n'attend pas la purge
+            reponse.call_on_close(_balayer)
+        return reponse
+
+    def _balayer():
+        try:
+            balayeur.balayer()
+        except Exception:
+            journal.exception("Purge des sessions expirées en échec")
+    return balayeur